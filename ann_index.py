@@ -0,0 +1,248 @@
+"""
+ایندکس تقریبی نزدیک‌ترین همسایه (IVF) برای کتابخانه‌های بسیار بزرگ
+
+بردارها با k-means کروی به چند لیست معکوس تقسیم می‌شوند. هنگام جستجو فقط
+`nprobe` لیستی که مرکزشان به کوئری نزدیک‌تر است بررسی می‌شوند و سپس شباهت
+ترکیبی دقیق برای همین فهرست کوتاه محاسبه می‌شود. با افزایش nprobe دقت (recall)
+بیشتر و جستجو کندتر می‌شود.
+
+نسخه لاگ تغییرات دیتابیس هنگام ساخت در فایل ایندکس ذخیره می‌شود تا آهنگ‌هایی که
+پس از آن تغییر کرده‌اند (و لیست معکوسشان دیگر معتبر نیست) همیشه دقیق بررسی شوند.
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+
+from config import DATABASE_PATH
+
+
+def default_ann_path():
+    """مسیر پیش‌فرض فایل ایندکس تقریبی: کنار فایل دیتابیس SQLite"""
+    prefix = 'sqlite:///'
+    if DATABASE_PATH.startswith(prefix):
+        return os.path.splitext(DATABASE_PATH[len(prefix):])[0] + '.ann.npz'
+    return 'fingerprints.ann.npz'
+
+
+def _assign(matrix, centroids, chunk_size=65536):
+    """تعیین نزدیک‌ترین مرکز (بیشترین ضرب داخلی) برای هر سطر به صورت تکه‌تکه"""
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), chunk_size):
+        block = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        labels[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """ایندکس لیست‌های معکوس با کوانتیزه‌سازی درشت (coarse quantizer)"""
+
+    def __init__(self, centroids, ids, order, offsets, library_version=None):
+        self.centroids = centroids
+        self.ids = ids
+        self.order = order
+        self.offsets = offsets
+        # نسخه لاگ تغییرات دیتابیس هنگام ساخت (None برای فایل‌های قدیمی)
+        self.library_version = library_version
+
+    @property
+    def n_lists(self):
+        """تعداد لیست‌های معکوس"""
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix, ids, n_lists=None, n_iter=10, train_size=50000, seed=0, library_version=None):
+        """ساخت ایندکس از ماتریس نرمال‌شده اثر انگشت‌ها
+
+        Args:
+            matrix: ماتریس سطرهای نرمال‌شده (می‌تواند memmap باشد)
+            ids: شناسه آهنگ هر سطر
+            n_lists: تعداد لیست‌ها (پیش‌فرض: حدود 4·sqrt(N))
+            n_iter: تعداد تکرارهای k-means
+            train_size: حداکثر تعداد سطرهای نمونه برای آموزش مراکز
+            seed: بذر تولید اعداد تصادفی
+            library_version: نسخه لاگ تغییرات دیتابیس که ماتریس با آن ساخته شده
+
+        Returns:
+            نمونه IVFIndex
+        """
+        n_rows = len(matrix)
+        if n_rows == 0:
+            raise ValueError("ماتریس خالی است")
+        n_lists = n_lists or max(1, int(4 * np.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+        rng = np.random.default_rng(seed)
+
+        sample_rows = np.sort(rng.choice(n_rows, size=min(train_size, n_rows), replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+        # k-means کروی روی نمونه
+        for _ in range(n_iter):
+            labels = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            order = np.argsort(labels, kind='stable')
+            present, starts = np.unique(labels[order], return_index=True)
+            sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            sums[~empty] /= norms[~empty, np.newaxis]
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = sums
+
+        labels = _assign(matrix, centroids)
+        order = np.argsort(labels, kind='stable').astype(np.int64)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+
+        return cls(centroids.astype(np.float32), np.asarray(ids, dtype=np.int64)[order], order, offsets,
+                   library_version)
+
+    def candidates(self, query, nprobe):
+        """شناسه آهنگ‌های موجود در نزدیک‌ترین لیست‌ها به کوئری
+
+        Args:
+            query: بردار نرمال‌شده کوئری
+            nprobe: تعداد لیست‌هایی که بررسی می‌شوند
+
+        Returns:
+            آرایه شناسه آهنگ‌های کاندید
+        """
+        nprobe = min(max(1, nprobe), self.n_lists)
+        scores = self.centroids @ np.asarray(query, dtype=np.float32)
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe] if nprobe < self.n_lists else np.arange(self.n_lists)
+        return np.concatenate([self.ids[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+
+    def save(self, path):
+        """ذخیره ایندکس در فایل .npz"""
+        extra = {'library_version': self.library_version} if self.library_version is not None else {}
+        np.savez(path, centroids=self.centroids, ids=self.ids, order=self.order, offsets=self.offsets, **extra)
+
+    @classmethod
+    def load(cls, path):
+        """بارگذاری ایندکس از فایل .npz"""
+        with np.load(path) as data:
+            library_version = int(data['library_version']) if 'library_version' in data else None
+            return cls(data['centroids'], data['ids'], data['order'], data['offsets'], library_version)
+
+
+def changes_since_build(ann):
+    """شناسه آهنگ‌هایی که پس از ساخت ایندکس تقریبی در دیتابیس تغییر کرده‌اند
+
+    Returns:
+        مجموعه شناسه‌ها، یا None اگر معلوم نباشد (فایل قدیمی بدون نسخه یا لاگ هرس شده)
+    """
+    from database import get_changes
+
+    if ann.library_version is None:
+        return None
+    _, song_ids = get_changes(ann.library_version)
+    return song_ids
+
+
+def build_ann_index(path=None, n_lists=None):
+    """ساخت ایندکس تقریبی از اثر انگشت‌های دیتابیس و ذخیره آن کنار دیتابیس
+
+    Args:
+        path: مسیر فایل خروجی (پیش‌فرض: default_ann_path)
+        n_lists: تعداد لیست‌های معکوس
+
+    Returns:
+        مسیر فایل ذخیره شده یا None اگر دیتابیس خالی باشد
+    """
+    from fingerprint_index import FingerprintIndex
+    from reduction import configure_index
+
+    # مراکز در همان فضای (کاهش یافته) ایندکس ربات ساخته می‌شوند
+    index = FingerprintIndex()
+    configure_index(index)
+    if index.reload() == 0:
+        print("هیچ اثر انگشتی برای ساخت ایندکس تقریبی وجود ندارد")
+        return None
+
+    path = path or default_ann_path()
+    start = time.perf_counter()
+    data = index.snapshot()
+    ann = IVFIndex.build(data['matrix'], data['ids'], n_lists=n_lists, library_version=index.library_version)
+    ann.save(path)
+    print(f"ایندکس تقریبی با {ann.n_lists} لیست برای {len(index)} آهنگ در "
+          f"{time.perf_counter() - start:.1f} ثانیه ساخته و در '{path}' ذخیره شد")
+    return path
+
+
+def _synthetic_library(n_songs, dimension, n_clusters, rng):
+    """ساخت کتابخانه مصنوعی خوشه‌ای از بردارهای نرمال‌شده"""
+    centers = rng.normal(size=(n_clusters, dimension)).astype(np.float32)
+    matrix = np.empty((n_songs, dimension), dtype=np.float32)
+    for start in range(0, n_songs, 65536):
+        end = min(start + 65536, n_songs)
+        labels = rng.integers(n_clusters, size=end - start)
+        matrix[start:end] = centers[labels] + rng.normal(scale=0.8, size=(end - start, dimension))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def recall_latency_report(n_songs=100000, dimension=1444, n_queries=200, top_k=10,
+                          nprobes=(1, 2, 4, 8, 16, 32, 64), seed=0):
+    """گزارش دقت (recall@k) در برابر تأخیر جستجو روی کتابخانه مصنوعی
+
+    Returns:
+        لیست دیکشنری‌های نتیجه برای جستجوی دقیق و هر مقدار nprobe
+    """
+    from fingerprint_index import FingerprintIndex
+
+    rng = np.random.default_rng(seed)
+    print(f"ساخت کتابخانه مصنوعی با {n_songs} آهنگ و {dimension} بعد...")
+    matrix = _synthetic_library(n_songs, dimension, max(10, n_songs // 1000), rng)
+    ids = np.arange(1, n_songs + 1)
+
+    index = FingerprintIndex()
+    index.load_arrays(ids, [''] * n_songs, [''] * n_songs, matrix, normalized=True)
+
+    start = time.perf_counter()
+    ann = IVFIndex.build(matrix, ids)
+    print(f"ساخت ایندکس تقریبی ({ann.n_lists} لیست): {time.perf_counter() - start:.1f} ثانیه")
+    index.attach_ann(ann)
+
+    # کوئری‌ها: نسخه نویزی از آهنگ‌های کتابخانه
+    picks = rng.choice(n_songs, size=n_queries, replace=False)
+    queries = matrix[picks] + rng.normal(scale=0.02, size=(n_queries, dimension)).astype(np.float32)
+
+    def run(nprobe):
+        results = []
+        start = time.perf_counter()
+        for query in queries:
+            results.append([r['id'] for r in index.search(query, threshold=-np.inf, top_k=top_k, nprobe=nprobe)])
+        return results, (time.perf_counter() - start) / n_queries * 1000
+
+    exact, exact_ms = run(None)
+    report = [{'nprobe': 0, 'recall': 1.0, 'latency_ms': exact_ms}]
+    print(f"\n{'nprobe':>8} {'recall@' + str(top_k):>10} {'ms/query':>10}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_ms:>10.2f}")
+
+    for nprobe in nprobes:
+        if nprobe > ann.n_lists:
+            break
+        approx, ms = run(nprobe)
+        recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact)])
+        report.append({'nprobe': nprobe, 'recall': float(recall), 'latency_ms': ms})
+        print(f"{nprobe:>8} {recall:>10.3f} {ms:>10.2f}")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ایندکس تقریبی نزدیک‌ترین همسایه برای اثر انگشت‌ها')
+    parser.add_argument('--build', action='store_true', help='ساخت ایندکس از دیتابیس')
+    parser.add_argument('--lists', type=int, default=None, help='تعداد لیست‌های معکوس')
+    parser.add_argument('--output', type=str, default=None, help='مسیر فایل ایندکس')
+    parser.add_argument('--report', action='store_true', help='گزارش دقت در برابر تأخیر روی کتابخانه مصنوعی')
+    parser.add_argument('--songs', type=int, default=100000, help='تعداد آهنگ‌های کتابخانه مصنوعی')
+    parser.add_argument('--queries', type=int, default=200, help='تعداد کوئری‌های گزارش')
+    args = parser.parse_args()
+
+    if args.build:
+        build_ann_index(args.output, args.lists)
+    if args.report:
+        recall_latency_report(args.songs, n_queries=args.queries)
@@ -0,0 +1,220 @@
+"""
+لایه رمزگشایی صوت برای تحلیل: خواندن یک پنجره زمانی با seek، میکس به مونو در یک
+بافر float32 از پیش تخصیص یافته و تغییر نرخ نمونه‌برداری با کیفیت قابل انتخاب
+
+فرمت‌هایی که libsndfile پشتیبانی می‌کند (WAV، FLAC، OGG و در نسخه‌های جدید MP3)
+مستقیماً با soundfile خوانده می‌شوند. فرمت‌های دیگر (مثلاً M4A) در صورت وجود
+ffmpeg مستقیماً با نرخ تحلیل و از نقطه شروع پنجره رمزگشایی می‌شوند و در غیر این
+صورت librosa.load استفاده می‌شود.
+
+ورودی می‌تواند بایت‌های فایل در حافظه هم باشد (مثلاً فایل دریافتی از تلگرام)؛ در
+این حالت فقط فرمت‌هایی که soundfile نمی‌شناسد در یک فایل موقت نوشته می‌شوند.
+"""
+
+import io
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+import soundfile as sf
+import librosa
+
+from config import SAMPLE_RATE, DURATION, RESAMPLE_TYPE
+
+# تعداد فریم‌هایی که در هر مرحله از فایل خوانده و به مونو تبدیل می‌شوند
+BLOCK_FRAMES = 65536
+
+
+def _decode_soundfile(file_path, sr, offset, duration, res_type):
+    """رمزگشایی با soundfile: seek به ابتدای پنجره و خواندن بلوکی در بافر مونو"""
+    with sf.SoundFile(file_path) as f:
+        native_sr = f.samplerate
+        start = int(offset * native_sr) if offset else 0
+        available = max(f.frames - start, 0)
+        frames = available if duration is None else min(available, int(duration * native_sr))
+        if start:
+            f.seek(start)
+
+        signal = np.empty(frames, dtype=np.float32)
+        block = np.empty((min(BLOCK_FRAMES, max(frames, 1)), f.channels), dtype=np.float32)
+        position = 0
+        while position < frames:
+            count = len(f.read(frames=min(len(block), frames - position), dtype='float32', out=block))
+            if count == 0:
+                break
+            if f.channels == 1:
+                signal[position:position + count] = block[:count, 0]
+            else:
+                np.mean(block[:count], axis=1, out=signal[position:position + count])
+            position += count
+        signal = signal[:position]
+
+    if native_sr != sr:
+        signal = librosa.resample(signal, orig_sr=native_sr, target_sr=sr, res_type=res_type)
+    return signal, sr
+
+
+def _decode_ffmpeg(file_path, sr, offset, duration):
+    """رمزگشایی با ffmpeg مستقیماً با نرخ تحلیل و seek پیش از رمزگشایی"""
+    command = ['ffmpeg', '-nostdin', '-v', 'error']
+    if offset:
+        command += ['-ss', str(offset)]
+    if duration is not None:
+        command += ['-t', str(duration)]
+    command += ['-i', file_path, '-vn', '-ac', '1', '-ar', str(int(sr)), '-f', 'f32le', '-']
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if duration is not None:
+        # خواندن مستقیم خروجی در بافر از پیش تخصیص یافته
+        signal = np.empty(int(duration * sr) + 1, dtype=np.float32)
+        view = memoryview(signal).cast('B')
+        received = 0
+        while received < len(view):
+            count = process.stdout.readinto(view[received:])
+            if not count:
+                break
+            received += count
+        process.stdout.read()
+        signal = signal[:received // 4]
+    else:
+        signal = np.frombuffer(process.stdout.read(), dtype='<f4').copy()
+
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(stderr.decode('utf-8', 'replace').strip() or 'ffmpeg failed')
+    return signal, sr
+
+
+@contextmanager
+def _temporary_file(data, suffix=None):
+    """نوشتن بایت‌ها در یک فایل موقت که در هر حالت (حتی با خطا) پاک می‌شود"""
+    fd, path = tempfile.mkstemp(suffix=suffix or '')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def decode_audio(file_path, sr=SAMPLE_RATE, offset=0.0, duration=DURATION, res_type=RESAMPLE_TYPE, suffix=None):
+    """رمزگشایی یک پنجره از فایل صوتی به سیگنال مونو float32 با نرخ تحلیل
+
+    Args:
+        file_path: مسیر فایل صوتی یا بایت‌های آن
+        sr: نرخ نمونه‌برداری خروجی
+        offset: زمان شروع پنجره (ثانیه)
+        duration: طول پنجره (ثانیه؛ None یعنی تا پایان فایل)
+        res_type: نوع تغییر نرخ نمونه‌برداری librosa (مثلاً soxr_hq، soxr_mq یا soxr_lq)
+        suffix: پسوند فایل ورودی بایتی (برای فایل موقت فرمت‌هایی که soundfile نمی‌شناسد)
+
+    Returns:
+        آرایه یک‌بعدی float32 و نرخ نمونه‌برداری
+    """
+    if isinstance(file_path, (bytes, bytearray, memoryview)):
+        try:
+            return _decode_soundfile(io.BytesIO(file_path), sr, offset, duration, res_type)
+        except (sf.LibsndfileError, RuntimeError):
+            pass
+        # ffmpeg و librosa برای فرمت‌هایی مثل M4A به فایل قابل seek روی دیسک نیاز دارند
+        with _temporary_file(file_path, suffix) as path:
+            return decode_audio(path, sr, offset, duration, res_type)
+
+    try:
+        return _decode_soundfile(file_path, sr, offset, duration, res_type)
+    except (sf.LibsndfileError, RuntimeError):
+        # فرمتی که libsndfile پشتیبانی نمی‌کند
+        pass
+
+    if shutil.which('ffmpeg'):
+        return _decode_ffmpeg(file_path, sr, offset, duration)
+
+    signal, sr = librosa.load(file_path, sr=sr, offset=offset, duration=duration, mono=True, res_type=res_type)
+    return signal.astype(np.float32, copy=False), sr
+
+
+def _write_test_files(directory, seconds=60, sr=44100):
+    """ساخت فایل‌های آزمایشی استریو در فرمت‌های مختلف"""
+    t = np.arange(int(seconds * sr)) / sr
+    rng = np.random.default_rng(0)
+    left = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(len(t))
+    right = 0.3 * np.sin(2 * np.pi * 330 * t) + 0.05 * rng.standard_normal(len(t))
+    stereo = np.stack([left, right], axis=1).astype(np.float32)
+
+    paths = []
+    for extension, options in [('wav', {}), ('flac', {}), ('ogg', {'subtype': 'VORBIS'}), ('mp3', {'subtype': 'MPEG_LAYER_III'})]:
+        path = os.path.join(directory, f'benchmark.{extension}')
+        try:
+            # نوشتن بلوکی؛ برخی کدک‌های libsndfile با یک نوشتن بزرگ از کار می‌افتند
+            with sf.SoundFile(path, 'w', sr, channels=2, **options) as f:
+                for start in range(0, len(stereo), BLOCK_FRAMES):
+                    f.write(stereo[start:start + BLOCK_FRAMES])
+            paths.append(path)
+        except (sf.LibsndfileError, ValueError, TypeError) as e:
+            print(f"ساخت فایل {extension} ممکن نبود: {str(e)}")
+
+    if shutil.which('ffmpeg') and paths:
+        path = os.path.join(directory, 'benchmark.m4a')
+        result = subprocess.run(['ffmpeg', '-nostdin', '-v', 'error', '-y', '-i', paths[0], '-c:a', 'aac', path])
+        if result.returncode == 0:
+            paths.append(path)
+    else:
+        print("ffmpeg پیدا نشد؛ فرمت M4A بررسی نمی‌شود")
+    return paths
+
+
+def _time(func, repeat):
+    """بهترین زمان اجرای یک تابع در چند تکرار (ثانیه)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(paths, sr=SAMPLE_RATE, duration=DURATION, offset=30.0, repeat=3,
+              res_types=('soxr_hq', 'soxr_mq', 'soxr_lq')):
+    """مقایسه زمان رمزگشایی هر فرمت با مسیر فعلی (librosa.load)
+
+    ستون memory زمان رمزگشایی از بایت‌های فایل در حافظه (مسیر ربات) است.
+
+    Returns:
+        لیست دیکشنری‌های نتیجه برای هر فایل
+    """
+    report = []
+    print(f"{'file':<20} {'librosa':>9} " + ' '.join(f'{r:>9}' for r in res_types) + f" {'offset':>9} {'memory':>9}")
+    for path in paths:
+        row = {'file': os.path.basename(path)}
+        row['librosa'] = _time(lambda: librosa.load(path, sr=sr, duration=duration, mono=True), repeat)
+        for res_type in res_types:
+            row[res_type] = _time(lambda: decode_audio(path, sr, 0.0, duration, res_type), repeat)
+        row['offset'] = _time(lambda: decode_audio(path, sr, offset, duration), repeat)
+        with open(path, 'rb') as f:
+            data = f.read()
+        row['memory'] = _time(lambda: decode_audio(data, sr, 0.0, duration, suffix=os.path.splitext(path)[1]), repeat)
+        report.append(row)
+        print(f"{row['file']:<20} {row['librosa']:>9.3f} "
+              + ' '.join(f'{row[r]:>9.3f}' for r in res_types) + f" {row['offset']:>9.3f} {row['memory']:>9.3f}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='بنچمارک رمزگشایی صوت در فرمت‌های مختلف')
+    parser.add_argument('files', nargs='*', help='فایل‌های صوتی (پیش‌فرض: فایل‌های آزمایشی ساخته شده)')
+    parser.add_argument('--sr', type=int, default=SAMPLE_RATE, help='نرخ نمونه‌برداری تحلیل')
+    parser.add_argument('--repeat', type=int, default=3, help='تعداد تکرار هر اندازه‌گیری')
+    args = parser.parse_args()
+
+    if args.files:
+        benchmark(args.files, sr=args.sr, repeat=args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            benchmark(_write_test_files(directory), sr=args.sr, repeat=args.repeat)
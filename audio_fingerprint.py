@@ -1,40 +1,166 @@
 import os
+import time
+from contextlib import contextmanager
 import numpy as np
 import librosa
 import soundfile as sf
-from sklearn.metrics.pairwise import cosine_similarity
-import matplotlib.pyplot as plt
 
-from config import SAMPLE_RATE, DURATION, HOP_LENGTH, N_FFT, N_MELS
+from config import SAMPLE_RATE, DURATION, HOP_LENGTH, N_FFT, N_MELS, FEATURE_GROUPS
+from feature_groups import REGISTRY
+from fingerprint_index import FingerprintIndex
+from audio_decode import decode_audio
 
-def load_audio(file_path, sr=SAMPLE_RATE, duration=DURATION):
+def load_audio(file_path, sr=SAMPLE_RATE, duration=DURATION, offset=0.0, suffix=None):
     """بارگذاری فایل صوتی و تبدیل به آرایه یک‌بعدی
     
     Args:
-        file_path: مسیر فایل صوتی
+        file_path: مسیر فایل صوتی یا بایت‌های آن
         sr: نرخ نمونه‌برداری
         duration: مدت زمان مورد نظر (ثانیه)
+        offset: زمان شروع (ثانیه)
+        suffix: پسوند فایل ورودی بایتی (مثلاً '.m4a')
         
     Returns:
         آرایه یک‌بعدی از داده‌های صوتی و نرخ نمونه‌برداری واقعی
     """
     try:
-        # بارگذاری فایل صوتی با librosa
-        signal, sr = librosa.load(file_path, sr=sr, duration=duration, mono=True)
+        # رمزگشایی پنجره مورد نظر با نرخ تحلیل
+        signal, sr = decode_audio(file_path, sr=sr, offset=offset, duration=duration, suffix=suffix)
         return signal, sr
     except Exception as e:
-        print(f"خطا در بارگذاری فایل '{file_path}': {str(e)}")
+        name = file_path if isinstance(file_path, str) else f'{len(file_path)} بایت{suffix or ""}'
+        print(f"خطا در بارگذاری فایل '{name}': {str(e)}")
         return None, None
 
-def extract_features(signal, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS):
+@contextmanager
+def _stage(timings, name):
+    """ثبت زمان اجرای یک مرحله در دیکشنری timings (در صورت وجود)"""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+class _SharedSpectra:
+    """میانی‌های طیفی مشترک که فقط یک بار و در صورت نیاز محاسبه می‌شوند"""
+    
+    def __init__(self, signal, sr, n_fft, hop_length, timings):
+        self.signal = signal
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.timings = timings
+        self._magnitude = None
+        self._power = None
+    
+    @property
+    def magnitude(self):
+        """دامنه STFT (ورودی spectral_contrast، rolloff و bandwidth)"""
+        if self._magnitude is None:
+            with _stage(self.timings, 'stft'):
+                self._magnitude = np.abs(librosa.stft(self.signal, n_fft=self.n_fft, hop_length=self.hop_length))
+        return self._magnitude
+    
+    @property
+    def power(self):
+        """توان STFT (ورودی طیف‌نگارهای mel)"""
+        if self._power is None:
+            magnitude = self.magnitude
+            with _stage(self.timings, 'stft'):
+                self._power = magnitude ** 2
+        return self._power
+
+def _mfcc_group(spectra, n_mels):
+    """MFCC به همراه مشتق اول و دوم (از طیف‌نگار mel با 128 فیلتر پیش‌فرض librosa)"""
+    mel_128 = librosa.feature.melspectrogram(S=spectra.power, sr=spectra.sr, n_fft=spectra.n_fft)
+    mfccs = librosa.feature.mfcc(S=librosa.power_to_db(mel_128), sr=spectra.sr, n_mfcc=20)
+    return [mfccs, librosa.feature.delta(mfccs), librosa.feature.delta(mfccs, order=2)]
+
+def _chroma_group(spectra, n_mels):
+    """کروماگرام CQT (مستقل از STFT)"""
+    return [librosa.feature.chroma_cqt(y=spectra.signal, sr=spectra.sr, hop_length=spectra.hop_length)]
+
+def _contrast_group(spectra, n_mels):
+    """Spectral contrast از دامنه STFT مشترک"""
+    return [librosa.feature.spectral_contrast(S=spectra.magnitude, sr=spectra.sr, n_fft=spectra.n_fft)]
+
+def _mel_group(spectra, n_mels):
+    """طیف‌نگار mel با وضوح بالا (دسی‌بل نسبت به بیشینه)"""
+    mel_spec = librosa.feature.melspectrogram(S=spectra.power, sr=spectra.sr, n_fft=spectra.n_fft, n_mels=n_mels)
+    return [librosa.power_to_db(mel_spec, ref=np.max)]
+
+def _zcr_group(spectra, n_mels):
+    """Zero Crossing Rate با قاب‌بندی پیش‌فرض librosa"""
+    return [librosa.feature.zero_crossing_rate(spectra.signal)]
+
+def _rolloff_group(spectra, n_mels):
+    """Spectral rolloff از دامنه STFT مشترک"""
+    return [librosa.feature.spectral_rolloff(S=spectra.magnitude, sr=spectra.sr, n_fft=spectra.n_fft)]
+
+def _bandwidth_group(spectra, n_mels):
+    """Spectral bandwidth از دامنه STFT مشترک"""
+    return [librosa.feature.spectral_bandwidth(S=spectra.magnitude, sr=spectra.sr, n_fft=spectra.n_fft)]
+
+def _tempogram_group(spectra, n_mels):
+    """Tempogram (پوش onset با FFT پیش‌فرض 2048 و مستقل از STFT مشترک)"""
+    return [librosa.feature.tempogram(y=spectra.signal, sr=spectra.sr, hop_length=spectra.hop_length)]
+
+# تابع استخراج هر گروه ثبت شده در feature_groups
+GROUP_EXTRACTORS = {
+    'mfcc': _mfcc_group,
+    'chroma': _chroma_group,
+    'contrast': _contrast_group,
+    'mel': _mel_group,
+    'zcr': _zcr_group,
+    'rolloff': _rolloff_group,
+    'bandwidth': _bandwidth_group,
+    'tempogram': _tempogram_group,
+}
+
+# گروه‌هایی که از STFT مشترک استفاده می‌کنند
+STFT_GROUPS = {group.name for group in REGISTRY if group.stft}
+
+def preprocess_signal(signal, timings=None):
+    """پیش‌پردازش مشترک همه گروه‌های ویژگی: نرمال‌سازی و کاهش نویز
+    
+    Args:
+        signal: آرایه یک‌بعدی سیگنال صوتی
+        timings: دیکشنری اختیاری زمان هر مرحله
+        
+    Returns:
+        سیگنال پیش‌پردازش شده
+    """
+    # پیش‌پردازش: نرمال‌سازی سیگنال
+    with _stage(timings, 'normalize'):
+        signal = librosa.util.normalize(signal)
+    
+    # کاهش نویز با فیلتر مدین
+    with _stage(timings, 'denoise'):
+        signal = librosa.decompose.nn_filter(signal, aggregate=np.median, metric='cosine')
+    return signal
+
+def extract_features(signal, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS, timings=None,
+                     groups=None, preprocessed=False):
     """استخراج ویژگی‌های صوتی از سیگنال با ویژگی‌های بیشتر و پایدارتر
     
+    STFT فقط یک بار محاسبه می‌شود و MFCC، طیف‌نگار mel، spectral contrast،
+    rolloff و bandwidth همگی از همان دامنه/توان مشترک به دست می‌آیند. خروجی
+    همه گروه‌ها از نظر عددی با پیاده‌سازی مرجع test_audio.extract_features_reference
+    یکسان است.
+    
     Args:
         signal: آرایه یک‌بعدی سیگنال صوتی
         sr: نرخ نمونه‌برداری
         n_fft: اندازه FFT
         hop_length: طول پرش
         n_mels: تعداد فیلترهای mel
+        timings: دیکشنری اختیاری که زمان اجرای هر مرحله (ثانیه) در آن ثبت می‌شود
+        groups: نام گروه‌هایی که استخراج می‌شوند (None یعنی گروه‌های فعال FEATURE_GROUPS)؛
+            خروجی ستون‌های این گروه‌ها به ترتیب feature_groups.REGISTRY است
+        preprocessed: سیگنال از قبل با preprocess_signal پیش‌پردازش شده است
         
     Returns:
         ویژگی‌های استخراج شده به شکل یک بردار
@@ -42,84 +168,25 @@ def extract_features(signal, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH,
     if signal is None:
         return None
     
-    # پیش‌پردازش: نرمال‌سازی سیگنال
-    signal = librosa.util.normalize(signal)
-    
-    # کاهش نویز با فیلتر مدین
-    signal = librosa.decompose.nn_filter(signal, aggregate=np.median, metric='cosine')
-    
-    # استخراج MFCC (Mel-Frequency Cepstral Coefficients) - افزایش تعداد ضرایب
-    mfccs = librosa.feature.mfcc(y=signal, sr=sr, n_mfcc=20, n_fft=n_fft, hop_length=hop_length)
-    # افزودن مشتق اول و دوم MFCC برای اطلاعات بیشتر
-    mfccs_delta = librosa.feature.delta(mfccs)
-    mfccs_delta2 = librosa.feature.delta(mfccs, order=2)
-    
-    # استخراج کروماگرام (Chromagram) با کیفیت بالاتر
-    chroma = librosa.feature.chroma_cqt(y=signal, sr=sr, hop_length=hop_length)
-    
-    # استخراج spectral contrast
-    contrast = librosa.feature.spectral_contrast(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    
-    # استخراج Mel spectrogram با وضوح بالاتر
-    mel_spec = librosa.feature.melspectrogram(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels)
-    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-    
-    # ویژگی‌های جدید: Zero Crossing Rate برای تشخیص بهتر ریتم
-    zcr = librosa.feature.zero_crossing_rate(signal)
-    
-    # ویژگی‌های جدید: Spectral Rolloff برای تشخیص بهتر طیف فرکانسی
-    rolloff = librosa.feature.spectral_rolloff(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    
-    # ویژگی‌های جدید: Spectral Bandwidth برای تشخیص غنای طیفی
-    bandwidth = librosa.feature.spectral_bandwidth(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    
-    # ویژگی‌های جدید: Tempogram برای تشخیص بهتر ریتم
-    tempo = librosa.feature.tempogram(y=signal, sr=sr, hop_length=hop_length)
-    
-    # استفاده از میانگین و انحراف معیار به جای فقط میانگین
-    mfccs_mean = np.mean(mfccs, axis=1)
-    mfccs_std = np.std(mfccs, axis=1)
-    mfccs_delta_mean = np.mean(mfccs_delta, axis=1)
-    mfccs_delta_std = np.std(mfccs_delta, axis=1)
-    mfccs_delta2_mean = np.mean(mfccs_delta2, axis=1)
-    mfccs_delta2_std = np.std(mfccs_delta2, axis=1)
-    
-    chroma_mean = np.mean(chroma, axis=1)
-    chroma_std = np.std(chroma, axis=1)
-    
-    contrast_mean = np.mean(contrast, axis=1)
-    contrast_std = np.std(contrast, axis=1)
-    
-    mel_mean = np.mean(mel_spec_db, axis=1)
-    mel_std = np.std(mel_spec_db, axis=1)
-    
-    zcr_mean = np.mean(zcr, axis=1)
-    zcr_std = np.std(zcr, axis=1)
-    
-    rolloff_mean = np.mean(rolloff, axis=1)
-    rolloff_std = np.std(rolloff, axis=1)
-    
-    bandwidth_mean = np.mean(bandwidth, axis=1)
-    bandwidth_std = np.std(bandwidth, axis=1)
-    
-    tempo_mean = np.mean(tempo, axis=1)
-    tempo_std = np.std(tempo, axis=1)
-    
-    # ادغام همه ویژگی‌ها
-    features = np.concatenate([
-        mfccs_mean, mfccs_std, 
-        mfccs_delta_mean, mfccs_delta_std,
-        mfccs_delta2_mean, mfccs_delta2_std,
-        chroma_mean, chroma_std,
-        contrast_mean, contrast_std,
-        mel_mean, mel_std,
-        zcr_mean, zcr_std,
-        rolloff_mean, rolloff_std,
-        bandwidth_mean, bandwidth_std,
-        tempo_mean, tempo_std
-    ])
-    
-    return features
+    if not preprocessed:
+        signal = preprocess_signal(signal, timings)
+    groups = FEATURE_GROUPS if groups is None else groups
+    selected = [(group.name, GROUP_EXTRACTORS[group.name]) for group in REGISTRY if group.name in groups]
+    
+    # محاسبه یک‌باره STFT مشترک پیش از گروه‌ها تا زمان آن جدا ثبت شود
+    spectra = _SharedSpectra(signal, sr, n_fft, hop_length, timings)
+    if any(name in STFT_GROUPS for name, _ in selected):
+        spectra.power
+    
+    # استخراج هر گروه و خلاصه‌سازی با میانگین و انحراف معیار هر سطر
+    parts = []
+    for name, extract_group in selected:
+        with _stage(timings, name):
+            for feature in extract_group(spectra, n_mels):
+                parts.append(np.mean(feature, axis=1))
+                parts.append(np.std(feature, axis=1))
+    
+    return np.concatenate(parts)
 
 def generate_fingerprint(file_path):
     """تولید اثر انگشت صوتی برای یک فایل
@@ -137,50 +204,27 @@ def generate_fingerprint(file_path):
     features = extract_features(signal, sr)
     return features
 
-def compare_fingerprints(demo_fingerprint, db_fingerprints, threshold=0.65):
+def compare_fingerprints(demo_fingerprint, db_fingerprints, threshold=0.65, nprobe=None):
     """مقایسه اثر انگشت صوتی دمو با اثر انگشت‌های موجود در دیتابیس با روش‌های پیشرفته‌تر
     
     Args:
         demo_fingerprint: اثر انگشت صوتی دمو
-        db_fingerprints: لیست دیکشنری‌هایی که شامل اثر انگشت‌های صوتی دیتابیس و اطلاعات آنهاست
+        db_fingerprints: لیست دیکشنری‌هایی که شامل اثر انگشت‌های صوتی دیتابیس و اطلاعات آنهاست،
+            یا یک FingerprintIndex آماده
         threshold: آستانه شباهت (بین 0 تا 1) - کاهش یافته برای افزایش حساسیت
+        nprobe: تعداد لیست‌های ایندکس تقریبی برای جستجو (فقط برای FingerprintIndex دارای ایندکس تقریبی)
         
     Returns:
         لیست آهنگ‌های پیدا شده به همراه امتیاز شباهت
     """
-    results = []
-    
-    # نرمال‌سازی اثر انگشت دمو برای مقایسه بهتر
-    demo_fingerprint_norm = demo_fingerprint / np.linalg.norm(demo_fingerprint)
-    
-    for item in db_fingerprints:
-        db_fingerprint = item['fingerprint']
-        
-        # نرمال‌سازی اثر انگشت دیتابیس
-        db_fingerprint_norm = db_fingerprint / np.linalg.norm(db_fingerprint)
-        
-        # محاسبه شباهت کسینوسی با دقت بالاتر
-        similarity = cosine_similarity([demo_fingerprint_norm], [db_fingerprint_norm])[0][0]
-        
-        # محاسبه فاصله اقلیدسی نرمال‌شده (معکوس فاصله برای تبدیل به شباهت)
-        euclidean_dist = np.linalg.norm(demo_fingerprint_norm - db_fingerprint_norm)
-        euclidean_similarity = 1 / (1 + euclidean_dist)  # تبدیل به شباهت بین 0 و 1
-        
-        # ترکیب دو معیار برای دقت بیشتر با وزن‌دهی
-        combined_similarity = 0.7 * similarity + 0.3 * euclidean_similarity
-        
-        if combined_similarity >= threshold:
-            results.append({
-                'id': item['id'],
-                'title': item['title'],
-                'artist': item['artist'],
-                'similarity': combined_similarity
-            })
-    
-    # مرتب‌سازی نتایج بر اساس شباهت
-    results = sorted(results, key=lambda x: x['similarity'], reverse=True)
-    
-    return results
+    # حالت ایندکس آماده: بدون ساخت مجدد ماتریس
+    if isinstance(db_fingerprints, FingerprintIndex):
+        return db_fingerprints.search(demo_fingerprint, threshold=threshold, nprobe=nprobe)
+    
+    # ساخت یک ماتریس نرمال‌شده و امتیازدهی همه آهنگ‌ها با یک ضرب ماتریس-بردار
+    index = FingerprintIndex(dtype=np.float64)
+    index.load(db_fingerprints)
+    return index.search(demo_fingerprint, threshold=threshold)
 
 def visualize_audio(file_path, output_path=None):
     """رسم نمودار برای یک فایل صوتی
@@ -189,6 +233,10 @@ def visualize_audio(file_path, output_path=None):
         file_path: مسیر فایل صوتی
         output_path: مسیر ذخیره تصویر خروجی (اختیاری)
     """
+    # matplotlib فقط برای رسم نمودار لازم است و در شروع ربات بارگذاری نمی‌شود
+    import matplotlib.pyplot as plt
+    import librosa.display
+    
     signal, sr = load_audio(file_path)
     if signal is None:
         return
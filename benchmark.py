@@ -0,0 +1,493 @@
+"""
+بنچمارک مسیرهای پرمصرف ربات روی یک کتابخانه مصنوعی تکرارپذیر
+
+زمان‌های load_audio (برای هر فرمت)، extract_features، compare_fingerprints و
+جستجوی ایندکس (از 1 هزار تا 1 میلیون آهنگ)، سرعت ایندکس‌گذاری، سرعت نوشتن
+دیتابیس (درج دسته‌ای در برابر درج تکی قدیمی) و به‌روزرسانی زنده ایندکس
+(بارگذاری کامل در برابر اعمال تغییرات) اندازه‌گیری و
+در یک فایل JSON ذخیره می‌شوند. با --baseline نتایج با یک اجرای قبلی مقایسه و
+کندشدن‌ها گزارش می‌شوند (کد خروج 1).
+
+نمونه:
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json --output current.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import soundfile as sf
+
+from config import SAMPLE_RATE, DURATION, HOP_LENGTH, N_FFT, N_MELS, RESAMPLE_TYPE, FEATURE_VERSION, FEATURE_GROUPS
+from feature_groups import current_layout, layout_width
+
+# نوع سیگنال‌های کتابخانه مصنوعی
+KINDS = ('tone', 'chord', 'noise', 'rhythm')
+
+# فرمت‌هایی که برای بنچمارک رمزگشایی نوشته می‌شوند
+FORMATS = {
+    'wav': {},
+    'flac': {},
+    'ogg': {'subtype': 'VORBIS'},
+    'mp3': {'subtype': 'MPEG_LAYER_III'},
+}
+
+# ابعاد بردار اثر انگشت با گروه‌های ویژگی فعال
+FINGERPRINT_DIM = layout_width(current_layout())
+
+
+def synthetic_signal(kind, seconds, sr, rng):
+    """ساخت یک سیگنال مصنوعی
+
+    Args:
+        kind: نوع سیگنال ('tone'، 'chord'، 'noise' یا 'rhythm')
+        seconds: طول سیگنال (ثانیه)
+        sr: نرخ نمونه‌برداری
+        rng: مولد اعداد تصادفی
+
+    Returns:
+        آرایه float32 با دامنه حداکثر 1
+    """
+    t = np.arange(int(seconds * sr)) / sr
+    if kind == 'tone':
+        signal = np.sin(2 * np.pi * rng.uniform(110, 880) * t)
+    elif kind == 'chord':
+        root = rng.uniform(110, 440)
+        signal = sum(np.sin(2 * np.pi * root * ratio * t) for ratio in (1.0, 1.25, 1.5))
+    elif kind == 'noise':
+        signal = rng.standard_normal(len(t))
+    elif kind == 'rhythm':
+        # ضربه‌های کوتاه با فرکانس ثابت روی یک تمپوی تصادفی
+        beat = 60.0 / rng.uniform(80, 160)
+        envelope = np.exp(-((t % beat) / 0.05))
+        signal = envelope * np.sin(2 * np.pi * rng.uniform(60, 200) * t)
+    else:
+        raise ValueError(f"نوع سیگنال '{kind}' شناخته شده نیست")
+
+    signal = signal + 0.01 * rng.standard_normal(len(t))
+    return (signal / np.max(np.abs(signal))).astype(np.float32)
+
+
+def write_audio(path, signal, sr, block=65536, **options):
+    """نوشتن بلوکی سیگنال در فایل (برخی کدک‌های libsndfile با یک نوشتن بزرگ از کار می‌افتند)"""
+    with sf.SoundFile(path, 'w', sr, channels=1, **options) as f:
+        for start in range(0, len(signal), block):
+            f.write(signal[start:start + block])
+
+
+def write_library(directory, n_files, seconds, sr=SAMPLE_RATE, seed=0, extension='wav'):
+    """ساخت یک کتابخانه مصنوعی تکرارپذیر از فایل‌های صوتی
+
+    Args:
+        directory: پوشه خروجی
+        n_files: تعداد فایل‌ها
+        seconds: طول هر فایل (ثانیه)
+        sr: نرخ نمونه‌برداری
+        seed: بذر تولید اعداد تصادفی
+        extension: فرمت فایل‌ها (یکی از FORMATS)
+
+    Returns:
+        لیست مسیر فایل‌ها
+    """
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(n_files):
+        kind = KINDS[i % len(KINDS)]
+        path = os.path.join(directory, f"Artist {i % 10} - {kind} {i}.{extension}")
+        write_audio(path, synthetic_signal(kind, seconds, sr, rng), sr, **FORMATS[extension])
+        paths.append(path)
+    return paths
+
+
+def synthetic_fingerprints(n_songs, dimension, rng, chunk_size=65536):
+    """ماتریس float32 تصادفی خوشه‌ای به جای اثر انگشت‌های یک کتابخانه بزرگ"""
+    centers = rng.standard_normal((max(10, n_songs // 1000), dimension), dtype=np.float32)
+    matrix = np.empty((n_songs, dimension), dtype=np.float32)
+    for start in range(0, n_songs, chunk_size):
+        end = min(start + chunk_size, n_songs)
+        matrix[start:end] = centers[rng.integers(len(centers), size=end - start)]
+        matrix[start:end] += rng.standard_normal((end - start, dimension), dtype=np.float32)
+    return matrix
+
+
+def _available_memory():
+    """حافظه آزاد سیستم (بایت) یا None اگر قابل تشخیص نباشد"""
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def measure(func, repeat):
+    """اجرای چندباره یک تابع و برگرداندن میانه و کمینه زمان (ثانیه)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'seconds': float(np.median(times)), 'min': float(np.min(times)), 'repeat': repeat}
+
+
+def bench_load_audio(directory, repeat, seed):
+    """زمان load_audio برای یک فایل DURATION ثانیه‌ای در هر فرمت"""
+    from audio_fingerprint import load_audio
+
+    results = {}
+    for extension in FORMATS:
+        try:
+            path, = write_library(directory, 1, DURATION, seed=seed, extension=extension)
+        except (sf.LibsndfileError, ValueError, TypeError) as e:
+            print(f"- فرمت {extension} پشتیبانی نمی‌شود: {str(e)}")
+            continue
+        results[f'load_audio.{extension}'] = measure(lambda: load_audio(path), repeat)
+    return results
+
+
+def bench_extract_features(clip_seconds, repeat, seed):
+    """زمان extract_features برای هر نوع سیگنال مصنوعی"""
+    from audio_fingerprint import extract_features
+
+    rng = np.random.default_rng(seed)
+    results = {}
+    for kind in KINDS:
+        signal = synthetic_signal(kind, clip_seconds, SAMPLE_RATE, rng)
+        results[f'extract_features.{kind}'] = measure(lambda: extract_features(signal, SAMPLE_RATE), repeat)
+    return results
+
+
+def bench_compare(sizes, repeat, seed, list_limit=10000, n_queries=10):
+    """زمان مقایسه یک اثر انگشت با کتابخانه‌هایی با اندازه‌های مختلف
+
+    برای اندازه‌های کوچک، compare_fingerprints با لیست دیکشنری‌ها (شامل ساخت ماتریس)
+    و برای همه اندازه‌ها جستجو در FingerprintIndex آماده اندازه‌گیری می‌شود.
+    """
+    from audio_fingerprint import compare_fingerprints
+    from fingerprint_index import FingerprintIndex
+
+    results = {}
+    for size in sizes:
+        needed = size * FINGERPRINT_DIM * 4 * 2
+        available = _available_memory()
+        if available is not None and needed > available:
+            print(f"- اندازه {size}: حافظه کافی نیست ({needed / 2**30:.1f} GiB لازم است)، رد شد")
+            continue
+
+        rng = np.random.default_rng(seed)
+        matrix = synthetic_fingerprints(size, FINGERPRINT_DIM, rng)
+        queries = matrix[rng.integers(size, size=n_queries)] + 0.1 * rng.standard_normal(
+            (n_queries, FINGERPRINT_DIM), dtype=np.float32)
+
+        if size <= list_limit:
+            fingerprints = [{'id': i, 'title': '', 'artist': '', 'fingerprint': row} for i, row in enumerate(matrix)]
+            results[f'compare_fingerprints.{size}'] = measure(
+                lambda: compare_fingerprints(queries[0], fingerprints), repeat)
+            del fingerprints
+
+        index = FingerprintIndex()
+        index.load_arrays(np.arange(size), [''] * size, [''] * size, matrix)
+        del matrix
+        search = measure(lambda: [index.search(query, top_k=5) for query in queries], repeat)
+        search['seconds'] /= n_queries
+        search['min'] /= n_queries
+        results[f'index_search.{size}'] = search
+        del index
+    return results
+
+
+def bench_index(directory, n_files, clip_seconds, workers, seed):
+    """سرعت ایندکس‌گذاری: اجرای indexer.py روی یک کتابخانه مصنوعی با دیتابیس موقت
+
+    Returns:
+        زمان به ازای هر فایل (ثانیه)
+    """
+    library = os.path.join(directory, 'library')
+    os.makedirs(library)
+    write_library(library, n_files, clip_seconds, seed=seed)
+
+    env = dict(os.environ)
+    env['DATABASE_PATH'] = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+    env['MUSIC_LIBRARY_PATH'] = library
+    env['FINGERPRINT_MATRIX_PATH'] = ''
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indexer.py'),
+               '--dir', library, '--clear', '--workers', str(workers)]
+
+    start = time.perf_counter()
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    return {f'index_music_library.workers{workers}': {
+        'seconds': elapsed / n_files, 'min': elapsed / n_files, 'repeat': 1, 'files': n_files
+    }}
+
+
+def _db_write_job(n_songs, mode, batch_size, seed):
+    """نوشتن n آهنگ مصنوعی در دیتابیس موقت (در پردازه‌ای با DATABASE_PATH جداگانه)
+
+    حالت 'legacy' مسیر قبلی add_song را بازسازی می‌کند: یک نشست و commit برای هر
+    آهنگ و بررسی تکراری بودن بدون ایندکس (title, artist).
+
+    Returns:
+        زمان کل نوشتن (ثانیه)
+    """
+    import database
+    from fingerprint_store import encode_fingerprint
+    from config import FINGERPRINT_DTYPE
+
+    database.init_db()
+    rng = np.random.default_rng(seed)
+    if mode == 'legacy':
+        with database.engine.begin() as connection:
+            connection.exec_driver_sql("DROP INDEX IF EXISTS ix_songs_title_artist")
+
+    elapsed = 0.0
+    for start in range(0, n_songs, batch_size):
+        count = min(batch_size, n_songs - start)
+        fingerprints = rng.standard_normal((count, FINGERPRINT_DIM), dtype=np.float32)
+        songs = [(f'title {start + i}', f'artist {(start + i) % 997}', f'/music/{start + i}.mp3', fingerprints[i],
+                  {'size': 1000 + i, 'mtime': 0.0, 'hash': f'{start + i:040x}'}) for i in range(count)]
+
+        begin = time.perf_counter()
+        if mode == 'legacy':
+            for title, artist, file_path, fingerprint, file_state in songs:
+                session = database.Session()
+                if not session.query(database.Song).filter_by(title=title, artist=artist).first():
+                    song = database.Song(title=title, artist=artist, file_path=file_path,
+                                         fingerprint=encode_fingerprint(fingerprint, FINGERPRINT_DTYPE, FEATURE_VERSION))
+                    database._apply_file_state(song, file_state)
+                    session.add(song)
+                    session.commit()
+                session.close()
+        else:
+            database.add_songs(songs, verbose=False)
+        elapsed += time.perf_counter() - begin
+    return elapsed
+
+
+def bench_db_write(directory, sizes, batch_size, legacy_limit, seed):
+    """سرعت نوشتن دیتابیس: درج دسته‌ای با WAL در برابر درج تکی قدیمی
+
+    هر اجرا در یک پردازه جداگانه با دیتابیس SQLite موقت انجام می‌شود. درج تکی
+    فقط برای اندازه‌های حداکثر `legacy_limit` اجرا می‌شود (زمان آن با اندازه
+    جدول به صورت درجه دو رشد می‌کند).
+
+    Returns:
+        زمان به ازای هر آهنگ (ثانیه) برای هر حالت و اندازه
+    """
+    results = {}
+    saved_env = {key: os.environ.get(key) for key in ('DATABASE_PATH', 'SQLITE_WAL')}
+    try:
+        for size in sizes:
+            for mode in ('batched', 'legacy'):
+                if mode == 'legacy' and size > legacy_limit:
+                    print(f"  درج تکی برای {size} آهنگ رد شد (بیشتر از {legacy_limit})")
+                    continue
+                path = os.path.join(directory, f'write-{mode}-{size}.db')
+                os.environ['DATABASE_PATH'] = f"sqlite:///{path}"
+                os.environ['SQLITE_WAL'] = '1' if mode == 'batched' else '0'
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    elapsed = pool.submit(_db_write_job, size, mode, batch_size, seed).result()
+                results[f'db_write.{mode}.{size}'] = {
+                    'seconds': elapsed / size, 'min': elapsed / size, 'repeat': 1,
+                    'rows': size, 'rows_per_second': size / elapsed,
+                }
+                print(f"  {mode:<8} {size:>8} آهنگ: {elapsed:8.2f} ثانیه ({size / elapsed:,.0f} آهنگ در ثانیه)")
+    finally:
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return results
+
+
+def _index_sync_job(n_songs, delta, batch_size, seed):
+    """زمان و حافظه بارگذاری کامل ایندکس در برابر اعمال تغییرات (در پردازه‌ای با DATABASE_PATH جداگانه)
+
+    Returns:
+        دیکشنری زمان‌ها (ثانیه) و حجم‌های حافظه (بایت)
+    """
+    import database
+    from fingerprint_index import FingerprintIndex
+
+    database.init_db()
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_songs, batch_size):
+        count = min(batch_size, n_songs - start)
+        fingerprints = rng.standard_normal((count, FINGERPRINT_DIM), dtype=np.float32)
+        database.add_songs([(f'title {start + i}', 'artist', f'/music/{start + i}.mp3', fingerprints[i])
+                            for i in range(count)], verbose=False)
+
+    index = FingerprintIndex()
+    begin = time.perf_counter()
+    index.reload()
+    full_seconds = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    index.sync()
+    poll_seconds = time.perf_counter() - begin
+
+    # افزودن و حذف delta آهنگ، مانند یک دسته ایندکس‌گذاری در حین کار ربات
+    fingerprints = rng.standard_normal((delta, FINGERPRINT_DIM), dtype=np.float32)
+    database.add_songs([(f'new {i}', 'artist', f'/music/new {i}.mp3', fingerprints[i]) for i in range(delta)],
+                       verbose=False)
+    database.delete_songs(index.snapshot()['ids'][:delta].tolist())
+    stats = index.sync()
+    return {'full': full_seconds, 'poll': poll_seconds, 'delta': stats['seconds'],
+            'bytes': stats['bytes'], 'peak_bytes': stats['peak_bytes']}
+
+
+def bench_index_sync(directory, sizes, delta, batch_size, seed):
+    """به‌روزرسانی زنده ایندکس: بارگذاری کامل، بررسی بدون تغییر و اعمال delta آهنگ جدید و حذف شده
+
+    Returns:
+        زمان هر حالت برای هر اندازه؛ حالت delta حجم ایندکس و حجم هر دو نسخه هنگام جایگزینی را هم دارد
+    """
+    results = {}
+    saved_path = os.environ.get('DATABASE_PATH')
+    try:
+        for size in sizes:
+            os.environ['DATABASE_PATH'] = f"sqlite:///{os.path.join(directory, f'sync-{size}.db')}"
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                job = pool.submit(_index_sync_job, size, delta, batch_size, seed).result()
+            for mode in ('full', 'poll', 'delta'):
+                results[f'index_sync.{mode}.{size}'] = {'seconds': job[mode], 'min': job[mode], 'repeat': 1}
+            results[f'index_sync.delta.{size}'].update(delta=delta, bytes=job['bytes'], peak_bytes=job['peak_bytes'])
+            print(f"  {size:>8} آهنگ: بارگذاری کامل {job['full']:.3f}s، بررسی {job['poll'] * 1000:.2f}ms، "
+                  f"{delta} تغییر {job['delta'] * 1000:.1f}ms؛ حافظه هنگام جایگزینی "
+                  f"{job['peak_bytes'] / 2**20:.1f} MiB (ایندکس {job['bytes'] / 2**20:.1f} MiB)")
+    finally:
+        if saved_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = saved_path
+    return results
+
+
+def run_benchmarks(args):
+    """اجرای همه بنچمارک‌های انتخاب شده
+
+    Returns:
+        دیکشنری شامل meta و results
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as directory:
+        if 'load' not in args.skip:
+            print("بنچمارک load_audio...")
+            results.update(bench_load_audio(directory, args.repeat, args.seed))
+        if 'extract' not in args.skip:
+            print(f"بنچمارک extract_features (کلیپ‌های {args.clip_seconds} ثانیه‌ای)...")
+            results.update(bench_extract_features(args.clip_seconds, args.repeat, args.seed))
+        if 'compare' not in args.skip:
+            print(f"بنچمارک مقایسه برای اندازه‌های {args.sizes}...")
+            results.update(bench_compare(args.sizes, args.repeat, args.seed))
+        if 'index' not in args.skip:
+            print(f"بنچمارک ایندکس‌گذاری ({args.index_files} فایل)...")
+            results.update(bench_index(directory, args.index_files, args.clip_seconds, args.workers, args.seed))
+        if 'db' not in args.skip:
+            print(f"بنچمارک نوشتن دیتابیس برای اندازه‌های {args.db_sizes}...")
+            results.update(bench_db_write(directory, args.db_sizes, args.db_batch_size, args.db_legacy_limit, args.seed))
+        if 'sync' not in args.skip:
+            print(f"بنچمارک به‌روزرسانی زنده ایندکس برای اندازه‌های {args.sync_sizes}...")
+            results.update(bench_index_sync(directory, args.sync_sizes, args.sync_delta, args.db_batch_size, args.seed))
+
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'config': {
+                'SAMPLE_RATE': SAMPLE_RATE, 'DURATION': DURATION, 'HOP_LENGTH': HOP_LENGTH,
+                'N_FFT': N_FFT, 'N_MELS': N_MELS, 'RESAMPLE_TYPE': RESAMPLE_TYPE,
+                'FEATURE_VERSION': FEATURE_VERSION, 'FEATURE_GROUPS': FEATURE_GROUPS,
+            },
+            'seed': args.seed,
+            'clip_seconds': args.clip_seconds,
+        },
+        'results': results,
+    }
+
+
+def compare_with_baseline(current, baseline, tolerance):
+    """مقایسه نتایج با یک اجرای پایه
+
+    Args:
+        current: نتایج اجرای فعلی
+        baseline: نتایج اجرای پایه
+        tolerance: حداکثر کندشدن مجاز (0.2 یعنی 20 درصد)
+
+    Returns:
+        لیست نام بنچمارک‌هایی که کندتر شده‌اند
+    """
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<36} {'-':>10} {result['seconds']:>10.4f} {'new':>8}")
+            continue
+        change = result['seconds'] / base['seconds'] - 1 if base['seconds'] > 0 else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  << کندتر'
+        print(f"{name:<36} {base['seconds']:>10.4f} {result['seconds']:>10.4f} {change:>+8.1%}{flag}")
+
+    if baseline.get('meta', {}).get('config') != current['meta']['config']:
+        print("\nتوجه: تنظیمات پردازش صوتی با اجرای پایه یکسان نیست")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='بنچمارک مسیرهای پرمصرف ربات روی کتابخانه مصنوعی')
+    parser.add_argument('--output', type=str, default=None, help='مسیر فایل JSON نتایج')
+    parser.add_argument('--baseline', type=str, default=None, help='فایل JSON اجرای پایه برای مقایسه')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='حداکثر کندشدن مجاز نسبت به اجرای پایه (0.2 یعنی 20 درصد)')
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')],
+                        default=[1000, 10000, 100000, 1000000], help='اندازه‌های کتابخانه برای مقایسه (با کاما)')
+    parser.add_argument('--clip-seconds', type=float, default=0.5,
+                        help='طول کلیپ‌های extract_features و ایندکس‌گذاری (زمان حذف نویز با طول کلیپ به صورت درجه دو رشد می‌کند)')
+    parser.add_argument('--index-files', type=int, default=4, help='تعداد فایل‌های بنچمارک ایندکس‌گذاری')
+    parser.add_argument('--workers', type=int, default=1, help='تعداد پردازه‌های ایندکس‌گذاری')
+    parser.add_argument('--db-sizes', type=lambda s: [int(x) for x in s.split(',')],
+                        default=[10000, 100000], help='تعداد آهنگ‌های بنچمارک نوشتن دیتابیس (با کاما)')
+    parser.add_argument('--db-batch-size', type=int, default=500, help='تعداد آهنگ‌ها در هر دسته درج')
+    parser.add_argument('--db-legacy-limit', type=int, default=10000,
+                        help='حداکثر اندازه‌ای که درج تکی قدیمی برای آن اجرا می‌شود')
+    parser.add_argument('--sync-sizes', type=lambda s: [int(x) for x in s.split(',')],
+                        default=[10000, 100000], help='تعداد آهنگ‌های بنچمارک به‌روزرسانی زنده ایندکس (با کاما)')
+    parser.add_argument('--sync-delta', type=int, default=50,
+                        help='تعداد آهنگ‌های افزوده و حذف شده در بنچمارک به‌روزرسانی زنده')
+    parser.add_argument('--repeat', type=int, default=3, help='تعداد تکرار هر اندازه‌گیری')
+    parser.add_argument('--seed', type=int, default=0, help='بذر کتابخانه مصنوعی')
+    parser.add_argument('--skip', type=lambda s: s.split(','), default=[],
+                        help='بنچمارک‌هایی که اجرا نشوند (load,extract,compare,index,db,sync)')
+    args = parser.parse_args()
+
+    current = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"نتایج در '{args.output}' ذخیره شد")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(current, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} بنچمارک بیش از {args.tolerance:.0%} کندتر شده است")
+            sys.exit(1)
+        print("\nهیچ کندشدنی نسبت به اجرای پایه دیده نشد")
+    else:
+        for name, result in sorted(current['results'].items()):
+            print(f"{name:<36} {result['seconds']:>10.4f} s")
@@ -1,25 +1,131 @@
+import time
+
+# زمان شروع بارگذاری ماژول‌ها برای گزارش زمان راه‌اندازی
+_import_start = time.perf_counter()
+
 import os
+import math
+import asyncio
 import logging
-import tempfile
+from contextlib import contextmanager
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 
-from config import TOKEN, MUSIC_LIBRARY_PATH
-from database import init_db, get_song_by_id, get_fingerprints
-from audio_fingerprint import generate_fingerprint, compare_fingerprints
+from config import (TOKEN, MUSIC_LIBRARY_PATH, SIMILARITY_THRESHOLD, MAX_RESULTS, FINGERPRINT_ENGINE,
+                    FINGERPRINT_MATRIX_PATH, WORKER_PROCESSES, MAX_QUEUED_JOBS, JOB_TIMEOUT,
+                    ANN_NPROBE, ANN_INDEX_PATH, RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_PATH,
+                    METRICS_PORT, METRICS_HOST, ADMIN_USER_IDS, WARM_UP, MAX_JOBS_PER_USER,
+                    USER_RATE_LIMIT, USER_BURST, REDUCTION_ENABLED, INDEX_STORAGE, MAX_UPLOAD_MB,
+                    MAX_UPLOAD_BYTES, CASCADE_SHORTLIST, CASCADE_GROUPS, CASCADE_MIN_SIMILARITY, MATCHER_ADDRESS,
+                    INDEX_SYNC_SECONDS, PROGRESSIVE_WINDOWS, PROGRESSIVE_MARGIN)
+from database import init_db, get_song_by_id, set_telegram_file_id, library_signature
+from fingerprint_index import FingerprintIndex
+from fingerprint_store import matrix_exists
+from ann_index import IVFIndex, default_ann_path, changes_since_build
+from reduction import configure_index
+from cascade import configure_cascade, group_columns, prefilter_query, complete_query
+from feature_groups import layout_signature
+from progressive import window_schedule, window_label, confident, decode_query, window_query
+from matcher_service import MatcherClient, MatcherError
+from worker_pool import WorkerPool, QueueFullError, OwnerLimitError, JobCancelledError, JobTimeoutError
+from rate_limit import RateLimiter
+from result_cache import ResultCache, fingerprint_query, warm_up
+from metrics import Registry, start_http_server
 
 # تنظیم لاگ‌های برنامه
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# مقداردهی اولیه دیتابیس
-init_db()
+# ایندکس مقیم اثر انگشت‌ها (یک بار در شروع ربات بارگذاری می‌شود)
+# ایندکس داخل ربات یا کلاینت سرویس تطبیق مشترک (با همان رابط جستجو)
+fingerprint_index = MatcherClient(MATCHER_ADDRESS, background_health=True) if MATCHER_ADDRESS else FingerprintIndex()
+CASCADE_COLUMNS = group_columns(CASCADE_GROUPS).tolist()
+# امضای گروه‌های ویژگی فعال و نسخه‌هایشان (بخشی از نسل کش نتایج)
+FEATURE_LAYOUT = layout_signature()
+
+# استخر پردازه‌ها برای استخراج اثر انگشت بیرون از حلقه رویداد ربات
+# (کارهای کاربران مختلف به نوبت اجرا می‌شوند و هر کاربر حداکثر MAX_JOBS_PER_USER کار همزمان دارد)
+worker_pool = WorkerPool(workers=WORKER_PROCESSES, max_queue=MAX_QUEUED_JOBS, timeout=JOB_TIMEOUT,
+                         max_per_owner=MAX_JOBS_PER_USER)
+
+# محدودیت نرخ ارسال فایل برای هر کاربر
+rate_limiter = RateLimiter(rate=USER_RATE_LIMIT / 60, burst=USER_BURST)
+
+# درخواست‌های در حال پردازش بر اساس شناسه یکتای فایل تلگرام؛ ارسال‌های همزمان
+# همان فایل منتظر نتیجه درخواست اول می‌مانند
+inflight = {}
+
+# کش نتایج جستجو برای فایل‌های تکراری
+result_cache = ResultCache(max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, path=RESULT_CACHE_PATH or None)
+library_state = {'signature': None}
 
-# چک کردن پوشه کتابخانه موسیقی
-if not os.path.exists(MUSIC_LIBRARY_PATH):
-    os.makedirs(MUSIC_LIBRARY_PATH)
-    logger.info(f"پوشه کتابخانه موسیقی در مسیر {MUSIC_LIBRARY_PATH} ایجاد شد")
+# وضعیت به‌روزرسانی زنده ایندکس داخلی (وظیفه بررسی لاگ تغییرات و حجم آخرین جایگزینی)
+index_sync = {'task': None, 'peak_bytes': 0}
+
+# معیارهای عملکرد ربات (زمان هر مرحله، شمارنده‌ها و وضعیت صف)
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram('bot_stage_seconds', 'زمان هر مرحله پردازش درخواست (ثانیه)')
+REQUESTS = metrics.counter('bot_requests_total', 'تعداد فایل‌های صوتی دریافتی')
+MATCHES = metrics.counter('bot_matches_total', 'درخواست‌ها بر اساس نتیجه جستجو')
+ERRORS = metrics.counter('bot_errors_total', 'خطاها بر اساس نوع')
+COALESCED = metrics.counter('bot_coalesced_total', 'درخواست‌هایی که منتظر پردازش همزمان همان فایل ماندند')
+CASCADE_SKIPPED = metrics.counter('bot_cascade_skipped_total', 'کوئری‌هایی که مرحله دوم تطبیق دو مرحله‌ای برایشان لازم نشد')
+PROGRESSIVE_STEPS = metrics.counter('bot_progressive_window_total', 'کوئری‌های تحلیل تدریجی بر اساس طول پنجره‌ای که برای پاسخ لازم شد')
+metrics.gauge('bot_queue_depth', 'تعداد کارهای منتظر در صف پردازش', lambda: worker_pool.queue_depth)
+metrics.gauge('bot_running_jobs', 'تعداد کارهای در حال اجرا', lambda: worker_pool.running)
+metrics.gauge('bot_index_songs', 'تعداد آهنگ‌های ایندکس', lambda: index_songs(float('nan')))
+if not MATCHER_ADDRESS:
+    metrics.gauge('bot_index_bytes', 'حجم ایندکس در حافظه (بایت)', lambda: fingerprint_index.nbytes)
+    metrics.gauge('bot_index_library_version', 'نسخه لاگ تغییرات دیتابیس که ایندکس با آن همگام است',
+                  lambda: fingerprint_index.library_version or 0)
+    metrics.gauge('bot_index_swap_peak_bytes', 'حجم هر دو نسخه ایندکس هنگام آخرین جایگزینی (بایت)',
+                  lambda: index_sync['peak_bytes'])
+metrics.gauge('bot_result_cache_hits_total', 'تعداد موفقیت‌های کش نتایج', lambda: result_cache.hits, 'counter')
+metrics.gauge('bot_result_cache_misses_total', 'تعداد عدم موفقیت‌های کش نتایج', lambda: result_cache.misses, 'counter')
+
+# زمان هر مرحله راه‌اندازی ربات (ثانیه)
+startup_timings = {}
+
+@contextmanager
+def startup_phase(name):
+    """اندازه‌گیری زمان یک مرحله راه‌اندازی ربات"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+        STAGE_SECONDS.observe(startup_timings[name], stage=f'startup_{name}')
+
+def cache_generation():
+    """نسل فعلی کتابخانه و تنظیمات جستجو؛ با تغییر آن نتایج کش شده دور ریخته می‌شوند"""
+    if MATCHER_ADDRESS:
+        try:
+            index_state = fingerprint_index.generation
+        except (OSError, MatcherError):
+            # سرویس در دسترس نیست؛ درخواست بعدی خطای آن را گزارش می‌کند
+            index_state = 'unavailable'
+    else:
+        projection = fingerprint_index.projection
+        index_state = f"{fingerprint_index.version}:" \
+                      f"{projection.signature if projection is not None else 'full'}:{fingerprint_index.storage}"
+    return f"{FINGERPRINT_ENGINE}:{FEATURE_LAYOUT}:{library_state['signature']}:{index_state}:" \
+           f"{SIMILARITY_THRESHOLD}:{MAX_RESULTS}:{ANN_NPROBE}:" \
+           f"{CASCADE_SHORTLIST}:{','.join(CASCADE_GROUPS)}:{CASCADE_MIN_SIMILARITY}:" \
+           f"{','.join(f'{seconds:g}' for seconds in PROGRESSIVE_WINDOWS)}:{PROGRESSIVE_MARGIN}"
+
+def index_songs(default=None):
+    """تعداد آهنگ‌های ایندکس، یا default اگر وضعیت سرویس تطبیق هنوز در دسترس نباشد"""
+    try:
+        return len(fingerprint_index)
+    except (OSError, MatcherError):
+        return default
+
+def cascade_enabled():
+    """آیا ایندکس (داخلی یا سرویس تطبیق) ستون‌های پیش‌فیلتر گروه‌های مرحله اول ربات را دارد؟"""
+    columns = fingerprint_index.prefilter_columns
+    return CASCADE_SHORTLIST > 0 and columns is not None and list(map(int, columns)) == CASCADE_COLUMNS
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """ارسال پیام خوش‌آمدگویی"""
@@ -28,7 +134,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "فایل صوتی دمو یا ریمیکس خود را برای من ارسال کنید تا آهنگ اصلی را پیدا کنم.\n\n"
         "از دستورات زیر می‌توانید استفاده کنید:\n"
         "/help - راهنمای استفاده از ربات\n"
-        "/about - درباره ربات"
+        "/about - درباره ربات\n"
+        "/cancel - لغو پردازش فایل در حال انجام"
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -43,7 +150,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "*دستورات:*\n"
         "/start - شروع مجدد ربات\n"
         "/help - نمایش این راهنما\n"
-        "/about - اطلاعات درباره ربات\n\n"
+        "/about - اطلاعات درباره ربات\n"
+        "/cancel - لغو پردازش فایل در حال انجام\n\n"
         "*نکته:* کیفیت تشخیص به کیفیت دمو ارسالی شما بستگی دارد. هرچه کیفیت بهتر باشد، احتمال تشخیص دقیق‌تر بیشتر است.",
         parse_mode="Markdown"
     )
@@ -62,8 +170,59 @@ async def about_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         parse_mode="Markdown"
     )
 
+async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """لغو پردازش فایل‌های در حال انجام کاربر"""
+    cancelled = worker_pool.cancel(update.effective_user.id)
+    if cancelled:
+        await update.message.reply_text("پردازش فایل شما لغو شد.")
+    else:
+        await update.message.reply_text("فایلی در حال پردازش ندارید.")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """نمایش معیارهای عملکرد ربات (فقط برای مدیران)"""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        await update.message.reply_text("این دستور فقط برای مدیران ربات در دسترس است.")
+        return
+    
+    found = MATCHES.value(result='found')
+    not_found = MATCHES.value(result='not_found')
+    errors = ', '.join(f"{dict(key)['kind']}={value}" for _, key, value in ERRORS.samples()) or '0'
+    cache = result_cache.stats()
+    lines = [
+        "📊 آمار ربات",
+        f"درخواست‌ها: {REQUESTS.value()} (یافت شده: {found}، بدون نتیجه: {not_found})",
+        f"خطاها: {errors}",
+        f"صف: {worker_pool.queue_depth} منتظر، {worker_pool.running} در حال اجرا",
+        f"ایندکس: {index_songs('نامشخص')} آهنگ",
+        f"کش نتایج: {cache['size']} مورد، نرخ موفقیت {cache['hit_rate']:.0%}",
+        "",
+        "زمان مراحل (ثانیه، تعداد / p50 / p95):",
+    ]
+    for key, summary in sorted(STAGE_SECONDS.summary().items()):
+        lines.append(f"{dict(key)['stage']}: {summary['count']} / {summary['p50']:.3f} / {summary['p95']:.3f}")
+    windows = {dict(key)['window']: value for _, key, value in PROGRESSIVE_STEPS.samples()}
+    if windows:
+        total = sum(windows.values())
+        order = [window_label(seconds) for seconds in sorted(PROGRESSIVE_WINDOWS)] + ['full']
+        lines += ["", "پنجره لازم در تحلیل تدریجی:"]
+        lines += [f"{label}: {windows[label]} ({windows[label] / total:.0%})" for label in order if label in windows]
+    await update.message.reply_text("\n".join(lines))
+
 async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """پردازش فایل صوتی دریافتی و جستجو برای آهنگ مشابه"""
+    REQUESTS.inc()
+    with STAGE_SECONDS.time(stage='total'):
+        try:
+            await handle_audio(update, context)
+        except (OSError, MatcherError) as e:
+            if not MATCHER_ADDRESS:
+                raise
+            ERRORS.inc(kind='matcher')
+            logger.error(f"خطا در ارتباط با سرویس تطبیق: {str(e)}")
+            await update.message.reply_text("سرویس جستجو در دسترس نیست. لطفاً چند دقیقه دیگر دوباره تلاش کنید.")
+
+async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """مراحل پردازش یک فایل صوتی: کش، دانلود، استخراج اثر انگشت، جستجو و ارسال نتایج"""
     logger.debug("دریافت فایل صوتی جدید")
     
     # چک کردن فرمت فایل دریافتی
@@ -90,49 +249,48 @@ async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             logger.debug(f"سند صوتی با فرمت {file_extension} دریافت شد")
     
     if not audio_file:
+        ERRORS.inc(kind='not_audio')
         await update.message.reply_text("لطفاً یک فایل صوتی ارسال کنید.")
         logger.warning("فایل دریافتی صوتی نبود")
         return
     
-    # دریافت و ذخیره فایل ارسالی
-    status_message = await update.message.reply_text("در حال دریافت فایل صوتی... ⏳")
-    
-    file = await context.bot.get_file(audio_file.file_id)
-    
-    with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_file:
-        temp_path = temp_file.name
-    
-    await file.download_to_drive(custom_path=temp_path)
-    logger.debug(f"فایل صوتی در مسیر موقت {temp_path} ذخیره شد")
-    
-    await status_message.edit_text("در حال پردازش فایل صوتی و استخراج ویژگی‌ها... 🔍")
-    
-    # استخراج اثر انگشت صوتی
-    demo_fingerprint = generate_fingerprint(temp_path)
-    
-    if demo_fingerprint is None:
-        os.unlink(temp_path)  # پاک کردن فایل موقت
-        await status_message.edit_text("خطا در پردازش فایل صوتی. لطفاً فایل دیگری ارسال کنید.")
-        logger.error("خطا در استخراج اثر انگشت صوتی")
+    # فایل در حافظه دریافت می‌شود، بنابراین حجم آن پیش از دانلود محدود می‌شود
+    if audio_file.file_size and audio_file.file_size > MAX_UPLOAD_BYTES:
+        ERRORS.inc(kind='too_large')
+        await update.message.reply_text(f"حجم فایل بیش از {MAX_UPLOAD_MB:g} مگابایت است. لطفاً فایل کوتاه‌تری ارسال کنید.")
+        logger.info(f"فایل {audio_file.file_size} بایتی بیش از حد مجاز است")
         return
     
-    # دریافت همه اثر انگشت‌های دیتابیس
-    db_fingerprints = get_fingerprints()
-    
-    if not db_fingerprints:
-        os.unlink(temp_path)  # پاک کردن فایل موقت
-        await status_message.edit_text("هیچ آهنگی در دیتابیس وجود ندارد. لطفاً ابتدا کتابخانه موسیقی را پر کنید.")
-        logger.warning("دیتابیس خالی است")
+    # محدودیت نرخ ارسال فایل هر کاربر
+    wait = rate_limiter.acquire(update.effective_user.id)
+    if wait:
+        ERRORS.inc(kind='rate_limited')
+        await update.message.reply_text(
+            f"تعداد فایل‌های ارسالی شما زیاد است. لطفاً {math.ceil(wait)} ثانیه دیگر دوباره تلاش کنید. ⏳"
+        )
+        logger.info(f"محدودیت نرخ برای کاربر {update.effective_user.id}")
         return
     
-    # مقایسه اثر انگشت صوتی با دیتابیس
-    await status_message.edit_text("در حال جستجو در کتابخانه موسیقی... 🔎")
-    logger.debug(f"در حال مقایسه اثر انگشت با {len(db_fingerprints)} آهنگ در دیتابیس")
-    results = compare_fingerprints(demo_fingerprint, db_fingerprints)
+    use_landmarks = FINGERPRINT_ENGINE == 'landmark'
     
-    # پاک کردن فایل موقت
-    os.unlink(temp_path)
+    # نتیجه کش شده برای همین فایل تلگرام (بدون دانلود و پردازش مجدد)
+    result_cache.set_generation(cache_generation())
+    upload_key = f"tg:{audio_file.file_unique_id}"
+    results = result_cache.get(upload_key)
+    if results is not None:
+        logger.debug(f"نتیجه فایل از کش خوانده شد: {result_cache.stats()}")
+        status_message = await update.message.reply_text("در حال جستجو در کتابخانه موسیقی... 🔎")
+    else:
+        status_message = await update.message.reply_text("در حال دریافت فایل صوتی... ⏳")
+        identified = await identify_shared(upload_key, update, context, audio_file, file_extension, status_message,
+                                           use_landmarks)
+        if identified is None:
+            return
+        results, pcm = identified
+        result_cache.put(upload_key, results)
+        result_cache.put(pcm, results)
     
+    MATCHES.inc(result='found' if results else 'not_found')
     if not results:
         await status_message.edit_text("متأسفانه آهنگ مشابهی در کتابخانه پیدا نشد. 😔")
         logger.info("هیچ آهنگ مشابهی پیدا نشد")
@@ -142,33 +300,263 @@ async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await status_message.edit_text("آهنگ(های) مشابه پیدا شد! در حال ارسال... 🎵")
     logger.info(f"{len(results)} آهنگ مشابه پیدا شد")
     
-    for i, result in enumerate(results[:3]):  # حداکثر 3 نتیجه اول
-        song = get_song_by_id(result['id'])
+    # حداکثر 3 نتیجه اول؛ آهنگی که پس از جستجو از کتابخانه حذف شده کنار گذاشته می‌شود
+    loop = asyncio.get_running_loop()
+    songs = await asyncio.gather(*(loop.run_in_executor(None, get_song_by_id, result['id'])
+                                   for result in results[:3]))
+    shown = [(song, result) for song, result in zip(songs, results[:3]) if song is not None]
+    if not shown:
+        await status_message.edit_text("آهنگ‌های پیدا شده دیگر در کتابخانه موجود نیستند. لطفاً دوباره تلاش کنید.")
+        logger.warning("آهنگ‌های پیدا شده پس از جستجو از کتابخانه حذف شده‌اند")
+        return
+    
+    async def send_result(i, song, result):
         similarity_percent = round(result['similarity'] * 100, 2)
         
-        info_message = f"🎵 *آهنگ پیدا شده ({i+1}/{min(3, len(results))})* 🎵\n\n" \
+        info_message = f"🎵 *آهنگ پیدا شده ({i+1}/{len(shown)})* 🎵\n\n" \
                       f"*عنوان:* {song.title}\n" \
                       f"*خواننده:* {song.artist}\n" \
                       f"*درصد شباهت:* {similarity_percent}%"
         
         # ارسال فایل آهنگ
         try:
-            with open(song.file_path, 'rb') as audio:
-                await context.bot.send_audio(
-                    chat_id=update.effective_chat.id,
-                    audio=audio,
-                    caption=info_message,
-                    parse_mode="Markdown",
-                    title=song.title,
-                    performer=song.artist
-                )
+            with STAGE_SECONDS.time(stage='send'):
+                await send_song(context.bot, update.effective_chat.id, song, info_message)
             logger.debug(f"آهنگ '{song.title}' با موفقیت ارسال شد")
         except Exception as e:
-            logger.error(f"خطا در ارسال آهنگ: {str(e)}")
+            ERRORS.inc(kind='send')
+            logger.error(f"خطا در ارسال آهنگ '{song.title}': {str(e)}")
             await update.message.reply_text(f"خطا در ارسال آهنگ '{song.title}': {str(e)}")
+    
+    # ارسال همزمان نتایج
+    await asyncio.gather(*(send_result(i, song, result) for i, (song, result) in enumerate(shown)))
+
+async def identify_shared(upload_key, update, context, audio_file, file_extension, status_message, use_landmarks):
+    """identify_audio با اشتراک نتیجه بین ارسال‌های همزمان یک فایل
+    
+    اولین درخواست هر فایل پردازش را انجام می‌دهد و درخواست‌های همزمان بعدی بدون
+    دانلود و پردازش منتظر همان نتیجه می‌مانند. اگر پردازش درخواست اول ناموفق
+    باشد (مثلاً توسط صاحبش لغو شود)، یکی از درخواست‌های منتظر آن را از نو انجام می‌دهد.
+    
+    Returns:
+        همان خروجی identify_audio
+    """
+    if upload_key in inflight:
+        COALESCED.inc()
+        await status_message.edit_text("همین فایل در حال پردازش است؛ نتیجه به زودی ارسال می‌شود... ⏳")
+        while upload_key in inflight:
+            identified = await asyncio.shield(inflight[upload_key])
+            if identified is not None:
+                return identified
+    
+    shared = asyncio.get_running_loop().create_future()
+    inflight[upload_key] = shared
+    identified = None
+    try:
+        identified = await identify_audio(update, context, audio_file, file_extension, status_message, use_landmarks)
+        return identified
+    finally:
+        del inflight[upload_key]
+        shared.set_result(identified)
+
+async def identify_audio(update, context, audio_file, file_extension, status_message, use_landmarks):
+    """دانلود، استخراج اثر انگشت و جستجوی یک فایل صوتی
+    
+    اگر داده‌های PCM فایل با نتیجه‌ای در کش یکسان باشد، استخراج اثر انگشت و جستجو انجام نمی‌شود.
+    
+    Returns:
+        تاپل (نتایج، کلید PCM) یا None اگر پردازش با خطا متوقف شده و به کاربر اطلاع داده شده باشد
+    """
+    # دریافت فایل ارسالی در حافظه (بدون فایل موقت روی دیسک)
+    with STAGE_SECONDS.time(stage='download'):
+        file = await context.bot.get_file(audio_file.file_id)
+        if file.file_size and file.file_size > MAX_UPLOAD_BYTES:
+            data = None
+        else:
+            data = bytes(await file.download_as_bytearray())
+    if data is None or len(data) > MAX_UPLOAD_BYTES:
+        ERRORS.inc(kind='too_large')
+        await status_message.edit_text(f"حجم فایل بیش از {MAX_UPLOAD_MB:g} مگابایت است. لطفاً فایل کوتاه‌تری ارسال کنید.")
+        logger.info("حجم فایل دریافتی بیش از حد مجاز است")
+        return None
+    logger.debug(f"فایل صوتی ({len(data)} بایت) در حافظه دریافت شد")
+    
+    await status_message.edit_text("در حال پردازش فایل صوتی و استخراج ویژگی‌ها... 🔍")
+    
+    async def report_position(position):
+        await status_message.edit_text(f"ربات مشغول است؛ شما نفر {position} در صف هستید... ⏳")
+    
+    async def run_job(func, *args):
+        # زمان صف و انتقال بین پردازه‌ها = کل زمان کار منهای زمان مراحل داخل پردازه
+        start = time.perf_counter()
+        *outputs, timings = await worker_pool.submit(
+            func, *args,
+            owner=update.effective_user.id,
+            on_position=report_position
+        )
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        STAGE_SECONDS.observe(max(time.perf_counter() - start - sum(timings.values()), 0.0), stage='queue')
+        return outputs
+    
+    # در تحلیل تدریجی کار اول فقط فایل را رمزگشایی می‌کند و در تطبیق دو مرحله‌ای
+    # فقط گروه‌های ارزان را استخراج می‌کند
+    progressive = not use_landmarks and bool(PROGRESSIVE_WINDOWS)
+    cascade = not use_landmarks and not progressive and cascade_enabled()
+    
+    def extract(known_keys):
+        if progressive:
+            return run_job(decode_query, data, known_keys, file_extension)
+        if cascade:
+            return run_job(prefilter_query, data, CASCADE_GROUPS, known_keys, file_extension)
+        return run_job(fingerprint_query, data, FINGERPRINT_ENGINE, known_keys, file_extension)
+    
+    async def match_progressive(signal, sr):
+        # پنجره‌های بلندتر ابتدای همان سیگنال رمزگشایی شده تا رسیدن به نتیجه مطمئن
+        windows = window_schedule(len(signal) / sr)
+        for step, seconds in enumerate(windows, 1):
+            if len(windows) > 1:
+                await status_message.edit_text(f"در حال تحلیل {seconds:.0f} ثانیه ابتدای فایل "
+                                               f"(مرحله {step} از {len(windows)})... 🔍")
+            fingerprint, = await run_job(window_query, signal[:int(round(seconds * sr))], sr)
+            if fingerprint is None:
+                return None
+            with STAGE_SECONDS.time(stage='match'):
+                ranked = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: fingerprint_index.search(fingerprint, threshold=-math.inf,
+                                                           top_k=max(MAX_RESULTS, 2), nprobe=ANN_NPROBE or None)
+                )
+            if confident(ranked):
+                break
+        PROGRESSIVE_STEPS.inc(window=window_label(seconds))
+        logger.debug(f"تحلیل تدریجی پس از {step} مرحله ({seconds:.1f} ثانیه) پایان یافت")
+        return [result for result in ranked if result['similarity'] >= SIMILARITY_THRESHOLD][:MAX_RESULTS]
+    
+    # استخراج اثر انگشت صوتی در استخر پردازه‌ها با موتور انتخاب شده
+    candidates = None
+    try:
+        pcm, demo_fingerprint, *preprocessed = await extract(result_cache.keys())
+        if pcm is not None and demo_fingerprint is None:
+            results = result_cache.get(pcm)
+            if results is not None:
+                logger.debug(f"نتیجه صدای تکراری از کش خوانده شد: {result_cache.stats()}")
+                return results, pcm
+            # نتیجه کش شده در فاصله پردازش منقضی شده است
+            pcm, demo_fingerprint, *preprocessed = await extract(frozenset())
+        
+        if progressive and demo_fingerprint is not None and len(fingerprint_index) > 0:
+            results = await match_progressive(*demo_fingerprint)
+            if results is not None:
+                return results, pcm
+            demo_fingerprint = None
+        
+        if cascade and demo_fingerprint is not None and len(fingerprint_index) > 0:
+            # مرحله اول: فهرست کوتاه با ستون‌های پیش‌فیلتر
+            with STAGE_SECONDS.time(stage='match_prefilter'):
+                candidates, _ = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: fingerprint_index.shortlist(demo_fingerprint, CASCADE_SHORTLIST,
+                                                              CASCADE_MIN_SIMILARITY)
+                )
+            if len(candidates) == 0:
+                CASCADE_SKIPPED.inc()
+                logger.debug("هیچ کاندیدی از پیش‌فیلتر عبور نکرد؛ مرحله دوم انجام نمی‌شود")
+                return [], pcm
+            # مرحله دوم: گروه‌های پرهزینه روی همان سیگنال پیش‌پردازش شده
+            demo_fingerprint, = await run_job(complete_query, preprocessed[0], demo_fingerprint, CASCADE_GROUPS)
+    except OwnerLimitError:
+        ERRORS.inc(kind='user_limit')
+        await status_message.edit_text("فایل‌های قبلی شما هنوز در حال پردازش هستند. لطفاً پس از دریافت نتیجه آنها دوباره تلاش کنید. ⏳")
+        logger.info(f"کاربر {update.effective_user.id} به حداکثر کارهای همزمان رسیده است")
+        return None
+    except QueueFullError:
+        ERRORS.inc(kind='queue_full')
+        await status_message.edit_text("ربات در حال حاضر بسیار شلوغ است. لطفاً چند دقیقه دیگر دوباره تلاش کنید. ⏳")
+        logger.warning("صف پردازش پر است")
+        return None
+    except JobCancelledError:
+        ERRORS.inc(kind='cancelled')
+        await status_message.edit_text("پردازش فایل لغو شد.")
+        logger.info("پردازش فایل توسط کاربر لغو شد")
+        return None
+    except JobTimeoutError:
+        ERRORS.inc(kind='timeout')
+        await status_message.edit_text("پردازش فایل بیش از حد طول کشید. لطفاً فایل کوتاه‌تری ارسال کنید.")
+        logger.error("زمان پردازش فایل به پایان رسید")
+        return None
+    
+    if demo_fingerprint is None:
+        ERRORS.inc(kind='decode')
+        await status_message.edit_text("خطا در پردازش فایل صوتی. لطفاً فایل دیگری ارسال کنید.")
+        logger.error("خطا در استخراج اثر انگشت صوتی")
+        return None
+    
+    # بررسی خالی نبودن ایندکس
+    if not use_landmarks and len(fingerprint_index) == 0:
+        ERRORS.inc(kind='empty_index')
+        await status_message.edit_text("هیچ آهنگی در دیتابیس وجود ندارد. لطفاً ابتدا کتابخانه موسیقی را پر کنید.")
+        logger.warning("دیتابیس خالی است")
+        return None
+    
+    # مقایسه اثر انگشت صوتی با ایندکس
+    await status_message.edit_text("در حال جستجو در کتابخانه موسیقی... 🔎")
+    with STAGE_SECONDS.time(stage='match'):
+        if use_landmarks:
+            from landmark_fingerprint import match_landmarks
+            logger.debug(f"در حال جستجوی {len(demo_fingerprint[0])} هش در ایندکس معکوس")
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: match_landmarks(demo_fingerprint, top_k=MAX_RESULTS)
+            )
+        else:
+            logger.debug(f"در حال مقایسه اثر انگشت با "
+                         f"{len(fingerprint_index) if candidates is None else len(candidates)} آهنگ در ایندکس")
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: fingerprint_index.search(demo_fingerprint, threshold=SIMILARITY_THRESHOLD,
+                                                 top_k=MAX_RESULTS, nprobe=ANN_NPROBE or None,
+                                                 candidates=candidates)
+            )
+    
+    return results, pcm
+
+async def send_song(bot: Bot, chat_id, song, caption):
+    """ارسال فایل یک آهنگ با استفاده مجدد از شناسه فایل تلگرام در صورت وجود
+    
+    اولین ارسال هر آهنگ فایل کامل را آپلود می‌کند و شناسه فایل برگشتی در دیتابیس
+    ذخیره می‌شود؛ ارسال‌های بعدی فقط همین شناسه را می‌فرستند. اگر تلگرام شناسه
+    ذخیره شده را نپذیرد، شناسه پاک و فایل دوباره آپلود می‌شود.
+    
+    Args:
+        bot: نمونه ربات تلگرام
+        chat_id: شناسه گفتگو
+        song: رکورد آهنگ
+        caption: متن همراه فایل
+    """
+    if song.telegram_file_id:
+        try:
+            await bot.send_audio(chat_id=chat_id, audio=song.telegram_file_id, caption=caption,
+                                 parse_mode="Markdown")
+            return
+        except BadRequest as e:
+            # خطاهای دیگر (مثلاً قالب متن) ربطی به شناسه فایل ندارند
+            if 'file' not in str(e).lower():
+                raise
+            logger.warning(f"شناسه فایل ذخیره شده برای '{song.title}' پذیرفته نشد، آپلود مجدد: {str(e)}")
+            await asyncio.get_running_loop().run_in_executor(None, set_telegram_file_id, song.id, None)
+    
+    with open(song.file_path, 'rb') as audio:
+        message = await bot.send_audio(
+            chat_id=chat_id,
+            audio=audio,
+            caption=caption,
+            parse_mode="Markdown",
+            title=song.title,
+            performer=song.artist
+        )
+    if message.audio is not None:
+        await asyncio.get_running_loop().run_in_executor(None, set_telegram_file_id, song.id, message.audio.file_id)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """مدیریت خطاهای ربات"""
+    ERRORS.inc(kind='unhandled')
     logger.error(f"خطا: {context.error}")
     try:
         if update and update.effective_message:
@@ -176,25 +564,157 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     except Exception as e:
         logger.error(f"خطا در ارسال پیام خطا: {str(e)}")
 
+async def sync_index_loop(interval):
+    """بررسی دوره‌ای لاگ تغییرات دیتابیس و اعمال آهنگ‌های افزوده یا حذف شده روی ایندکس داخلی
+
+    خواندن دیتابیس و ساخت نسخه جدید ایندکس در یک نخ جداگانه انجام می‌شود و
+    جستجوهای در حال اجرا تا جایگزینی با نسخه قبلی ادامه می‌دهند.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            stats = await loop.run_in_executor(None, fingerprint_index.sync)
+        except Exception as e:
+            ERRORS.inc(kind='index_sync')
+            logger.error(f"خطا در به‌روزرسانی ایندکس: {str(e)}")
+            continue
+        if stats is None:
+            continue
+        STAGE_SECONDS.observe(stats['seconds'], stage='index_sync')
+        index_sync['peak_bytes'] = stats['peak_bytes']
+        logger.info(f"ایندکس با نسخه {stats['version']} کتابخانه همگام شد "
+                    f"({'بارگذاری کامل' if stats['full'] else 'تغییرات'}: {stats['added']} افزوده، "
+                    f"{stats['updated']} جایگزین، {stats['removed']} حذف) در {stats['seconds'] * 1000:.0f}ms؛ "
+                    f"حافظه هنگام جایگزینی {stats['peak_bytes'] / 2**20:.1f} MiB "
+                    f"(نسخه جدید {stats['bytes'] / 2**20:.1f} MiB)")
+        if stats['full'] and fingerprint_index.ann is not None and fingerprint_index.ann_stale:
+            logger.warning("ایندکس تقریبی با کتابخانه فعلی همخوانی ندارد؛ جستجو تا اجرای indexer.py --build-ann دقیق انجام می‌شود")
+
+async def post_init(application: Application) -> None:
+    """مرحله آماده‌سازی پیش از شروع دریافت پیام‌ها و گزارش زمان راه‌اندازی"""
+    if WARM_UP:
+        with startup_phase('warm_up'):
+            if FINGERPRINT_ENGINE == 'landmark':
+                # جستجوی نشانه‌ای در پردازه اصلی ربات انجام می‌شود
+                import landmark_fingerprint
+            worker_times = await worker_pool.warm_up(warm_up, FINGERPRINT_ENGINE)
+        logger.info(f"آماده‌سازی {len(worker_times)} پردازه کاری: "
+                    + ', '.join(f'{seconds:.2f}s' for seconds in worker_times))
+    
+    # به‌روزرسانی زنده ایندکس داخلی (در حالت سرویس تطبیق، سرویس ایندکس را همگام نگه می‌دارد)
+    if not MATCHER_ADDRESS and INDEX_SYNC_SECONDS > 0:
+        index_sync['task'] = asyncio.create_task(sync_index_loop(INDEX_SYNC_SECONDS))
+    
+    total = time.perf_counter() - _import_start
+    phases = ', '.join(f"{name}={seconds:.2f}s" for name, seconds in startup_timings.items())
+    logger.info(f"راه‌اندازی ربات در {total:.2f} ثانیه ({phases})")
+
+async def post_shutdown(application: Application) -> None:
+    """بستن استخر پردازه‌ها و ذخیره کش نتایج هنگام توقف ربات"""
+    if index_sync['task'] is not None:
+        index_sync['task'].cancel()
+    worker_pool.shutdown()
+    result_cache.save()
+    logger.info(f"آمار کش نتایج: {result_cache.stats()}")
+
+def load_local_index() -> None:
+    """بارگذاری ایندکس داخل ربات (از فایل جانبی در صورت وجود) و ایندکس تقریبی"""
+    with startup_phase('index'):
+        projection = configure_index(fingerprint_index)
+        if REDUCTION_ENABLED and projection is None:
+            logger.warning("فایل تبدیل کاهش ابعاد پیدا نشد؛ جستجو با بردارهای کامل انجام می‌شود")
+        if FINGERPRINT_ENGINE == 'features' and configure_cascade(fingerprint_index):
+            logger.info(f"تطبیق دو مرحله‌ای فعال است (فهرست کوتاه {CASCADE_SHORTLIST}، "
+                        f"گروه‌های مرحله اول: {', '.join(CASCADE_GROUPS)})")
+        song_count = None
+        if FINGERPRINT_MATRIX_PATH and matrix_exists(FINGERPRINT_MATRIX_PATH):
+            try:
+                song_count = fingerprint_index.load_matrix(FINGERPRINT_MATRIX_PATH)
+            except ValueError as e:
+                logger.warning(f"{str(e)}؛ ایندکس از دیتابیس ساخته می‌شود")
+        if song_count is None:
+            song_count = fingerprint_index.reload()
+    logger.info(f"ایندکس اثر انگشت با {song_count} آهنگ بارگذاری شد "
+                f"({fingerprint_index.dimension} بعد، {INDEX_STORAGE}، "
+                f"{fingerprint_index.nbytes / 2**20:.1f} MiB)")
+    
+    # ایندکس تقریبی برای کتابخانه‌های بزرگ (فقط اگر nprobe تنظیم شده باشد)
+    ann_path = ANN_INDEX_PATH or default_ann_path()
+    if ANN_NPROBE > 0:
+        if os.path.exists(ann_path):
+            with startup_phase('ann'):
+                ann = IVFIndex.load(ann_path)
+                fingerprint_index.attach_ann(ann, changed_ids=changes_since_build(ann))
+            logger.info(f"ایندکس تقریبی از '{ann_path}' بارگذاری شد (nprobe={ANN_NPROBE})")
+            if fingerprint_index.ann_stale:
+                logger.warning("ایندکس تقریبی با کتابخانه فعلی همخوانی ندارد؛ جستجو تا اجرای indexer.py --build-ann دقیق انجام می‌شود")
+        else:
+            logger.warning(f"فایل ایندکس تقریبی '{ann_path}' پیدا نشد؛ جستجو به صورت دقیق انجام می‌شود")
+
 def main() -> None:
     """راه‌اندازی ربات"""
+    startup_timings['imports'] = time.perf_counter() - _import_start
+    STAGE_SECONDS.observe(startup_timings['imports'], stage='startup_imports')
+    
+    # مقداردهی اولیه دیتابیس و پوشه کتابخانه موسیقی
+    with startup_phase('database'):
+        init_db()
+        if not os.path.exists(MUSIC_LIBRARY_PATH):
+            os.makedirs(MUSIC_LIBRARY_PATH)
+            logger.info(f"پوشه کتابخانه موسیقی در مسیر {MUSIC_LIBRARY_PATH} ایجاد شد")
+    
     # ایجاد برنامه
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().token(TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
     
     # تعریف هندلرها
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("about", about_command))
+    application.add_handler(CommandHandler("cancel", cancel_command))
+    application.add_handler(CommandHandler("stats", stats_command))
     
-    # هندلر برای فایل‌های صوتی
+    # هندلر برای فایل‌های صوتی (به صورت همزمان تا پردازش یک فایل بقیه پیام‌ها را معطل نکند)
     application.add_handler(MessageHandler(
         filters.AUDIO | filters.VOICE | filters.Document.AUDIO,
-        process_audio
+        process_audio,
+        block=False
     ))
     
     # هندلر خطا
     application.add_error_handler(error_handler)
     
+    # بارگذاری ایندکس اثر انگشت‌ها پیش از دریافت پیام‌ها، یا اتصال به سرویس تطبیق مشترک
+    if MATCHER_ADDRESS:
+        try:
+            with startup_phase('matcher'):
+                health = fingerprint_index.health()
+            logger.info(f"سرویس تطبیق {MATCHER_ADDRESS}: {health['songs']} آهنگ "
+                        f"({health['dimension']} بعد، {health['storage']}، {health['bytes'] / 2**20:.1f} MiB)")
+            if CASCADE_SHORTLIST > 0 and not cascade_enabled():
+                logger.warning("ستون‌های پیش‌فیلتر سرویس تطبیق با CASCADE_GROUPS ربات یکسان نیست؛ "
+                               "تطبیق دو مرحله‌ای انجام نمی‌شود")
+        except (OSError, MatcherError) as e:
+            logger.error(f"سرویس تطبیق {MATCHER_ADDRESS} در دسترس نیست: {str(e)}")
+    else:
+        load_local_index()
+    
+    # بارگذاری کش نتایج ذخیره شده (فقط اگر کتابخانه از آخرین اجرا تغییر نکرده باشد)
+    if result_cache.path:
+        with startup_phase('result_cache'):
+            library_state['signature'] = library_signature()
+            cached_count = result_cache.load()
+            changed = result_cache.set_generation(cache_generation())
+        if changed:
+            logger.info("کتابخانه تغییر کرده است؛ کش نتایج ذخیره شده دور ریخته شد")
+        else:
+            logger.info(f"{cached_count} نتیجه از کش ذخیره شده بارگذاری شد")
+    
+    # سرور HTTP معیارهای Prometheus
+    if METRICS_PORT > 0:
+        start_http_server(metrics, METRICS_PORT, METRICS_HOST)
+        logger.info(f"معیارهای عملکرد روی http://{METRICS_HOST}:{METRICS_PORT}/metrics در دسترس است")
+    
     # شروع ربات
     logger.info("ربات شروع به کار کرد")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -0,0 +1,124 @@
+"""
+تطبیق دو مرحله‌ای (cascade): پیش‌فیلتر با ویژگی‌های ارزان، سپس ویژگی‌های کامل روی فهرست کوتاه
+
+بیشتر زمان استخراج اثر انگشت کوئری صرف گروه‌های پرهزینه chroma_cqt و tempogram
+می‌شود. در مرحله اول فقط گروه‌های ارزان (به طور پیش‌فرض همه گروه‌های مبتنی بر STFT
+مشترک) محاسبه و با همان ستون‌های ذخیره شده در ایندکس (`set_prefilter`) مقایسه
+می‌شوند تا N آهنگ برتر انتخاب شوند. در مرحله دوم گروه‌های باقی‌مانده روی همان
+سیگنال پیش‌پردازش شده محاسبه، بردار کامل ساخته و فقط همین کاندیدها با شباهت
+ترکیبی معمول رتبه‌بندی می‌شوند.
+"""
+
+import time
+
+import numpy as np
+
+from config import CASCADE_SHORTLIST, CASCADE_GROUPS
+from feature_groups import GROUP_NAMES, column_ranges, current_layout
+
+
+def group_layout():
+    """محدوده ستون‌های هر گروه ویژگی فعال در بردار کامل extract_features
+
+    Returns:
+        دیکشنری نام گروه به (ستون شروع، ستون پایان)
+    """
+    return column_ranges(current_layout())
+
+
+def group_columns(groups):
+    """شماره ستون‌های چند گروه ویژگی در بردار کامل (به ترتیب بردار کامل)
+
+    گروه‌هایی که در FEATURE_GROUPS غیرفعال شده‌اند نادیده گرفته می‌شوند.
+    """
+    unknown = set(groups) - set(GROUP_NAMES)
+    if unknown:
+        raise ValueError(f"گروه ویژگی ناشناخته: {', '.join(sorted(unknown))}")
+    layout = group_layout()
+    selected = [np.arange(*layout[name]) for name in layout if name in groups]
+    return np.concatenate(selected) if selected else np.zeros(0, dtype=np.int64)
+
+
+def configure_cascade(index, shortlist=CASCADE_SHORTLIST, groups=CASCADE_GROUPS):
+    """تنظیم ستون‌های پیش‌فیلتر ایندکس (پیش از بارگذاری آن)
+
+    Args:
+        index: نمونه FingerprintIndex
+        shortlist: اندازه فهرست کوتاه (صفر یعنی تطبیق دو مرحله‌ای غیرفعال)
+        groups: گروه‌های ویژگی مرحله اول
+
+    Returns:
+        True اگر تطبیق دو مرحله‌ای فعال شد
+    """
+    columns = group_columns(groups)
+    enabled = shortlist > 0 and len(columns) > 0
+    index.set_prefilter(columns if enabled else None)
+    return enabled
+
+
+def prefilter_query(file_path, groups=CASCADE_GROUPS, known_keys=frozenset(), suffix=None):
+    """مرحله اول در استخر پردازه‌ها: رمزگشایی، پیش‌پردازش و استخراج گروه‌های ارزان
+
+    Args:
+        file_path: مسیر فایل صوتی یا بایت‌های آن
+        groups: گروه‌های ویژگی مرحله اول
+        known_keys: مجموعه کلیدهای PCM موجود در کش
+        suffix: پسوند فایل ورودی بایتی
+
+    Returns:
+        تاپل (کلید PCM، بردار گروه‌های مرحله اول، سیگنال پیش‌پردازش شده، زمان مراحل)؛
+        اگر کلید در کش باشد بردار و سیگنال None هستند و در صورت خطای رمزگشایی
+        کلید هم None است. زمان مراحل دیکشنری decode، preprocess و extract_prefilter (ثانیه) است.
+    """
+    from audio_fingerprint import load_audio, preprocess_signal, extract_features
+    from result_cache import pcm_key
+
+    timings = {}
+    start = time.perf_counter()
+    signal, sr = load_audio(file_path, suffix=suffix)
+    timings['decode'] = time.perf_counter() - start
+    if signal is None:
+        return None, None, None, timings
+
+    key = pcm_key(signal)
+    if key in known_keys:
+        return key, None, None, timings
+
+    start = time.perf_counter()
+    signal = preprocess_signal(signal)
+    timings['preprocess'] = time.perf_counter() - start
+    start = time.perf_counter()
+    # فقط گروه‌های فعال (همان ستون‌های group_columns)
+    partial = extract_features(signal, sr, groups=[name for name in group_layout() if name in groups],
+                               preprocessed=True)
+    timings['extract_prefilter'] = time.perf_counter() - start
+    return key, partial, (signal, sr), timings
+
+
+def complete_query(preprocessed, partial, groups=CASCADE_GROUPS):
+    """مرحله دوم در استخر پردازه‌ها: استخراج گروه‌های باقی‌مانده و ساخت بردار کامل
+
+    Args:
+        preprocessed: تاپل (سیگنال پیش‌پردازش شده، نرخ نمونه‌برداری) خروجی prefilter_query
+        partial: بردار گروه‌های مرحله اول
+        groups: گروه‌های ویژگی مرحله اول
+
+    Returns:
+        تاپل (بردار کامل اثر انگشت، زمان مراحل شامل extract_rest)
+    """
+    from audio_fingerprint import extract_features
+
+    signal, sr = preprocessed
+    start = time.perf_counter()
+    rest_groups = [name for name in group_layout() if name not in groups]
+    rest = extract_features(signal, sr, groups=rest_groups, preprocessed=True) if rest_groups else np.zeros(0)
+
+    # قرار دادن ستون‌های هر دو مرحله در جای خود در بردار کامل
+    columns = group_columns(groups)
+    fingerprint = np.empty(len(partial) + len(rest), dtype=np.asarray(partial).dtype)
+    mask = np.zeros(len(fingerprint), dtype=bool)
+    mask[columns] = True
+    fingerprint[mask] = partial
+    fingerprint[~mask] = rest
+    return fingerprint, {'extract_rest': time.perf_counter() - start}
+
@@ -9,22 +9,94 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")  # توکن از متغیرهای م
 
 # مسیرهای دیتابیس
 DATABASE_PATH = os.getenv("DATABASE_PATH", "sqlite:///music_database.db")  # مسیر دیتابیس SQL
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"  # حالت WAL و تنظیمات سریع‌تر نوشتن برای SQLite
 MUSIC_LIBRARY_PATH = os.getenv("MUSIC_LIBRARY_PATH", "./music_folder")  # مسیر پوشه کتابخانه موسیقی شما
 
-# تنظیمات پردازش صوتی
-SAMPLE_RATE = 22050  # فرکانس نمونه‌برداری
-DURATION = 30  # مدت زمان پردازش (ثانیه)
-HOP_LENGTH = 512  # طول پرش برای استخراج ویژگی‌ها
-N_FFT = 2048  # اندازه FFT
-N_MELS = 128  # تعداد فیلترهای mel
+# تنظیمات پردازش صوتی (نسخه گروه‌های ویژگی وابسته به هر تنظیم با تغییر آن عوض می‌شود)
+SAMPLE_RATE = int(os.getenv("SAMPLE_RATE", "44100"))  # فرکانس نمونه‌برداری
+DURATION = int(os.getenv("DURATION", "45"))  # مدت زمان پردازش (ثانیه)
+HOP_LENGTH = int(os.getenv("HOP_LENGTH", "256"))  # طول پرش برای استخراج ویژگی‌ها
+N_FFT = int(os.getenv("N_FFT", "4096"))  # اندازه FFT
+N_MELS = int(os.getenv("N_MELS", "256"))  # تعداد فیلترهای mel
+RESAMPLE_TYPE = os.getenv("RESAMPLE_TYPE", "soxr_hq")  # کیفیت تغییر نرخ نمونه‌برداری (soxr_hq، soxr_mq، soxr_lq و ...)
 
-# تنظیمات پردازش صوتی بهبود یافته
-SAMPLE_RATE = 44100  # افزایش فرکانس نمونه‌برداری برای کیفیت بهتر
-DURATION = 45  # افزایش مدت زمان پردازش برای تطبیق بهتر
-HOP_LENGTH = 256  # کاهش طول پرش برای وضوح بیشتر
-N_FFT = 4096  # افزایش اندازه FFT برای وضوح طیفی بهتر
-N_MELS = 256  # افزایش تعداد فیلترهای mel برای تفکیک بهتر
+# تنظیمات ذخیره‌سازی اثر انگشت
+FINGERPRINT_DTYPE = os.getenv("FINGERPRINT_DTYPE", "float32")  # نوع داده ذخیره‌سازی: float32 یا float16
+FEATURE_VERSION = 1  # نسخه قالب بردار ویژگی‌ها در سرآیند اثر انگشت (نسخه هر گروه جداگانه در feature_groups محاسبه می‌شود)
+FEATURE_GROUPS = [group.strip() for group in os.getenv("FEATURE_GROUPS", "mfcc,chroma,contrast,mel,zcr,rolloff,bandwidth,tempogram").split(",") if group.strip()]  # گروه‌های ویژگی فعال بردار اثر انگشت
+FINGERPRINT_MATRIX_PATH = os.getenv("FINGERPRINT_MATRIX_PATH", "")  # فایل جانبی .npy برای بارگذاری سریع ماتریس
+
+# ایندکس تقریبی نزدیک‌ترین همسایه (IVF) برای کتابخانه‌های بسیار بزرگ
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "0"))  # تعداد لیست‌های بررسی شده در هر جستجو (0 یعنی جستجوی دقیق)
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "")  # مسیر فایل ایندکس تقریبی (پیش‌فرض: کنار فایل دیتابیس)
+
+# کاهش ابعاد (استانداردسازی + PCA) و نوع داده ماتریس ایندکس در حافظه
+REDUCTION_ENABLED = os.getenv("REDUCTION_ENABLED", "0") == "1"  # جستجو با بردارهای کاهش یافته
+REDUCTION_COMPONENTS = int(os.getenv("REDUCTION_COMPONENTS", "128"))  # تعداد مؤلفه‌های اصلی هنگام آموزش تبدیل
+REDUCTION_PATH = os.getenv("REDUCTION_PATH", "")  # مسیر فایل تبدیل (پیش‌فرض: کنار فایل دیتابیس)
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "float32")  # نوع داده ماتریس ایندکس: float32، float16 یا int8
+
+# تطبیق دو مرحله‌ای: پیش‌فیلتر با گروه‌های ویژگی ارزان و رتبه‌بندی دوباره فهرست کوتاه با بردار کامل
+CASCADE_SHORTLIST = int(os.getenv("CASCADE_SHORTLIST", "0"))  # اندازه فهرست کوتاه (0 یعنی غیرفعال)
+CASCADE_GROUPS = [group.strip() for group in os.getenv("CASCADE_GROUPS", "mfcc,contrast,mel,zcr,rolloff,bandwidth").split(",") if group.strip()]  # گروه‌های ویژگی مرحله اول
+CASCADE_MIN_SIMILARITY = float(os.getenv("CASCADE_MIN_SIMILARITY", "0"))  # حداقل شباهت پیش‌فیلتر برای ماندن در فهرست کوتاه
+
+# تحلیل تدریجی کوئری: تطبیق با پنجره کوتاه ابتدای فایل و گسترش آن فقط وقتی نتیجه مطمئن نیست
+PROGRESSIVE_WINDOWS = [float(seconds) for seconds in os.getenv("PROGRESSIVE_WINDOWS", "").split(",") if seconds.strip()]  # طول پنجره‌های پیش از کل فایل (ثانیه؛ خالی یعنی غیرفعال)
+PROGRESSIVE_MARGIN = float(os.getenv("PROGRESSIVE_MARGIN", "0.05"))  # حداقل فاصله شباهت نتیجه اول از دوم برای توقف زودهنگام
+
+# سرویس تطبیق مستقل که ایندکس را یک بار در حافظه نگه می‌دارد و بین چند پردازه ربات مشترک است
+MATCHER_ADDRESS = os.getenv("MATCHER_ADDRESS", "")  # نشانی سرویس (unix:/path/matcher.sock یا host:port؛ خالی یعنی ایندکس داخل ربات)
+MATCHER_BATCH_WINDOW_MS = float(os.getenv("MATCHER_BATCH_WINDOW_MS", "2"))  # پنجره زمانی جمع کردن درخواست‌ها در یک دسته (میلی‌ثانیه)
+MATCHER_MAX_BATCH = int(os.getenv("MATCHER_MAX_BATCH", "64"))  # حداکثر تعداد کوئری‌های یک دسته
+MATCHER_TIMEOUT = float(os.getenv("MATCHER_TIMEOUT", "30"))  # محدودیت زمانی هر درخواست کلاینت (ثانیه)
+MATCHER_METRICS_PORT = int(os.getenv("MATCHER_METRICS_PORT", "0"))  # درگاه HTTP معیارها و /health سرویس (0 یعنی غیرفعال)
+
+# به‌روزرسانی زنده ایندکس: ربات و سرویس تطبیق لاگ تغییرات دیتابیس را می‌خوانند و فقط تغییرات را اعمال می‌کنند
+INDEX_SYNC_SECONDS = float(os.getenv("INDEX_SYNC_SECONDS", "5"))  # فاصله بررسی تغییرات کتابخانه (ثانیه؛ 0 یعنی غیرفعال)
+CHANGE_LOG_RETENTION = int(os.getenv("CHANGE_LOG_RETENTION", "100000"))  # تعداد تغییرات نگه داشته شده در لاگ پس از ایندکس‌گذاری
+
+# حالت پایش ایندکس‌گذار (indexer.py --watch)
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "5"))  # فاصله پیمایش‌های کتابخانه (ثانیه)
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "3"))  # مدت آرام بودن لازم برای هر فایل پیش از ایندکس‌گذاری (ثانیه)
+WATCH_FULL_SCAN_EVERY = int(os.getenv("WATCH_FULL_SCAN_EVERY", "12"))  # هر چند پیمایش وضعیت همه فایل‌ها بررسی شود (برای بازنویسی درجا)
+WATCH_MAX_PENDING = int(os.getenv("WATCH_MAX_PENDING", "1000"))  # حداکثر تغییرات در انتظار پیش از توقف پیمایش (فشار برگشتی)
+
+# موتور اثر انگشت: "features" (بردار ویژگی سراسری) یا "landmark" (هش قله‌های طیفی)
+FINGERPRINT_ENGINE = os.getenv("FINGERPRINT_ENGINE", "features")
+
+# تنظیمات موتور نشانه‌ای (landmark)
+LANDMARK_SAMPLE_RATE = 11025  # فرکانس نمونه‌برداری برای استخراج قله‌ها
+LANDMARK_N_FFT = 2048  # اندازه FFT (حداکثر 1024 باند فرکانسی در هش استفاده می‌شود)
+LANDMARK_HOP_LENGTH = 256  # طول پرش بین فریم‌ها
+LANDMARK_PEAK_NEIGHBORHOOD = 15  # اندازه همسایگی برای یافتن قله‌های محلی (فریم/باند)
+LANDMARK_MIN_DB = -50  # حداقل دامنه قله نسبت به بیشینه طیف (دسی‌بل)
+LANDMARK_PEAKS_PER_SECOND = 30  # حداکثر تعداد قله‌های نگه‌داشته شده در هر ثانیه
+LANDMARK_FAN_OUT = 10  # تعداد قله‌های بعدی که با هر قله جفت می‌شوند
+LANDMARK_MAX_DT = 63  # حداکثر فاصله زمانی دو قله یک جفت (فریم)
+LANDMARK_MIN_VOTES = 10  # حداقل رأی هم‌راستا برای پذیرش یک تطابق
 
 # تنظیمات تشخیص
 SIMILARITY_THRESHOLD = 0.65  # آستانه شباهت
-MAX_RESULTS = 5  # حداکثر تعداد نتایج 
\ No newline at end of file
+MAX_RESULTS = 5  # حداکثر تعداد نتایج 
+
+# تنظیمات استخر پردازش ربات
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))  # تعداد پردازه‌های استخراج اثر انگشت
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "20"))  # حداکثر تعداد فایل‌های منتظر در صف
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))  # حداکثر زمان پردازش هر فایل (ثانیه)
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "20"))  # حداکثر حجم فایل ارسالی که در حافظه دریافت می‌شود (مگابایت)
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", "2"))  # حداکثر فایل‌های منتظر یا در حال پردازش هر کاربر
+USER_RATE_LIMIT = float(os.getenv("USER_RATE_LIMIT", "6"))  # حداکثر فایل‌های هر کاربر در دقیقه (0 یعنی بدون محدودیت)
+USER_BURST = int(os.getenv("USER_BURST", "3"))  # تعداد فایل‌هایی که هر کاربر می‌تواند پشت سر هم بفرستد
+WARM_UP = os.getenv("WARM_UP", "1") == "1"  # اجرای یک استخراج آزمایشی در پردازه‌ها پیش از شروع ربات
+
+# کش نتایج جستجو برای فایل‌های تکراری
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1000"))  # حداکثر تعداد نتایج کش شده (0 یعنی غیرفعال)
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))  # مدت اعتبار هر نتیجه (ثانیه)
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")  # فایل ذخیره کش بین اجراها (خالی یعنی فقط در حافظه)
+
+# معیارهای عملکرد و دسترسی مدیر
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # درگاه HTTP معیارهای Prometheus (0 یعنی غیرفعال)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # نشانی شنود سرور معیارها
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}  # شناسه کاربران مدیر
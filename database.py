@@ -1,55 +1,273 @@
 import os
 import pickle
+import hashlib
 import numpy as np
-from sqlalchemy import create_engine, Column, Integer, String, Float, LargeBinary
+from sqlalchemy import (create_engine, event, func, inspect, insert, update, text, tuple_, Column, Index, Integer,
+                        String, Float, LargeBinary)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from config import DATABASE_PATH, MUSIC_LIBRARY_PATH
+from config import (DATABASE_PATH, MUSIC_LIBRARY_PATH, FINGERPRINT_DTYPE, FEATURE_VERSION, SQLITE_WAL,
+                    CHANGE_LOG_RETENTION)
+from fingerprint_store import MAGIC, is_encoded, encode_fingerprint, decode_fingerprint, decode_header
+from feature_groups import current_layout, format_layout, parse_layout, layout_width, select_columns
 
 # تنظیم دیتابیس
 engine = create_engine(DATABASE_PATH)
 Base = declarative_base()
 Session = sessionmaker(bind=engine)
 
+# تنظیمات SQLite برای نوشتن سریع‌تر: WAL اجازه می‌دهد ربات هنگام ایندکس‌گذاری بخواند
+# و با synchronous=NORMAL فقط در checkpoint ها fsync انجام می‌شود
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+)
+
+if engine.dialect.name == 'sqlite' and SQLITE_WAL:
+    @event.listens_for(engine, 'connect')
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """اعمال تنظیمات SQLite روی هر اتصال جدید"""
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
 class Song(Base):
     """مدل دیتابیس برای آهنگ‌ها"""
     __tablename__ = 'songs'
     
+    __table_args__ = (
+        # هر ترکیب عنوان و خواننده فقط یک بار ذخیره می‌شود (پایه درج دسته‌ای با نادیده گرفتن تکراری‌ها)
+        Index('ix_songs_title_artist', 'title', 'artist', unique=True),
+    )
+    
     id = Column(Integer, primary_key=True)
     title = Column(String)
     artist = Column(String)
-    file_path = Column(String)
+    file_path = Column(String, index=True)
     fingerprint = Column(LargeBinary)  # اثر انگشت صوتی به صورت باینری
+    feature_layout = Column(String)  # نام، نسخه و پهنای گروه‌های ویژگی اثر انگشت (None برای اثر انگشت‌های قدیمی)
+    file_size = Column(Integer)  # اندازه فایل در زمان ایندکس‌گذاری (بایت)
+    file_mtime = Column(Float)  # زمان آخرین تغییر فایل در زمان ایندکس‌گذاری
+    content_hash = Column(String, index=True)  # هش محتوای فایل برای تشخیص تغییر نام
+    telegram_file_id = Column(String)  # شناسه فایل در تلگرام پس از اولین ارسال (برای ارسال مجدد بدون آپلود)
     
     def __repr__(self):
         return f"<Song(title='{self.title}', artist='{self.artist}')>"
 
+class Landmark(Base):
+    """ایندکس معکوس هش‌های نشانه‌ای: هش ← (آهنگ، زمان)"""
+    __tablename__ = 'landmarks'
+    
+    id = Column(Integer, primary_key=True)
+    hash = Column(Integer, nullable=False, index=True)  # هش زوج قله‌های طیفی
+    song_id = Column(Integer, nullable=False, index=True)  # شناسه آهنگ
+    offset = Column(Integer, nullable=False)  # شماره فریم قله اول در آهنگ
+
+class SongChange(Base):
+    """لاگ تغییرات کتابخانه: هر افزودن، حذف یا تغییر متادیتای آهنگ یک نسخه جدید ثبت می‌کند
+
+    شناسه رکورد همان نسخه کتابخانه است و هرگز تکرار نمی‌شود (AUTOINCREMENT)، بنابراین
+    ربات با دانستن آخرین نسخه‌ای که دیده فقط آهنگ‌های تغییر یافته پس از آن را می‌خواند.
+    """
+    __tablename__ = 'song_changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = Column(Integer, primary_key=True)  # نسخه کتابخانه پس از این تغییر
+    song_id = Column(Integer)  # شناسه آهنگ (None برای پاک شدن کل کتابخانه)
+    op = Column(String, nullable=False)  # 'add'، 'delete'، 'update' یا 'clear'
+
+def _upgrade_schema():
+    """افزودن ستون‌های جدید به جدول‌های ساخته شده با نسخه‌های قبلی"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        with engine.begin() as connection:
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"ستون '{column.name}' به جدول '{table.name}' اضافه شد")
+    # ایجاد ایندکس‌هایی که ممکن است در جدول‌های قدیمی وجود نداشته باشند
+    if inspector.has_table(Song.__tablename__):
+        _remove_duplicate_songs()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def _remove_duplicate_songs():
+    """حذف رکوردهای تکراری (title, artist) پیش از ساخت ایندکس یکتا
+
+    از هر ترکیب عنوان و خواننده قدیمی‌ترین رکورد نگه داشته می‌شود.
+    """
+    session = Session()
+    keep = session.query(func.min(Song.id)).group_by(Song.title, Song.artist)
+    duplicate_ids = [row.id for row in session.query(Song.id).filter(Song.id.notin_(keep)).all()]
+    if duplicate_ids:
+        _delete_song_rows(session, duplicate_ids)
+        _log_changes(session, 'delete', duplicate_ids)
+        session.commit()
+        print(f"{len(duplicate_ids)} آهنگ تکراری (عنوان و خواننده یکسان) از دیتابیس حذف شد")
+    session.close()
+
 def init_db():
     """ایجاد دیتابیس و جداول"""
     Base.metadata.create_all(engine)
+    _upgrade_schema()
+    migrate_fingerprints()
     print("دیتابیس با موفقیت ایجاد شد")
 
-def add_song(title, artist, file_path, fingerprint):
-    """افزودن آهنگ جدید به دیتابیس"""
-    session = Session()
+def _apply_file_state(song, file_state):
+    """ثبت اندازه، زمان تغییر و هش فایل روی رکورد آهنگ"""
+    if file_state:
+        song.file_size = file_state.get('size')
+        song.file_mtime = file_state.get('mtime')
+        song.content_hash = file_state.get('hash')
+
+def _file_state_columns(file_state):
+    """ستون‌های اندازه، زمان تغییر و هش فایل برای درج دسته‌ای"""
+    file_state = file_state or {}
+    return {
+        'file_size': file_state.get('size'),
+        'file_mtime': file_state.get('mtime'),
+        'content_hash': file_state.get('hash'),
+    }
+
+def _delete_song_rows(session, song_ids):
+    """حذف آهنگ‌ها و هش‌های نشانه‌ای آنها در یک نشست"""
+    session.query(Landmark).filter(Landmark.song_id.in_(song_ids)).delete(synchronize_session=False)
+    return session.query(Song).filter(Song.id.in_(song_ids)).delete(synchronize_session=False)
+
+def _log_changes(session, op, song_ids):
+    """ثبت تغییر آهنگ‌ها در لاگ تغییرات در همان تراکنش تغییر"""
+    rows = [{'song_id': int(song_id), 'op': op} for song_id in song_ids]
+    if rows:
+        session.execute(insert(SongChange), rows)
+
+def add_song(title, artist, file_path, fingerprint, file_state=None, landmarks=None):
+    """افزودن آهنگ جدید به دیتابیس
     
-    # بررسی وجود آهنگ تکراری
-    existing_song = session.query(Song).filter_by(title=title, artist=artist).first()
-    if existing_song:
-        print(f"آهنگ '{title}' از '{artist}' قبلاً در دیتابیس وجود دارد")
-        session.close()
-        return
+    Args:
+        title: عنوان آهنگ
+        artist: نام خواننده
+        file_path: مسیر فایل آهنگ
+        fingerprint: اثر انگشت صوتی (در موتور نشانه‌ای می‌تواند None باشد)
+        file_state: دیکشنری اختیاری شامل size، mtime و hash فایل؛ کلید replaces
+            شناسه رکوردی است که باید در همان تراکنش جایگزین شود
+        landmarks: تاپل اختیاری (hashes, offsets) از هش‌های نشانه‌ای آهنگ
+    """
+    add_songs([(title, artist, file_path, fingerprint, file_state, landmarks)])
+
+def _insert_songs(session, rows):
+    """درج دسته‌ای رکوردها با یک دستور و نادیده گرفتن تکراری‌ها بر اساس ایندکس یکتای (title, artist)
     
-    # ذخیره اثر انگشت به صورت باینری
-    fingerprint_binary = pickle.dumps(fingerprint)
+    Returns:
+        دیکشنری (title, artist) به شناسه رکوردهای درج شده
+    """
+    if not rows:
+        return {}
+    
+    table = Song.__table__
+    if engine.dialect.name in ('sqlite', 'postgresql'):
+        if engine.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(table).on_conflict_do_nothing(index_elements=['title', 'artist'])
+    else:
+        # دیتابیس‌های بدون upsert: حذف تکراری‌ها با یک پرس‌وجو پیش از درج
+        keys = [(row['title'], row['artist']) for row in rows]
+        existing = set()
+        for start in range(0, len(keys), 500):
+            existing.update(tuple(row) for row in session.execute(
+                table.select().with_only_columns(table.c.title, table.c.artist)
+                .where(tuple_(table.c.title, table.c.artist).in_(keys[start:start + 500]))
+            ))
+        rows = [row for row in rows if (row['title'], row['artist']) not in existing]
+        if not rows:
+            return {}
+        statement = insert(table)
+    
+    result = session.execute(statement.returning(table.c.id, table.c.title, table.c.artist), rows)
+    return {(row.title, row.artist): row.id for row in result}
+
+def add_songs(songs, verbose=True):
+    """افزودن دسته‌ای آهنگ‌ها به دیتابیس در یک تراکنش
+    
+    همه آهنگ‌های دسته با یک دستور درج می‌شوند و آهنگ‌های تکراری (عنوان و
+    خواننده یکسان) توسط ایندکس یکتای دیتابیس نادیده گرفته می‌شوند.
+    
+    Args:
+        songs: لیستی از تاپل‌های (title, artist, file_path, fingerprint) به ترتیب درج؛
+            اعضای پنجم و ششم اختیاری همان file_state و landmarks در add_song هستند
+        verbose: چاپ وضعیت هر آهنگ
+        
+    Returns:
+        تعداد آهنگ‌های جدید اضافه شده
+    """
+    rows = []
+    landmarks_by_key = {}
+    replaced_ids = []
+    seen = set()
+    layout_text = format_layout(current_layout())
+    
+    for title, artist, file_path, fingerprint, *rest in songs:
+        file_state = rest[0] if rest else None
+        landmarks = rest[1] if len(rest) > 1 else None
+        
+        # نسخه قبلی فایل تغییر یافته پیش از درج حذف می‌شود
+        if file_state and file_state.get('replaces') is not None:
+            replaced_ids.append(file_state['replaces'])
+        
+        # تکراری‌های همین دسته (تکراری‌های دیتابیس در هنگام درج نادیده گرفته می‌شوند)
+        if (title, artist) in seen:
+            if verbose:
+                print(f"آهنگ '{title}' از '{artist}' قبلاً در دیتابیس وجود دارد")
+            continue
+        seen.add((title, artist))
+        
+        # ذخیره اثر انگشت در قالب باینری فشرده همراه با چیدمان گروه‌های ویژگی فعال
+        fingerprint_binary = (
+            encode_fingerprint(fingerprint, FINGERPRINT_DTYPE, FEATURE_VERSION) if fingerprint is not None else None
+        )
+        rows.append({'title': title, 'artist': artist, 'file_path': file_path, 'fingerprint': fingerprint_binary,
+                     'feature_layout': layout_text if fingerprint is not None else None,
+                     **_file_state_columns(file_state)})
+        if landmarks is not None:
+            landmarks_by_key[(title, artist)] = landmarks
+    
+    session = Session()
+    if replaced_ids:
+        _delete_song_rows(session, replaced_ids)
+        _log_changes(session, 'delete', replaced_ids)
+    inserted = _insert_songs(session, rows)
+    _log_changes(session, 'add', sorted(inserted.values()))
+    
+    # ذخیره هش‌های نشانه‌ای همه آهنگ‌های جدید در ایندکس معکوس با یک دستور
+    landmark_rows = [
+        {'hash': int(h), 'song_id': inserted[key], 'offset': int(o)}
+        for key, (hashes, offsets) in landmarks_by_key.items() if key in inserted
+        for h, o in zip(hashes, offsets)
+    ]
+    if landmark_rows:
+        session.execute(insert(Landmark), landmark_rows)
     
-    # ایجاد رکورد جدید
-    new_song = Song(title=title, artist=artist, file_path=file_path, fingerprint=fingerprint_binary)
-    session.add(new_song)
     session.commit()
-    print(f"آهنگ '{title}' از '{artist}' با موفقیت به دیتابیس اضافه شد")
     session.close()
+    
+    if verbose:
+        for row in rows:
+            if (row['title'], row['artist']) in inserted:
+                print(f"آهنگ '{row['title']}' از '{row['artist']}' با موفقیت به دیتابیس اضافه شد")
+            else:
+                print(f"آهنگ '{row['title']}' از '{row['artist']}' قبلاً در دیتابیس وجود دارد")
+    return len(inserted)
 
 def get_all_songs():
     """دریافت همه آهنگ‌های موجود در دیتابیس"""
@@ -65,33 +283,426 @@ def get_song_by_id(song_id):
     session.close()
     return song
 
-def get_fingerprints():
-    """دریافت همه اثر انگشت‌های صوتی برای مقایسه"""
+def get_fingerprints(song_ids=None, chunk_size=500, raw=False):
+    """دریافت اثر انگشت‌های صوتی برای مقایسه
+    
+    هر اثر انگشت به چیدمان گروه‌های ویژگی فعال (FEATURE_GROUPS) برگردانده می‌شود؛
+    ستون‌های گروه‌های غیرفعال کنار گذاشته می‌شوند و آهنگ‌هایی که یکی از گروه‌های
+    فعال را با نسخه فعلی ندارند تا محاسبه دوباره آن (indexer.py --update) نادیده
+    گرفته می‌شوند.
+    
+    Args:
+        song_ids: شناسه آهنگ‌های مورد نظر (None یعنی همه آهنگ‌ها؛ شناسه‌های ناموجود نادیده گرفته می‌شوند)
+        chunk_size: تعداد شناسه‌ها در هر پرس‌وجو (محدودیت پارامترهای SQLite)
+        raw: بردار ذخیره شده بدون تغییر همراه با چیدمان آن (کلید layout) برگردانده شود
+    """
     session = Session()
-    songs = session.query(Song).all()
-    fingerprints = []
+    # آهنگ‌هایی که فقط با موتور نشانه‌ای ایندکس شده‌اند بردار ویژگی ندارند
+    query = session.query(Song.id, Song.title, Song.artist, Song.fingerprint, Song.feature_layout).filter(
+        Song.fingerprint.isnot(None)
+    )
+    if song_ids is None:
+        rows = query.all()
+    else:
+        song_ids = sorted({int(song_id) for song_id in song_ids})
+        rows = []
+        for start in range(0, len(song_ids), chunk_size):
+            rows.extend(query.filter(Song.id.in_(song_ids[start:start + chunk_size])).all())
+    session.close()
+    
+    if raw:
+        return [
+            {
+                'id': row.id,
+                'title': row.title,
+                'artist': row.artist,
+                'fingerprint': decode_fingerprint(row.fingerprint),
+                'layout': parse_layout(row.feature_layout),
+            }
+            for row in rows
+        ]
     
-    for song in songs:
-        fingerprint = pickle.loads(song.fingerprint)
+    # پهنا و ستون‌های لازم هر چیدمان ذخیره شده یک بار محاسبه می‌شوند
+    target = current_layout()
+    target_text = format_layout(target)
+    selections = {}
+    fingerprints = []
+    stale = 0
+    for row in rows:
+        if row.feature_layout not in selections:
+            stored = parse_layout(row.feature_layout)
+            selections[row.feature_layout] = (layout_width(stored), format_layout(stored) == target_text,
+                                              select_columns(stored, target))
+        width, same, selected = selections[row.feature_layout]
+        fingerprint = decode_fingerprint(row.fingerprint)
+        if selected is None or len(fingerprint) != width:
+            stale += 1
+            continue
         fingerprints.append({
-            'id': song.id,
-            'title': song.title,
-            'artist': song.artist,
-            'fingerprint': fingerprint
+            'id': row.id,
+            'title': row.title,
+            'artist': row.artist,
+            'fingerprint': fingerprint if same else fingerprint[selected]
         })
+    if stale:
+        print(f"{stale} اثر انگشت گروه‌های ویژگی فعلی را ندارد و نادیده گرفته شد؛ "
+              f"برای محاسبه دوباره فقط گروه‌های تغییر یافته indexer.py --update را اجرا کنید")
+    return fingerprints
+
+def get_feature_layouts():
+    """چیدمان گروه‌های ویژگی همه آهنگ‌های دارای اثر انگشت (بدون بارگذاری اثر انگشت‌ها)
     
+    Returns:
+        لیست دیکشنری‌های شامل id، file_path و layout (خروجی parse_layout)
+    """
+    session = Session()
+    rows = session.query(Song.id, Song.file_path, Song.feature_layout).filter(Song.fingerprint.isnot(None)).all()
     session.close()
-    return fingerprints
+    
+    layouts = {}
+    return [
+        {
+            'id': row.id,
+            'file_path': row.file_path,
+            'layout': layouts.setdefault(row.feature_layout, parse_layout(row.feature_layout)),
+        }
+        for row in rows
+    ]
+
+def update_fingerprints(updates):
+    """جایگزینی اثر انگشت چند آهنگ (پس از محاسبه دوباره گروه‌های ویژگی) در یک تراکنش
+    
+    Args:
+        updates: لیست تاپل‌های (song_id، بردار اثر انگشت، چیدمان آن)
+        
+    Returns:
+        تعداد آهنگ‌های به‌روز شده
+    """
+    rows = [
+        {'id': int(song_id), 'fingerprint': encode_fingerprint(fingerprint, FINGERPRINT_DTYPE, FEATURE_VERSION),
+         'feature_layout': format_layout(layout)}
+        for song_id, fingerprint, layout in updates
+    ]
+    if not rows:
+        return 0
+    session = Session()
+    session.execute(update(Song), rows)
+    # ربات‌ها و سرویس تطبیق بردار جدید را از لاگ تغییرات بارگذاری می‌کنند
+    _log_changes(session, 'update', [row['id'] for row in rows])
+    session.commit()
+    session.close()
+    return len(rows)
+
+def migrate_fingerprints(dtype=FINGERPRINT_DTYPE, batch_size=500, convert_dtype=False):
+    """تبدیل اثر انگشت‌های pickle شده قدیمی به قالب باینری جدید
+    
+    Args:
+        dtype: نوع داده ذخیره‌سازی ('float32' یا 'float16')
+        batch_size: تعداد رکوردها در هر تراکنش
+        convert_dtype: آیا رکوردهای قالب جدید با نوع داده متفاوت هم تبدیل شوند؟
+        
+    Returns:
+        تعداد رکوردهای تبدیل شده
+    """
+    session = Session()
+    query = session.query(Song.id, Song.fingerprint).filter(Song.fingerprint.isnot(None))
+    if not convert_dtype:
+        # فقط رکوردهایی که با سرآیند قالب جدید شروع نمی‌شوند
+        query = query.filter(func.substr(Song.fingerprint, 1, len(MAGIC)) != MAGIC)
+    
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = query.filter(Song.id > last_id).order_by(Song.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        
+        for row in rows:
+            if is_encoded(row.fingerprint):
+                if decode_header(row.fingerprint)['dtype'] == np.dtype(dtype).newbyteorder('<'):
+                    continue
+                fingerprint = decode_fingerprint(row.fingerprint)
+            else:
+                # فقط داده‌های قدیمی همین دیتابیس از pickle خوانده می‌شوند
+                fingerprint = pickle.loads(row.fingerprint)
+            session.query(Song).filter_by(id=row.id).update(
+                {'fingerprint': encode_fingerprint(fingerprint, dtype, FEATURE_VERSION)},
+                synchronize_session=False
+            )
+            migrated += 1
+        session.commit()
+    
+    session.close()
+    if migrated:
+        print(f"{migrated} اثر انگشت به قالب باینری جدید تبدیل شد")
+    return migrated
+
+def get_song_states(file_paths=None, titles=None, chunk_size=500):
+    """دریافت وضعیت فایل آهنگ‌ها بدون بارگذاری اثر انگشت‌ها
+    
+    Args:
+        file_paths: فقط آهنگ‌های این مسیرها (None یعنی همه آهنگ‌ها)
+        titles: آهنگ‌های این عنوان‌ها هم (همراه file_paths) برگردانده می‌شوند
+        chunk_size: تعداد مقادیر در هر پرس‌وجو (محدودیت پارامترهای SQLite)
+    
+    Returns:
+        لیست دیکشنری‌های شامل id، title، artist، file_path، size، mtime و hash
+    """
+    session = Session()
+    query = session.query(
+        Song.id, Song.title, Song.artist, Song.file_path,
+        Song.file_size, Song.file_mtime, Song.content_hash
+    )
+    if file_paths is None:
+        rows = query.all()
+    else:
+        rows = {}
+        for column, values in ((Song.file_path, sorted(set(file_paths))), (Song.title, sorted(set(titles or ())))):
+            for start in range(0, len(values), chunk_size):
+                rows.update((row.id, row) for row in query.filter(column.in_(values[start:start + chunk_size])))
+        rows = list(rows.values())
+    session.close()
+    
+    return [
+        {
+            'id': row.id,
+            'title': row.title,
+            'artist': row.artist,
+            'file_path': row.file_path,
+            'size': row.file_size,
+            'mtime': row.file_mtime,
+            'hash': row.content_hash
+        }
+        for row in rows
+    ]
+
+def library_signature():
+    """امضای کتابخانه: هش شناسه، عنوان، خواننده و هش محتوای همه آهنگ‌ها
+    
+    با هر افزودن، حذف، جایگزینی یا تغییر متادیتای آهنگ‌ها تغییر می‌کند و برای
+    تشخیص کهنه شدن نتایج کش شده پس از راه‌اندازی مجدد استفاده می‌شود.
+    """
+    session = Session()
+    rows = session.query(Song.id, Song.title, Song.artist, Song.content_hash).order_by(Song.id).all()
+    session.close()
+    
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()
+
+def update_song_file(song_id, file_path=None, title=None, artist=None, file_state=None):
+    """به‌روزرسانی مسیر، متادیتا یا وضعیت فایل یک آهنگ بدون تغییر اثر انگشت
+    
+    Args:
+        song_id: شناسه آهنگ
+        file_path: مسیر جدید فایل (اختیاری)
+        title: عنوان جدید (اختیاری)
+        artist: نام جدید خواننده (اختیاری)
+        file_state: دیکشنری size، mtime و hash فایل (اختیاری)
+    """
+    session = Session()
+    song = session.query(Song).filter_by(id=song_id).first()
+    if song is not None:
+        if file_path is not None:
+            song.file_path = file_path
+        if title is not None or artist is not None:
+            new_title = title if title is not None else song.title
+            new_artist = artist if artist is not None else song.artist
+            # ایندکس یکتا اجازه دو آهنگ با عنوان و خواننده یکسان را نمی‌دهد
+            duplicate = session.query(Song.id).filter(
+                Song.title == new_title, Song.artist == new_artist, Song.id != song_id
+            ).first()
+            if duplicate:
+                print(f"آهنگ '{new_title}' از '{new_artist}' قبلاً در دیتابیس وجود دارد؛ متادیتای آهنگ {song_id} تغییر نکرد")
+            elif (new_title, new_artist) != (song.title, song.artist):
+                song.title = new_title
+                song.artist = new_artist
+                # فایل ذخیره شده در تلگرام متادیتای قبلی را دارد
+                song.telegram_file_id = None
+                _log_changes(session, 'update', [song_id])
+        _apply_file_state(song, file_state)
+        session.commit()
+    session.close()
+
+def set_telegram_file_id(song_id, file_id):
+    """ذخیره یا پاک کردن شناسه فایل تلگرام یک آهنگ
+    
+    Args:
+        song_id: شناسه آهنگ
+        file_id: شناسه فایل برگردانده شده توسط تلگرام (None برای پاک کردن)
+    """
+    session = Session()
+    session.query(Song).filter_by(id=song_id).update({Song.telegram_file_id: file_id}, synchronize_session=False)
+    session.commit()
+    session.close()
+
+def delete_songs(song_ids):
+    """حذف آهنگ‌ها با شناسه‌های مشخص
+    
+    Args:
+        song_ids: لیست شناسه‌های آهنگ
+        
+    Returns:
+        تعداد رکوردهای حذف شده
+    """
+    song_ids = list(song_ids)
+    if not song_ids:
+        return 0
+    
+    session = Session()
+    deleted = _delete_song_rows(session, song_ids)
+    if deleted:
+        _log_changes(session, 'delete', song_ids)
+    session.commit()
+    session.close()
+    return deleted
+
+def get_landmark_matches(hashes, chunk_size=500):
+    """جستجوی هش‌ها در ایندکس معکوس
+    
+    Args:
+        hashes: آرایه هش‌های نشانه‌ای کلیپ
+        chunk_size: تعداد هش‌ها در هر پرس‌وجو (محدودیت پارامترهای SQLite)
+        
+    Returns:
+        لیست تاپل‌های (hash, song_id, offset) برای همه تطابق‌ها
+    """
+    unique_hashes = sorted({int(h) for h in hashes})
+    matches = []
+    
+    with engine.connect() as connection:
+        for start in range(0, len(unique_hashes), chunk_size):
+            chunk = unique_hashes[start:start + chunk_size]
+            rows = connection.execute(
+                Landmark.__table__.select()
+                .with_only_columns(Landmark.hash, Landmark.song_id, Landmark.offset)
+                .where(Landmark.hash.in_(chunk))
+            )
+            matches.extend(tuple(row) for row in rows)
+    
+    return matches
+
+def get_songs_by_ids(song_ids):
+    """دریافت چند آهنگ با شناسه‌های مشخص
+    
+    Returns:
+        دیکشنری شناسه به آهنگ
+    """
+    session = Session()
+    songs = session.query(Song).filter(Song.id.in_(list(song_ids))).all()
+    session.close()
+    return {song.id: song for song in songs}
 
 def clear_database():
     """پاک کردن همه رکوردها از دیتابیس"""
     session = Session()
+    session.query(Landmark).delete()
     session.query(Song).delete()
+    session.add(SongChange(song_id=None, op='clear'))
     session.commit()
     session.close()
     print("همه آهنگ‌ها از دیتابیس حذف شدند")
 
+def library_version():
+    """نسخه فعلی کتابخانه: شناسه آخرین تغییر ثبت شده (صفر برای لاگ خالی)
+    
+    فقط بیشینه کلید اصلی لاگ تغییرات خوانده می‌شود، بنابراین ربات می‌تواند آن را
+    به طور دوره‌ای و بدون هزینه قابل توجه بررسی کند.
+    """
+    session = Session()
+    version = session.query(func.max(SongChange.id)).scalar()
+    session.close()
+    return version or 0
+
+def get_changes(since):
+    """شناسه آهنگ‌هایی که پس از یک نسخه کتابخانه افزوده، حذف یا تغییر داده شده‌اند
+    
+    Args:
+        since: آخرین نسخه‌ای که خواننده دیده است
+        
+    Returns:
+        تاپل (آخرین نسخه، مجموعه شناسه آهنگ‌ها)؛ اگر تغییرات پس از since به طور کامل
+        در لاگ نباشد (لاگ هرس شده یا کل کتابخانه پاک شده) مجموعه None است و
+        خواننده باید همه آهنگ‌ها را دوباره بارگذاری کند.
+    """
+    session = Session()
+    latest, oldest = session.query(func.max(SongChange.id), func.min(SongChange.id)).one()
+    latest = latest or 0
+    if latest <= since:
+        session.close()
+        return latest, set()
+    
+    rows = session.query(SongChange.song_id, SongChange.op).filter(
+        SongChange.id > since, SongChange.id <= latest
+    ).all()
+    session.close()
+    if oldest > since + 1 or any(row.op == 'clear' for row in rows):
+        return latest, None
+    return latest, {row.song_id for row in rows}
+
+def prune_changes(keep=CHANGE_LOG_RETENTION):
+    """حذف تغییرات قدیمی لاگ (خواننده‌هایی که عقب‌تر باشند همه آهنگ‌ها را دوباره بارگذاری می‌کنند)
+    
+    Args:
+        keep: تعداد آخرین تغییراتی که نگه داشته می‌شوند (آخرین تغییر همیشه می‌ماند)
+        
+    Returns:
+        تعداد تغییرات حذف شده
+    """
+    session = Session()
+    latest = session.query(func.max(SongChange.id)).scalar() or 0
+    pruned = session.query(SongChange).filter(SongChange.id <= latest - max(keep, 1)).delete(synchronize_session=False)
+    session.commit()
+    session.close()
+    return pruned
+
+def vacuum_database():
+    """بازپس‌گیری فضای آزاد شده فایل SQLite پس از تبدیل یا حذف رکوردها"""
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+
+def export_fingerprint_matrix(path):
+    """ساخت فایل جانبی .npy از اثر انگشت‌های دیتابیس برای بارگذاری سریع
+    
+    Args:
+        path: مسیر فایل .npy
+        
+    Returns:
+        تعداد آهنگ‌های ذخیره شده
+    """
+    from fingerprint_index import FingerprintIndex
+    from reduction import configure_index
+    from cascade import configure_cascade
+    
+    # ماتریس با همان کاهش ابعاد، نوع ذخیره‌سازی و ستون‌های پیش‌فیلتر ایندکس ربات ذخیره می‌شود
+    index = FingerprintIndex()
+    configure_index(index)
+    configure_cascade(index)
+    index.reload()
+    index.save_matrix(path, FEATURE_VERSION)
+    print(f"ماتریس {len(index)} اثر انگشت در '{path}' ذخیره شد")
+    return len(index)
+
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='مدیریت دیتابیس آهنگ‌ها')
+    parser.add_argument('--migrate', action='store_true',
+                        help='تبدیل همه اثر انگشت‌ها به قالب باینری با نوع داده مشخص')
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default=FINGERPRINT_DTYPE,
+                        help='نوع داده ذخیره‌سازی اثر انگشت‌ها')
+    parser.add_argument('--export-matrix', type=str, default=None,
+                        help='ساخت فایل جانبی .npy برای بارگذاری سریع ماتریس اثر انگشت‌ها')
+    args = parser.parse_args()
+    
     # تست دیتابیس
     init_db()
+    if args.migrate:
+        migrate_fingerprints(args.dtype, convert_dtype=True)
+        vacuum_database()
+    if args.export_matrix:
+        export_fingerprint_matrix(args.export_matrix)
     print("دیتابیس آماده است") 
\ No newline at end of file
@@ -0,0 +1,641 @@
+"""
+ارزیابی دسته‌ای دقت و سرعت تشخیص روی مجموعه‌ای از کلیپ‌های برچسب‌دار
+
+ویژگی‌های همه کلیپ‌ها به صورت موازی در چند پردازه استخراج و سپس همه کوئری‌ها
+با یک ضرب ماتریس-ماتریس با کتابخانه مقایسه می‌شوند. خروجی شامل دقت top-1 و
+top-K، دقت و بازیابی (precision/recall) برای هر آستانه شباهت و زمان هر کلیپ
+است و می‌تواند در فایل‌های CSV و JSON ذخیره شود.
+
+برچسب کلیپ‌ها:
+    - پوشه: نام فایل با قالب «خواننده - عنوان» (مانند ایندکس‌گذاری)؛ هر چیزی پس از
+      «__» نادیده گرفته می‌شود (مثلاً «خواننده - عنوان__02.wav»)
+    - فایل CSV با ستون path و یکی از ستون‌های song_id یا title/artist؛ مسیرهای نسبی
+      نسبت به پوشه فایل CSV هستند
+
+کلیپ‌هایی که برچسبشان در کتابخانه نیست نمونه منفی هستند (نباید تطابقی پیدا شود).
+"""
+
+import os
+import csv
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+from config import FINGERPRINT_ENGINE, FINGERPRINT_MATRIX_PATH, SIMILARITY_THRESHOLD
+
+# آستانه‌های شباهتی که دقت و بازیابی برای آنها محاسبه می‌شود
+DEFAULT_THRESHOLDS = tuple(np.round(np.arange(0.50, 1.0001, 0.01), 2))
+
+
+def load_queries(source):
+    """خواندن لیست کلیپ‌ها و برچسب‌های آنها از یک پوشه یا فایل CSV
+
+    Args:
+        source: مسیر پوشه کلیپ‌ها یا فایل CSV
+
+    Returns:
+        لیست دیکشنری‌های شامل path و یکی از song_id یا (title, artist)
+    """
+    from indexer import get_audio_files, extract_metadata
+
+    if os.path.isdir(source):
+        queries = []
+        for path in sorted(get_audio_files(source)):
+            stem, extension = os.path.splitext(os.path.basename(path))
+            title, artist = extract_metadata(stem.split('__', 1)[0] + extension)
+            queries.append({'path': path, 'title': title, 'artist': artist})
+        return queries
+
+    base = os.path.dirname(os.path.abspath(source))
+    queries = []
+    with open(source, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            query = {'path': os.path.join(base, row['path'])}
+            if row.get('song_id'):
+                query['song_id'] = int(row['song_id'])
+            else:
+                query['title'] = (row.get('title') or '').strip()
+                query['artist'] = (row.get('artist') or '').strip()
+            queries.append(query)
+    return queries
+
+
+def cascade_query(path, groups):
+    """استخراج اثر انگشت کامل یک کلیپ در دو مرحله تطبیق دو مرحله‌ای (برای ثبت زمان هر مرحله)
+
+    Returns:
+        تاپل (کلید PCM، اثر انگشت کامل، زمان مراحل decode، preprocess، extract_prefilter و extract_rest)
+    """
+    from cascade import prefilter_query, complete_query
+
+    key, partial, preprocessed, timings = prefilter_query(path, groups)
+    if partial is None:
+        return key, None, timings
+    fingerprint, rest_timings = complete_query(preprocessed, partial, groups)
+    timings.update(rest_timings)
+    return key, fingerprint, timings
+
+
+def progressive_query(path, windows):
+    """استخراج اثر انگشت همه پنجره‌های تحلیل تدریجی یک کلیپ با یک بار رمزگشایی
+
+    Returns:
+        تاپل (کلید PCM، اثر انگشت کل کلیپ، زمان مراحل decode و extract کل کلیپ،
+        لیست (طول پنجره، اثر انگشت، زمان استخراج) همه پنجره‌ها)
+    """
+    from progressive import decode_query, window_schedule, window_query
+
+    key, decoded, timings = decode_query(path)
+    if decoded is None:
+        return key, None, timings, None
+    signal, sr = decoded
+    steps = []
+    for seconds in window_schedule(len(signal) / sr, windows):
+        fingerprint, window_timings = window_query(signal[:int(round(seconds * sr))], sr)
+        steps.append((seconds, fingerprint, window_timings['extract']))
+    timings['extract'] = steps[-1][2]
+    return key, steps[-1][1], timings, steps
+
+
+def extract_queries(paths, engine=FINGERPRINT_ENGINE, workers=1, cascade_groups=None, progressive_windows=None):
+    """استخراج موازی اثر انگشت کلیپ‌ها
+
+    Args:
+        paths: لیست مسیر کلیپ‌ها
+        engine: موتور اثر انگشت
+        workers: تعداد پردازه‌ها
+        cascade_groups: گروه‌های مرحله اول تطبیق دو مرحله‌ای؛ اگر تنظیم شود استخراج
+            (فقط موتور ویژگی‌ها) مانند ربات در دو مرحله و با زمان جداگانه انجام می‌شود
+        progressive_windows: طول پنجره‌های تحلیل تدریجی؛ اگر تنظیم شود (فقط موتور
+            ویژگی‌ها) اثر انگشت همه پنجره‌های هر کلیپ هم استخراج می‌شود
+
+    Returns:
+        لیست اثر انگشت‌ها (None برای کلیپ‌های خطادار)، لیست دیکشنری زمان مراحل هر کلیپ
+        و لیست پنجره‌های هر کلیپ (خروجی progressive_query یا None)
+    """
+    from result_cache import fingerprint_query
+
+    fingerprints = [None] * len(paths)
+    timings = [{} for _ in paths]
+    windows = [None] * len(paths)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        if progressive_windows is not None and engine == 'features':
+            futures = [pool.submit(progressive_query, path, progressive_windows) for path in paths]
+        elif cascade_groups is not None and engine == 'features':
+            futures = [pool.submit(cascade_query, path, cascade_groups) for path in paths]
+        else:
+            futures = [pool.submit(fingerprint_query, path, engine) for path in paths]
+        for i, future in enumerate(tqdm(futures, desc="استخراج ویژگی کلیپ‌ها")):
+            try:
+                _, fingerprints[i], timings[i], *steps = future.result()
+                windows[i] = steps[0] if steps else None
+            except Exception as e:
+                print(f"خطا در پردازش کلیپ {paths[i]}: {str(e)}")
+    return fingerprints, timings, windows
+
+
+def _library(engine):
+    """بارگذاری کتابخانه برای ارزیابی
+
+    Returns:
+        ایندکس اثر انگشت‌ها و دیکشنری (title, artist) به شناسه آهنگ
+    """
+    from database import init_db, get_song_states
+    from fingerprint_index import FingerprintIndex
+    from fingerprint_store import matrix_exists
+    from reduction import configure_index
+
+    init_db()
+    index = FingerprintIndex()
+    if engine == 'features':
+        # همان کاهش ابعاد و نوع ذخیره‌سازی ربات
+        configure_index(index)
+        loaded = False
+        if FINGERPRINT_MATRIX_PATH and matrix_exists(FINGERPRINT_MATRIX_PATH):
+            try:
+                index.load_matrix(FINGERPRINT_MATRIX_PATH)
+                loaded = True
+            except ValueError as e:
+                print(str(e))
+        if not loaded:
+            index.reload()
+    song_ids = {(state['title'], state['artist']): state['id'] for state in get_song_states()}
+    return index, song_ids
+
+
+def _rank_queries(index, fingerprints, engine, top_k):
+    """امتیازدهی همه کوئری‌ها
+
+    موتور ویژگی‌ها همه کوئری‌ها را با یک ضرب ماتریس-ماتریس مقایسه می‌کند؛ موتور
+    نشانه‌ای ایندکس معکوس دارد و هر کلیپ جداگانه جستجو می‌شود.
+
+    Returns:
+        شناسه‌ها و شباهت‌های top_k هر کوئری و زمان جستجوی هر کوئری (ثانیه)
+    """
+    ids = np.full((len(fingerprints), top_k), -1, dtype=np.int64)
+    similarities = np.full((len(fingerprints), top_k), -np.inf)
+    match_seconds = np.zeros(len(fingerprints))
+    ok = [i for i, fingerprint in enumerate(fingerprints) if fingerprint is not None]
+    if not ok:
+        return ids, similarities, match_seconds
+
+    if engine == 'landmark':
+        from landmark_fingerprint import match_landmarks
+        for i in ok:
+            start = time.perf_counter()
+            results = match_landmarks(fingerprints[i], top_k=top_k)
+            match_seconds[i] = time.perf_counter() - start
+            for rank, result in enumerate(results):
+                ids[i, rank] = result['id']
+                similarities[i, rank] = result['similarity']
+        return ids, similarities, match_seconds
+
+    start = time.perf_counter()
+    batch_ids, batch_similarities = index.search_batch(np.stack([fingerprints[i] for i in ok]), top_k=top_k)
+    # زمان ضرب ماتریس به طور مساوی بین کوئری‌ها تقسیم می‌شود
+    match_seconds[ok] = (time.perf_counter() - start) / len(ok)
+    width = batch_ids.shape[1]
+    ids[ok, :width] = batch_ids
+    similarities[ok, :width] = batch_similarities
+    return ids, similarities, match_seconds
+
+
+def _label_ranks(ids, labels):
+    """رتبه آهنگ درست در نتایج هر کلیپ (صفر یعنی در top_k نیست یا کلیپ منفی است)"""
+    return np.array([
+        int(np.nonzero(ids[i] == labels[i])[0][0]) + 1 if labels[i] >= 0 and labels[i] in ids[i] else 0
+        for i in range(len(labels))
+    ], dtype=np.int64)
+
+
+def compare_reductions(fingerprints, labels, top_k=5, repeat=3):
+    """اثر کاهش ابعاد و کوانتیزه‌سازی بر رتبه‌بندی نتایج کلیپ‌ها
+
+    کتابخانه یک بار با بردارهای کامل float32 و یک بار با بردارهای کاهش یافته در هر
+    نوع ذخیره‌سازی ایندکس می‌شود و نتایج همان کوئری‌ها با رتبه‌بندی بردار کامل
+    مقایسه می‌شوند. اگر تبدیل ذخیره شده‌ای وجود نداشته باشد، تبدیل روی همین
+    کتابخانه آموزش داده می‌شود.
+
+    Args:
+        fingerprints: اثر انگشت کلیپ‌ها (None برای کلیپ‌های خطادار)
+        labels: شناسه آهنگ درست هر کلیپ (-1 برای نمونه‌های منفی)
+        top_k: تعداد نتایج برتر
+        repeat: تعداد تکرار اندازه‌گیری زمان جستجو
+
+    Returns:
+        لیست دیکشنری‌های variant، dimension، bytes، search_ms، top1_accuracy، topk_accuracy،
+        top1_agreement و overlap (سهم top_k بردار کامل که در top_k حالت کاهش یافته هم هست)
+    """
+    from database import get_fingerprints
+    from fingerprint_index import FingerprintIndex, STORAGE_TYPES
+    from reduction import Projection, default_projection_path
+    from config import REDUCTION_PATH, REDUCTION_COMPONENTS
+
+    library = get_fingerprints()
+    ok = [i for i, fingerprint in enumerate(fingerprints) if fingerprint is not None]
+    if not library or not ok:
+        return []
+    queries = np.stack([fingerprints[i] for i in ok])
+    labels = np.asarray(labels)[ok]
+    positives = labels >= 0
+
+    path = REDUCTION_PATH or default_projection_path()
+    if os.path.exists(path):
+        projection = Projection.load(path)
+    else:
+        print(f"فایل تبدیل '{path}' پیدا نشد؛ تبدیل روی همین کتابخانه آموزش داده می‌شود")
+        projection = Projection.fit(np.stack([item['fingerprint'] for item in library]), REDUCTION_COMPONENTS)
+
+    rows = []
+    exact_ids = None
+    for variant, variant_projection, storage in [('full', None, 'float32')] + \
+            [(f'pca-{storage}', projection, storage) for storage in STORAGE_TYPES]:
+        index = FingerprintIndex()
+        index.set_reduction(variant_projection, storage)
+        index.load(library)
+        search_seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ids, _ = index.search_batch(queries, top_k=top_k)
+            search_seconds.append(time.perf_counter() - start)
+        if exact_ids is None:
+            exact_ids = ids
+        ranks = _label_ranks(ids, labels)
+        overlap = [len(set(row[row >= 0]) & set(exact[exact >= 0])) / max(int(np.sum(exact >= 0)), 1)
+                   for row, exact in zip(ids, exact_ids)]
+        rows.append({
+            'variant': variant,
+            'dimension': index.dimension,
+            'bytes': index.nbytes,
+            'search_ms': min(search_seconds) / len(queries) * 1000,
+            'top1_accuracy': float(np.mean(ranks[positives] == 1)) if positives.any() else None,
+            'topk_accuracy': float(np.mean(ranks[positives] >= 1)) if positives.any() else None,
+            'top1_agreement': float(np.mean(ids[:, 0] == exact_ids[:, 0])),
+            'overlap': float(np.mean(overlap)),
+        })
+    return rows
+
+
+def compare_cascade(fingerprints, labels, shortlists, groups=None, top_k=5, timings=None):
+    """فراخوانی دوباره (recall) و زمان هر مرحله تطبیق دو مرحله‌ای برای چند اندازه فهرست کوتاه
+
+    کتابخانه با بردارهای کامل و ستون‌های پیش‌فیلتر ایندکس می‌شود. برای هر کلیپ فهرست
+    کوتاه با ستون‌های مرحله اول ساخته و فقط همان کاندیدها با بردار کامل رتبه‌بندی
+    می‌شوند؛ نتایج با جستجوی دقیق روی کل کتابخانه مقایسه می‌شوند.
+
+    Args:
+        fingerprints: اثر انگشت کامل کلیپ‌ها (None برای کلیپ‌های خطادار)
+        labels: شناسه آهنگ درست هر کلیپ (-1 برای نمونه‌های منفی)
+        shortlists: اندازه‌های فهرست کوتاه
+        groups: گروه‌های ویژگی مرحله اول (پیش‌فرض CASCADE_GROUPS)
+        top_k: تعداد نتایج برتر
+        timings: زمان مراحل استخراج هر کلیپ (خروجی extract_queries با cascade_groups)
+
+    Returns:
+        دیکشنری شامل groups، زمان میانگین استخراج مرحله اول و دوم و لیست rows با
+        shortlist، label_recall (سهم کلیپ‌های مثبتی که آهنگ درستشان در فهرست کوتاه است)،
+        exact_recall (سهم کلیپ‌هایی که نتیجه اول جستجوی کامل در فهرست کوتاه است)،
+        top1_accuracy، top1_agreement، skipped (سهم کلیپ‌هایی که مرحله دوم لازم نشد)،
+        prefilter_ms و rerank_ms
+    """
+    from database import get_fingerprints
+    from fingerprint_index import FingerprintIndex
+    from cascade import group_columns
+    from config import CASCADE_GROUPS, CASCADE_MIN_SIMILARITY
+
+    groups = groups or CASCADE_GROUPS
+    library = get_fingerprints()
+    ok = [i for i, fingerprint in enumerate(fingerprints) if fingerprint is not None]
+    if not library or not ok:
+        return {}
+    queries = np.stack([fingerprints[i] for i in ok])
+    labels = np.asarray(labels)[ok]
+    positives = labels >= 0
+
+    columns = group_columns(groups)
+    index = FingerprintIndex()
+    index.set_prefilter(columns)
+    index.load(library)
+    exact_ids, _ = index.search_batch(queries, top_k=top_k)
+
+    rows = []
+    for size in shortlists:
+        ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        label_found = np.zeros(len(queries), dtype=bool)
+        exact_found = np.zeros(len(queries), dtype=bool)
+        skipped = np.zeros(len(queries), dtype=bool)
+        prefilter_seconds = 0.0
+        rerank_seconds = 0.0
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            candidates, _ = index.shortlist(query[columns], size, CASCADE_MIN_SIMILARITY)
+            prefilter_seconds += time.perf_counter() - start
+            label_found[i] = labels[i] in candidates
+            exact_found[i] = exact_ids[i, 0] in candidates
+            if len(candidates) == 0:
+                skipped[i] = True
+                continue
+            start = time.perf_counter()
+            results = index.search(query, threshold=-np.inf, top_k=top_k, candidates=candidates)
+            rerank_seconds += time.perf_counter() - start
+            ids[i, :len(results)] = [result['id'] for result in results]
+        ranks = _label_ranks(ids, labels)
+        rows.append({
+            'shortlist': int(size),
+            'label_recall': float(np.mean(label_found[positives])) if positives.any() else None,
+            'exact_recall': float(np.mean(exact_found)),
+            'top1_accuracy': float(np.mean(ranks[positives] == 1)) if positives.any() else None,
+            'top1_agreement': float(np.mean(ids[:, 0] == exact_ids[:, 0])),
+            'skipped': float(np.mean(skipped)),
+            'prefilter_ms': prefilter_seconds / len(queries) * 1000,
+            'rerank_ms': rerank_seconds / max(int(np.sum(~skipped)), 1) * 1000,
+        })
+
+    stage_timings = [timings[i] for i in ok] if timings is not None else []
+    return {
+        'groups': list(groups),
+        'prefilter_dimension': len(columns),
+        'extract_prefilter_seconds': float(np.mean([t.get('preprocess', 0.0) + t.get('extract_prefilter', 0.0)
+                                                    for t in stage_timings])) if stage_timings else None,
+        'extract_rest_seconds': float(np.mean([t.get('extract_rest', 0.0) for t in stage_timings]))
+        if stage_timings else None,
+        'rows': rows,
+    }
+
+
+def compare_progressive(index, windows, labels, margins, window_lengths):
+    """دقت و طول پنجره لازم در تحلیل تدریجی برای چند حداقل فاصله اطمینان
+
+    همه پنجره‌های هر کلیپ مانند ربات (بدون آستانه، دست کم دو نتیجه) جستجو می‌شوند و
+    برای هر margin اولین پنجره‌ای که نتیجه‌اش مطمئن است (یا کل کلیپ) انتخاب می‌شود.
+    نتیجه گزارش شده با نتیجه کل کلیپ مقایسه می‌شود.
+
+    Args:
+        index: ایندکس کتابخانه (خروجی _library)
+        windows: پنجره‌های هر کلیپ (خروجی extract_queries با progressive_windows)
+        labels: شناسه آهنگ درست هر کلیپ (-1 برای نمونه‌های منفی)
+        margins: مقادیر حداقل فاصله شباهت نتیجه اول از دوم
+        window_lengths: طول پنجره‌های پیش از کل کلیپ (ثانیه)
+
+    Returns:
+        دیکشنری شامل windows، زمان میانگین استخراج کل کلیپ و لیست rows با margin،
+        top1_accuracy، top1_agreement، false_positives (سهم نمونه‌های منفی با نتیجه)،
+        audio_seconds و extract_seconds میانگین (مجموع همه پنجره‌های استخراج شده) و
+        distribution (سهم کلیپ‌ها به تفکیک پنجره لازم)
+    """
+    from progressive import window_label, confident
+
+    ok = [i for i, steps in enumerate(windows) if steps]
+    if len(index) == 0 or not ok:
+        return {}
+    labels = np.asarray(labels)[ok]
+    positives = labels >= 0
+
+    # نتایج همه پنجره‌ها یک بار محاسبه می‌شوند
+    ranked = [[index.search(fingerprint, threshold=-np.inf, top_k=2) for _, fingerprint, _ in windows[i]]
+              for i in ok]
+
+    def reported(results):
+        return results[0]['id'] if results and results[0]['similarity'] >= SIMILARITY_THRESHOLD else -1
+
+    full_ids = np.array([reported(steps[-1]) for steps in ranked])
+    rows = []
+    for margin in margins:
+        ids = np.full(len(ok), -1, dtype=np.int64)
+        audio_seconds = np.zeros(len(ok))
+        extract_seconds = np.zeros(len(ok))
+        distribution = {}
+        for row, (i, steps) in enumerate(zip(ok, ranked)):
+            for step, results in enumerate(steps):
+                if confident(results, margin) or step == len(steps) - 1:
+                    break
+            seconds = windows[i][step][0]
+            ids[row] = reported(steps[step])
+            audio_seconds[row] = seconds
+            extract_seconds[row] = sum(extract for _, _, extract in windows[i][:step + 1])
+            label = window_label(seconds, window_lengths)
+            distribution[label] = distribution.get(label, 0) + 1
+        rows.append({
+            'margin': float(margin),
+            'top1_accuracy': float(np.mean(ids[positives] == labels[positives])) if positives.any() else None,
+            'top1_agreement': float(np.mean(ids == full_ids)),
+            'false_positives': float(np.mean(ids[~positives] >= 0)) if (~positives).any() else None,
+            'audio_seconds': float(np.mean(audio_seconds)),
+            'extract_seconds': float(np.mean(extract_seconds)),
+            'distribution': {label: count / len(ok) for label, count in distribution.items()},
+        })
+    return {
+        'windows': [f'{seconds:g}' for seconds in sorted(set(window_lengths))],
+        'full_extract_seconds': float(np.mean([windows[i][-1][2] for i in ok])),
+        'rows': rows,
+    }
+
+
+def precision_recall(top_ids, top_similarities, labels, thresholds=DEFAULT_THRESHOLDS):
+    """دقت و بازیابی نتیجه اول برای هر آستانه
+
+    در هر آستانه، نتیجه اول کلیپ فقط اگر شباهتش از آستانه کمتر نباشد گزارش می‌شود
+    (مانند ربات). گزارش درست یعنی نتیجه اول همان آهنگ برچسب باشد.
+
+    Args:
+        top_ids: شناسه نتیجه اول هر کلیپ (-1 یعنی بدون نتیجه)
+        top_similarities: شباهت نتیجه اول هر کلیپ
+        labels: شناسه آهنگ درست هر کلیپ (-1 برای نمونه‌های منفی)
+        thresholds: آستانه‌های شباهت
+
+    Returns:
+        لیست دیکشنری‌های threshold، precision، recall، f1، true_positives و false_positives
+    """
+    correct = (top_ids == labels) & (labels >= 0)
+    positives = int(np.sum(labels >= 0))
+    curve = []
+    for threshold in thresholds:
+        reported = (top_ids >= 0) & (top_similarities >= threshold)
+        true_positives = int(np.sum(reported & correct))
+        false_positives = int(np.sum(reported & ~correct))
+        precision = true_positives / (true_positives + false_positives) if true_positives + false_positives else 1.0
+        recall = true_positives / positives if positives else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        curve.append({
+            'threshold': float(threshold),
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            'true_positives': true_positives,
+            'false_positives': false_positives,
+        })
+    return curve
+
+
+def evaluate(source, engine=FINGERPRINT_ENGINE, workers=1, top_k=5, thresholds=DEFAULT_THRESHOLDS,
+             reduction=False, cascade=None, progressive=None):
+    """ارزیابی دسته‌ای کلیپ‌های برچسب‌دار
+
+    Args:
+        source: پوشه کلیپ‌ها یا فایل CSV
+        engine: موتور اثر انگشت
+        workers: تعداد پردازه‌های استخراج ویژگی
+        top_k: تعداد نتایج برتر برای دقت top-K
+        thresholds: آستانه‌های شباهت برای منحنی دقت و بازیابی
+        reduction: مقایسه رتبه‌بندی بردار کامل با بردارهای کاهش یافته (فقط موتور ویژگی‌ها)
+        cascade: اندازه‌های فهرست کوتاه برای گزارش تطبیق دو مرحله‌ای (فقط موتور ویژگی‌ها)
+        progressive: مقادیر حداقل فاصله اطمینان برای گزارش تحلیل تدریجی با پنجره‌های
+            PROGRESSIVE_WINDOWS (فقط موتور ویژگی‌ها)
+
+    Returns:
+        دیکشنری شامل summary، curve و clips (و reduction، cascade و progressive در صورت درخواست)
+    """
+    queries = load_queries(source)
+    index, song_ids = _library(engine)
+    titles = {song_id: key for key, song_id in song_ids.items()}
+    print(f"{len(queries)} کلیپ و {len(song_ids)} آهنگ در کتابخانه")
+
+    start = time.perf_counter()
+    from config import CASCADE_GROUPS, PROGRESSIVE_WINDOWS
+    fingerprints, timings, windows = extract_queries([query['path'] for query in queries], engine, workers,
+                                                     CASCADE_GROUPS if cascade else None,
+                                                     PROGRESSIVE_WINDOWS if progressive else None)
+    extract_wall = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ids, similarities, match_seconds = _rank_queries(index, fingerprints, engine, top_k)
+    match_wall = time.perf_counter() - start
+
+    labels = np.array([
+        query['song_id'] if 'song_id' in query and query['song_id'] in titles
+        else song_ids.get((query.get('title'), query.get('artist')), -1)
+        for query in queries
+    ], dtype=np.int64)
+    failed = np.array([fingerprint is None for fingerprint in fingerprints])
+    ranks = _label_ranks(ids, labels)
+
+    clips = []
+    for i, query in enumerate(queries):
+        decode = timings[i].get('decode', 0.0)
+        extract = sum(seconds for stage, seconds in timings[i].items() if stage != 'decode')
+        top_id = int(ids[i, 0]) if top_k else -1
+        clips.append({
+            'path': query['path'],
+            'label_id': int(labels[i]),
+            'label': ' - '.join(reversed(titles[labels[i]])) if labels[i] >= 0 else '',
+            'top1_id': top_id,
+            'top1': ' - '.join(reversed(titles[top_id])) if top_id in titles else '',
+            'top1_similarity': float(similarities[i, 0]) if top_id >= 0 else None,
+            'label_rank': int(ranks[i]),
+            'error': bool(failed[i]),
+            'decode_seconds': decode,
+            'extract_seconds': extract,
+            'match_seconds': float(match_seconds[i]),
+            'total_seconds': decode + extract + float(match_seconds[i]),
+        })
+
+    positives = labels >= 0
+    n_positives = int(np.sum(positives))
+    curve = precision_recall(ids[:, 0], similarities[:, 0], labels, thresholds)
+    best = max(curve, key=lambda point: point['f1']) if curve else None
+    totals = np.array([clip['total_seconds'] for clip in clips if not clip['error']]) if clips else np.zeros(0)
+    summary = {
+        'clips': len(queries),
+        'positives': n_positives,
+        'negatives': int(len(queries) - n_positives),
+        'errors': int(np.sum(failed)),
+        'library_songs': len(song_ids),
+        'engine': engine,
+        'top_k': top_k,
+        'top1_accuracy': float(np.mean(ranks[positives] == 1)) if n_positives else 0.0,
+        f'top{top_k}_accuracy': float(np.mean(ranks[positives] >= 1)) if n_positives else 0.0,
+        'current_threshold': SIMILARITY_THRESHOLD,
+        'best_threshold': best['threshold'] if best else None,
+        'best_f1': best['f1'] if best else None,
+        'latency_p50': float(np.percentile(totals, 50)) if len(totals) else None,
+        'latency_p95': float(np.percentile(totals, 95)) if len(totals) else None,
+        'extract_wall_seconds': extract_wall,
+        'match_wall_seconds': match_wall,
+    }
+    report = {'summary': summary, 'curve': curve, 'clips': clips}
+    if reduction and engine == 'features':
+        report['reduction'] = compare_reductions(fingerprints, labels, top_k)
+    if cascade and engine == 'features':
+        report['cascade'] = compare_cascade(fingerprints, labels, cascade, top_k=top_k, timings=timings)
+    if progressive and engine == 'features':
+        report['progressive'] = compare_progressive(index, windows, labels, progressive, PROGRESSIVE_WINDOWS)
+    return report
+
+
+def write_csv(report, path):
+    """ذخیره نتیجه هر کلیپ در فایل CSV"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(report['clips'][0].keys()) if report['clips'] else ['path'])
+        writer.writeheader()
+        writer.writerows(report['clips'])
+
+
+def write_json(report, path):
+    """ذخیره کل گزارش (خلاصه، منحنی دقت و بازیابی و نتیجه کلیپ‌ها) در فایل JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+def print_report(report):
+    """نمایش خلاصه ارزیابی"""
+    summary = report['summary']
+    print(f"\nارزیابی {summary['clips']} کلیپ ({summary['positives']} مثبت، {summary['negatives']} منفی، "
+          f"{summary['errors']} خطا) روی {summary['library_songs']} آهنگ:")
+    print(f"- دقت top-1: {summary['top1_accuracy']:.1%}")
+    top_k_key = f"top{summary['top_k']}_accuracy"
+    print(f"- دقت top-{summary['top_k']}: {summary[top_k_key]:.1%}")
+    if summary['latency_p50'] is not None:
+        print(f"- زمان هر کلیپ: p50={summary['latency_p50']:.3f}s، p95={summary['latency_p95']:.3f}s "
+              f"(جستجوی همه کوئری‌ها: {summary['match_wall_seconds']:.3f}s)")
+
+    print(f"\n{'threshold':>9} {'precision':>9} {'recall':>7} {'f1':>6}")
+    for point in report['curve']:
+        marker = ''
+        if point['threshold'] == summary['best_threshold']:
+            marker = '  <- بهترین F1'
+        elif abs(point['threshold'] - summary['current_threshold']) < 1e-9:
+            marker = '  <- آستانه فعلی'
+        print(f"{point['threshold']:>9.2f} {point['precision']:>9.3f} {point['recall']:>7.3f} {point['f1']:>6.3f}{marker}")
+
+    if report.get('reduction'):
+        print("\nاثر کاهش ابعاد بر رتبه‌بندی (نسبت به بردار کامل):")
+        print(f"{'variant':>13} {'dim':>5} {'KiB':>9} {'ms/query':>9} {'top1':>6} {'top-k':>6} {'agree':>6} {'overlap':>7}")
+        for row in report['reduction']:
+            top1 = f"{row['top1_accuracy']:.3f}" if row['top1_accuracy'] is not None else '-'
+            top_k = f"{row['topk_accuracy']:.3f}" if row['topk_accuracy'] is not None else '-'
+            print(f"{row['variant']:>13} {row['dimension']:>5} {row['bytes'] / 1024:>9.1f} {row['search_ms']:>9.3f} "
+                  f"{top1:>6} {top_k:>6} {row['top1_agreement']:>6.3f} {row['overlap']:>7.3f}")
+
+    if report.get('cascade'):
+        cascade = report['cascade']
+        print(f"\nتطبیق دو مرحله‌ای (مرحله اول: {', '.join(cascade['groups'])}، "
+              f"{cascade['prefilter_dimension']} بعد):")
+        if cascade['extract_prefilter_seconds'] is not None:
+            print(f"- زمان استخراج مرحله اول (با پیش‌پردازش): {cascade['extract_prefilter_seconds']:.3f}s، "
+                  f"مرحله دوم: {cascade['extract_rest_seconds']:.3f}s")
+        print(f"{'shortlist':>9} {'label':>6} {'exact':>6} {'top1':>6} {'agree':>6} {'skip':>6} "
+              f"{'ms/pre':>7} {'ms/rerank':>9}")
+        for row in cascade['rows']:
+            label = f"{row['label_recall']:.3f}" if row['label_recall'] is not None else '-'
+            top1 = f"{row['top1_accuracy']:.3f}" if row['top1_accuracy'] is not None else '-'
+            print(f"{row['shortlist']:>9} {label:>6} {row['exact_recall']:>6.3f} {top1:>6} "
+                  f"{row['top1_agreement']:>6.3f} {row['skipped']:>6.3f} {row['prefilter_ms']:>7.3f} "
+                  f"{row['rerank_ms']:>9.3f}")
+
+    if report.get('progressive'):
+        progressive = report['progressive']
+        print(f"\nتحلیل تدریجی (پنجره‌ها: {', '.join(progressive['windows'])} ثانیه و کل کلیپ؛ "
+              f"استخراج کل کلیپ: {progressive['full_extract_seconds']:.3f}s):")
+        labels = [f"{seconds}s" for seconds in progressive['windows']] + ['full']
+        print(f"{'margin':>6} {'top1':>6} {'agree':>6} {'fp':>6} {'audio_s':>7} {'extract_s':>9} " +
+              ' '.join(f"{label:>6}" for label in labels))
+        for row in progressive['rows']:
+            top1 = f"{row['top1_accuracy']:.3f}" if row['top1_accuracy'] is not None else '-'
+            false_positives = f"{row['false_positives']:.3f}" if row['false_positives'] is not None else '-'
+            print(f"{row['margin']:>6.3f} {top1:>6} {row['top1_agreement']:>6.3f} {false_positives:>6} "
+                  f"{row['audio_seconds']:>7.1f} {row['extract_seconds']:>9.3f} " +
+                  ' '.join(f"{row['distribution'].get(label, 0.0):>6.3f}" for label in labels))
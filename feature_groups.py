@@ -0,0 +1,211 @@
+"""
+فهرست نسخه‌دار گروه‌های ویژگی بردار اثر انگشت
+
+هر گروه (MFCC و مشتق‌ها، chroma، contrast، mel، zcr، rolloff، bandwidth و tempogram)
+با پارامترهایی که خروجی‌اش به آنها وابسته است ثبت می‌شود و نسخه آن هش همین
+پارامترها (به همراه نرخ نمونه‌برداری، مدت تحلیل و پیش‌پردازش مشترک) است. چیدمان
+بردار هر آهنگ (نام، نسخه و پهنای هر گروه به ترتیب) کنار اثر انگشتش ذخیره می‌شود،
+بنابراین پس از تغییر تنظیمات فقط گروه‌هایی که نسخه‌شان عوض شده دوباره محاسبه
+می‌شوند و غیرفعال کردن یک گروه (`FEATURE_GROUPS`) فقط ستون‌های آن را کنار می‌گذارد.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+
+from config import SAMPLE_RATE, DURATION, HOP_LENGTH, N_FFT, N_MELS, FEATURE_GROUPS
+
+# پیش‌پردازش مشترک همه گروه‌ها در preprocess_signal (با تغییر آن همه نسخه‌ها عوض می‌شوند)
+PREPROCESS = 'normalize,nn_filter(median,cosine)'
+
+
+class FeatureGroup:
+    """یک گروه ویژگی ثبت شده
+
+    هر سطر ویژگی با میانگین و انحراف معیار خلاصه می‌شود، بنابراین پهنای گروه در
+    بردار دو برابر تعداد سطرهای آن است. با تغییر کد استخراج یک گروه، revision آن
+    را افزایش دهید.
+    """
+
+    def __init__(self, name, rows, params, revision=1, stft=False):
+        """
+        Args:
+            name: نام گروه
+            rows: تعداد سطرهای ویژگی پیش از خلاصه‌سازی
+            params: پارامترهایی که خروجی گروه به آنها وابسته است
+            revision: نسخه کد استخراج گروه
+            stft: آیا گروه از STFT مشترک استفاده می‌کند؟
+        """
+        self.name = name
+        self.rows = rows
+        self.params = params
+        self.revision = revision
+        self.stft = stft
+
+    @property
+    def width(self):
+        """تعداد ستون‌های گروه در بردار اثر انگشت"""
+        return 2 * self.rows
+
+    @property
+    def version(self):
+        """هش کوتاه نام، revision و پارامترهای گروه"""
+        payload = json.dumps({'name': self.name, 'revision': self.revision, 'params': self.params}, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:8]
+
+    def __repr__(self):
+        return f"<FeatureGroup({self.name}, {self.width} ستون، نسخه {self.version})>"
+
+
+def build_registry(sr=SAMPLE_RATE, duration=DURATION, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS):
+    """همه گروه‌های ویژگی به ترتیب قرارگیری در بردار اثر انگشت
+
+    Returns:
+        لیست FeatureGroup
+    """
+    common = {'sr': sr, 'duration': duration, 'preprocess': PREPROCESS}
+    stft = {**common, 'n_fft': n_fft, 'hop_length': hop_length}
+    return [
+        # 20 ضریب MFCC به همراه مشتق اول و دوم از طیف‌نگار mel با 128 فیلتر پیش‌فرض librosa
+        FeatureGroup('mfcc', 60, {**stft, 'n_mfcc': 20, 'n_mels': 128}, stft=True),
+        FeatureGroup('chroma', 12, {**common, 'method': 'cqt', 'hop_length': hop_length}),
+        FeatureGroup('contrast', 7, {**stft, 'n_bands': 6}, stft=True),
+        FeatureGroup('mel', n_mels, {**stft, 'n_mels': n_mels}, stft=True),
+        # قاب‌بندی پیش‌فرض librosa
+        FeatureGroup('zcr', 1, {**common, 'frame_length': 2048, 'hop_length': 512}),
+        FeatureGroup('rolloff', 1, {**stft, 'roll_percent': 0.85}, stft=True),
+        FeatureGroup('bandwidth', 1, stft, stft=True),
+        # طول پنجره پیش‌فرض librosa
+        FeatureGroup('tempogram', 384, {**common, 'hop_length': hop_length, 'win_length': 384}),
+    ]
+
+
+# گروه‌های ثبت شده با تنظیمات فعلی
+REGISTRY = build_registry()
+GROUPS = {group.name: group for group in REGISTRY}
+GROUP_NAMES = tuple(GROUPS)
+
+
+def enabled_groups(names=FEATURE_GROUPS):
+    """گروه‌های فعال به ترتیب بردار اثر انگشت
+
+    Args:
+        names: نام گروه‌های فعال
+
+    Returns:
+        لیست FeatureGroup
+    """
+    unknown = set(names) - set(GROUPS)
+    if unknown:
+        raise ValueError(f"گروه ویژگی ناشناخته: {', '.join(sorted(unknown))}")
+    if not names:
+        raise ValueError("دست کم یک گروه ویژگی باید فعال باشد")
+    return [group for group in REGISTRY if group.name in names]
+
+
+def current_layout(names=FEATURE_GROUPS):
+    """چیدمان بردار اثر انگشت با گروه‌های فعال
+
+    Returns:
+        لیست تاپل‌های (نام، نسخه، پهنا)
+    """
+    return [(group.name, group.version, group.width) for group in enabled_groups(names)]
+
+
+# چیدمان اثر انگشت‌هایی که پیش از ثبت چیدمان هر آهنگ ذخیره شده‌اند: همه گروه‌ها با
+# تنظیمات پیش‌فرض همان زمان
+LEGACY_LAYOUT = [(group.name, group.version, group.width)
+                 for group in build_registry(sr=44100, duration=45, n_fft=4096, hop_length=256, n_mels=256)]
+
+
+def format_layout(layout):
+    """تبدیل چیدمان به متن فشرده ذخیره شده در دیتابیس (name:version:width با جداکننده کاما)"""
+    return ','.join(f'{name}:{version}:{width}' for name, version, width in layout)
+
+
+def parse_layout(text):
+    """خواندن چیدمان ذخیره شده (None یعنی اثر انگشت قدیمی با LEGACY_LAYOUT)"""
+    if not text:
+        return LEGACY_LAYOUT
+    layout = []
+    for item in text.split(','):
+        name, version, width = item.split(':')
+        layout.append((name, version, int(width)))
+    return layout
+
+
+def layout_width(layout):
+    """تعداد ستون‌های بردار با یک چیدمان"""
+    return sum(width for _, _, width in layout)
+
+
+def layout_signature(layout=None):
+    """هش کوتاه چیدمان (پیش‌فرض: چیدمان فعلی) برای نسل کش نتایج و فایل‌های جانبی"""
+    text = format_layout(current_layout() if layout is None else layout)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+def column_ranges(layout=None):
+    """محدوده ستون‌های هر گروه در بردار
+
+    Returns:
+        دیکشنری نام گروه به (ستون شروع، ستون پایان)
+    """
+    ranges = {}
+    start = 0
+    for name, _, width in current_layout() if layout is None else layout:
+        ranges[name] = (start, start + width)
+        start += width
+    return ranges
+
+
+def missing_groups(stored, target):
+    """گروه‌های چیدمان target که با همان نسخه در چیدمان ذخیره شده نیستند"""
+    available = {(name, version) for name, version, _ in stored}
+    return [name for name, version, _ in target if (name, version) not in available]
+
+
+def select_columns(stored, target):
+    """شماره ستون‌های بردار ذخیره شده که بردار با چیدمان target را می‌سازند
+
+    Args:
+        stored: چیدمان بردار ذخیره شده
+        target: چیدمان مورد نیاز
+
+    Returns:
+        آرایه شماره ستون‌ها، یا None اگر گروهی از target با همان نسخه ذخیره نشده باشد
+    """
+    if missing_groups(stored, target):
+        return None
+    ranges = column_ranges(stored)
+    return np.concatenate([np.arange(*ranges[name]) for name, _, _ in target])
+
+
+def merge_groups(stored_vector, stored, computed_vector, computed, target):
+    """ساخت بردار با چیدمان target از بردار ذخیره شده و گروه‌های تازه محاسبه شده
+
+    گروه‌های ذخیره شده‌ای که در target نیستند ولی نسخه‌شان هنوز معتبر است پس از
+    گروه‌های target نگه داشته می‌شوند تا فعال کردن دوباره آنها محاسبه لازم نداشته باشد.
+
+    Args:
+        stored_vector: بردار ذخیره شده
+        stored: چیدمان بردار ذخیره شده
+        computed_vector: بردار گروه‌های تازه محاسبه شده
+        computed: چیدمان computed_vector
+        target: چیدمان مورد نیاز
+
+    Returns:
+        تاپل (بردار جدید، چیدمان آن)
+    """
+    current = {group.name: group.version for group in REGISTRY}
+    parts = {}
+    for layout, vector in ((stored, stored_vector), (computed, computed_vector)):
+        ranges = column_ranges(layout)
+        for name, version, width in layout:
+            if current.get(name) == version:
+                parts[name] = ((name, version, width), vector[slice(*ranges[name])])
+    target_names = [name for name, _, _ in target]
+    names = target_names + [name for name in GROUP_NAMES if name in parts and name not in target_names]
+    layout = [parts[name][0] for name in names]
+    return np.concatenate([parts[name][1] for name in names]), layout
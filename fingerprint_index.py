@@ -0,0 +1,735 @@
+"""
+ایندکس برداری اثر انگشت‌های صوتی که یک بار در حافظه بارگذاری می‌شود
+و هر جستجو را با یک ضرب ماتریس-بردار انجام می‌دهد
+"""
+
+import time
+import threading
+import numpy as np
+
+from config import SIMILARITY_THRESHOLD
+
+# وزن‌های ترکیب شباهت کسینوسی و اقلیدسی (همان وزن‌های compare_fingerprints)
+COSINE_WEIGHT = 0.7
+EUCLIDEAN_WEIGHT = 0.3
+
+# نوع داده‌های ذخیره ماتریس ایندکس در حافظه
+STORAGE_TYPES = ('float32', 'float16', 'int8')
+
+
+def normalize_rows(matrix):
+    """نرمال‌سازی سطرهای یک ماتریس به طول واحد
+
+    Args:
+        matrix: ماتریس دوبعدی (هر سطر یک اثر انگشت)
+
+    Returns:
+        ماتریس نرمال‌شده و آرایه بولی سطرهای معتبر (سطرهای با طول صفر نامعتبرند)
+    """
+    norms = np.linalg.norm(matrix, axis=1)
+    valid = norms > 0
+    matrix[valid] /= norms[valid, np.newaxis]
+    matrix[~valid] = 0
+    return matrix, valid
+
+
+def quantize_rows(matrix, storage='float32'):
+    """ذخیره سطرهای نرمال‌شده با نوع داده کم‌حجم‌تر
+
+    در حالت int8 هر سطر با ضریب مقیاس خودش (max|x|/127) کوانتیزه می‌شود و مقدار
+    تقریبی سطر برابر کدها ضرب در ضریب مقیاس است.
+
+    Args:
+        matrix: ماتریس نرمال‌شده float32
+        storage: نوع داده ذخیره‌سازی ('float32'، 'float16' یا 'int8')
+
+    Returns:
+        تاپل (ماتریس ذخیره شده، ضریب مقیاس هر سطر یا None)
+    """
+    if storage == 'float32':
+        return matrix, None
+    if storage == 'float16':
+        return matrix.astype(np.float16), None
+    if storage == 'int8':
+        scales = (np.max(np.abs(matrix), axis=1) / 127).astype(np.float32) if matrix.shape[1] \
+            else np.zeros(len(matrix), dtype=np.float32)
+        divisors = np.where(scales > 0, scales, 1)[:, np.newaxis]
+        return np.clip(np.rint(matrix / divisors), -127, 127).astype(np.int8), scales
+    raise ValueError(f"نوع ذخیره‌سازی '{storage}' پشتیبانی نمی‌شود")
+
+
+def scan_dots(matrix, queries, scales=None, chunk_size=4096):
+    """ضرب داخلی سطرهای ماتریس ذخیره شده در یک یا چند کوئری
+
+    ماتریس‌های float16 و int8 در تکه‌های کوچک در یک بافر float32 ثابت تبدیل
+    می‌شوند تا داده تبدیل شده در حافظه نهان بماند و حافظه موقتی اضافه نشود.
+
+    Args:
+        matrix: ماتریس ذخیره شده ایندکس
+        queries: بردار کوئری یا ماتریس کوئری‌ها (هر ستون یک کوئری)
+        scales: ضریب مقیاس هر سطر برای ماتریس int8
+
+    Returns:
+        آرایه ضرب‌های داخلی (سطرهای ماتریس × کوئری‌ها)
+    """
+    if matrix.dtype in (np.float32, np.float64):
+        dots = matrix @ queries
+    else:
+        dots = np.empty((len(matrix),) + queries.shape[1:], dtype=np.result_type(np.float32, queries.dtype))
+        buffer = np.empty((min(chunk_size, len(matrix)), matrix.shape[1]), dtype=np.float32)
+        for start in range(0, len(matrix), chunk_size):
+            end = min(start + chunk_size, len(matrix))
+            block = buffer[:end - start]
+            np.copyto(block, matrix[start:end], casting='unsafe')
+            np.matmul(block, queries, out=dots[start:end])
+    if scales is not None:
+        dots *= scales.reshape((-1,) + (1,) * (dots.ndim - 1))
+    return dots
+
+
+def combined_similarity(dots):
+    """تبدیل ضرب داخلی بردارهای واحد به شباهت ترکیبی
+
+    برای بردارهای واحد، شباهت کسینوسی همان ضرب داخلی است و فاصله اقلیدسی
+    برابر sqrt(2 - 2·dot) است؛ بنابراین هر دو معیار از یک ضرب داخلی به دست می‌آیند.
+
+    Args:
+        dots: آرایه ضرب‌های داخلی
+
+    Returns:
+        آرایه شباهت ترکیبی (float64)
+    """
+    dots = np.asarray(dots, dtype=np.float64)
+    euclidean_dist = np.sqrt(np.maximum(2.0 - 2.0 * dots, 0.0))
+    euclidean_similarity = 1.0 / (1.0 + euclidean_dist)
+    return COSINE_WEIGHT * dots + EUCLIDEAN_WEIGHT * euclidean_similarity
+
+
+def _data_nbytes(data):
+    """حجم ماتریس، ضرایب مقیاس و ماتریس پیش‌فیلتر یک نسخه داده‌های ایندکس (بایت)"""
+    return sum(data[key].nbytes for key in ('matrix', 'scales', 'prefilter') if data[key] is not None)
+
+
+class FingerprintIndex:
+    """ایندکس مقیم در حافظه برای همه اثر انگشت‌های کتابخانه
+
+    اثر انگشت‌ها در یک ماتریس پیوسته و نرمال‌شده float32 نگهداری می‌شوند و
+    شناسه، عنوان و خواننده در آرایه‌های موازی قرار دارند. هر تغییر یک نسخه
+    جدید از داده‌ها می‌سازد و آن را یکجا جایگزین می‌کند، بنابراین جستجوهای
+    در حال اجرا هیچ‌وقت داده نیمه‌کاره نمی‌بینند.
+
+    با `set_reduction` می‌توان یک تبدیل کاهش ابعاد (reduction.Projection) و نوع
+    داده کم‌حجم‌تر (float16 یا int8) برای ماتریس تعیین کرد؛ همان تبدیل روی
+    کوئری‌ها هم اعمال می‌شود. با `set_prefilter` ماتریس جداگانه‌ای از چند ستون
+    ارزان بردار کامل برای مرحله اول تطبیق دو مرحله‌ای (cascade.py) نگهداری می‌شود.
+
+    `library_version` نسخه لاگ تغییرات دیتابیس است که ایندکس با آن همگام است؛
+    `sync` فقط آهنگ‌های تغییر یافته پس از آن را می‌خواند و با `update` اعمال می‌کند.
+
+    لیست معکوس آهنگی که پس از ساخت ایندکس تقریبی تغییر کرده دیگر معتبر نیست، بنابراین
+    شناسه این آهنگ‌ها نگهداری و همیشه به صورت دقیق بررسی می‌شوند. اگر تغییرات پس از
+    ساخت معلوم نباشد (`ann_stale`)، جستجو تا ساخت دوباره ایندکس تقریبی دقیق انجام می‌شود.
+    """
+
+    def __init__(self, dtype=np.float32):
+        self.dtype = dtype
+        self.version = 0
+        self.library_version = None
+        self.ann = None
+        self.ann_stale = False
+        self.projection = None
+        self.storage = 'float32'
+        self.prefilter_columns = None
+        self._ann_lookup = None
+        self._ann_changed = np.zeros(0, dtype=np.int64)
+        self._id_lookup = None
+        self._lock = threading.Lock()
+        self._data = self._build([], [], [], None, 0)
+
+    def _prepare(self, matrix):
+        """تبدیل سطرهای اثر انگشت به قالب ذخیره ایندکس: کاهش ابعاد، نرمال‌سازی و کوانتیزه‌سازی
+
+        Returns:
+            تاپل (ماتریس ذخیره شده، ضریب مقیاس سطرها یا None، آرایه بولی سطرهای معتبر،
+            ماتریس نرمال‌شده ستون‌های پیش‌فیلتر یا None)
+        """
+        prefilter = None
+        if self.prefilter_columns is not None:
+            prefilter, _ = normalize_rows(np.array(np.asarray(matrix)[:, self.prefilter_columns], dtype=self.dtype))
+        if self.projection is not None:
+            matrix = self.projection.transform(matrix)
+        matrix, valid = normalize_rows(np.ascontiguousarray(matrix, dtype=self.dtype))
+        matrix, scales = quantize_rows(matrix, self.storage)
+        return matrix, scales, valid, prefilter
+
+    def _prepare_queries(self, queries):
+        """نرمال‌سازی کوئری‌ها (پس از همان تبدیل کاهش ابعاد سطرهای ایندکس)
+
+        Returns:
+            تاپل (ماتریس کوئری‌های نرمال‌شده، آرایه بولی کوئری‌های معتبر)
+        """
+        queries = np.asarray(queries, dtype=np.float64)
+        if self.projection is not None:
+            queries = self.projection.transform(queries).astype(np.float64)
+        norms = np.linalg.norm(queries, axis=1)
+        valid = norms > 0
+        queries = np.where(valid[:, np.newaxis], queries / np.where(valid, norms, 1)[:, np.newaxis], 0)
+        return queries.astype(self.dtype), valid
+
+    def _build(self, ids, titles, artists, matrix, dim):
+        """ساخت یک نسخه تغییرناپذیر از داده‌های ایندکس"""
+        if matrix is None:
+            if self.projection is not None:
+                dim = self.projection.dimension
+            matrix, scales = quantize_rows(np.zeros((0, dim), dtype=self.dtype), self.storage)
+            valid = np.zeros(0, dtype=bool)
+            prefilter = None
+            if self.prefilter_columns is not None:
+                prefilter = np.zeros((0, len(self.prefilter_columns)), dtype=self.dtype)
+        else:
+            matrix, scales, valid, prefilter = self._prepare(matrix)
+        return {
+            'ids': np.asarray(ids, dtype=np.int64),
+            'titles': np.asarray(titles, dtype=object),
+            'artists': np.asarray(artists, dtype=object),
+            'matrix': matrix,
+            'scales': scales,
+            'valid': valid,
+            'prefilter': prefilter,
+        }
+
+    def __len__(self):
+        return len(self._data['ids'])
+
+    @property
+    def dimension(self):
+        """ابعاد بردارهای اثر انگشت موجود در ایندکس"""
+        return self._data['matrix'].shape[1]
+
+    @property
+    def nbytes(self):
+        """حجم ماتریس ایندکس، ضرایب مقیاس و ماتریس پیش‌فیلتر در حافظه (بایت)"""
+        return _data_nbytes(self._data)
+
+    def snapshot(self):
+        """نسخه فعلی داده‌های ایندکس (ids، titles، artists، matrix، scales، valid و prefilter)"""
+        return self._data
+
+    def set_prefilter(self, columns=None):
+        """تنظیم ستون‌هایی از بردار کامل که برای مرحله اول تطبیق دو مرحله‌ای نگهداری می‌شوند
+
+        ایندکس خالی می‌شود و باید پس از آن دوباره بارگذاری شود (load، reload یا load_matrix).
+
+        Args:
+            columns: شماره ستون‌ها در بردار کامل extract_features یا None برای غیرفعال کردن
+        """
+        with self._lock:
+            self.prefilter_columns = np.asarray(columns, dtype=np.int64) if columns is not None else None
+            self._data = self._build([], [], [], None, 0)
+            self.version += 1
+
+    def set_reduction(self, projection=None, storage='float32'):
+        """تنظیم تبدیل کاهش ابعاد و نوع داده ذخیره ماتریس
+
+        ایندکس خالی می‌شود و باید پس از آن دوباره بارگذاری شود (load، reload یا load_matrix).
+
+        Args:
+            projection: تبدیل کاهش ابعاد (مثلاً reduction.Projection) یا None برای بردار کامل
+            storage: نوع داده ذخیره‌سازی ماتریس ('float32'، 'float16' یا 'int8')
+        """
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"نوع ذخیره‌سازی '{storage}' پشتیبانی نمی‌شود")
+        with self._lock:
+            self.projection = projection
+            self.storage = storage
+            self._data = self._build([], [], [], None, 0)
+            self.version += 1
+
+    def _replace(self, data):
+        """جایگزینی کامل داده‌های ایندکس
+
+        تغییرات کتابخانه نسبت به ایندکس تقریبی متصل از بارگذاری کامل معلوم نیست، پس
+        ایندکس تقریبی کهنه علامت زده می‌شود.
+        """
+        with self._lock:
+            self._data = data
+            self.version += 1
+            if self.ann is not None:
+                self.ann_stale = True
+
+    def _mark_changed(self, song_ids):
+        """ثبت آهنگ‌هایی که پس از ساخت ایندکس تقریبی تغییر کرده‌اند (داخل قفل)"""
+        if self.ann is not None and len(song_ids):
+            self._ann_changed = np.union1d(self._ann_changed, np.asarray(song_ids, dtype=np.int64))
+
+    def load_arrays(self, ids, titles, artists, matrix, normalized=False):
+        """بارگذاری کامل ایندکس از آرایه‌های آماده
+
+        Args:
+            ids: شناسه آهنگ‌ها
+            titles: عنوان آهنگ‌ها
+            artists: نام خواننده‌ها
+            matrix: ماتریس اثر انگشت‌ها (هر سطر یک آهنگ)
+            normalized: اگر True باشد ماتریس از قبل در قالب ذخیره ایندکس (کاهش یافته،
+                نرمال‌شده و با نوع داده storage) فرض و بدون کپی استفاده می‌شود
+        """
+        if normalized:
+            data = {
+                'ids': np.asarray(ids, dtype=np.int64),
+                'titles': np.asarray(titles, dtype=object),
+                'artists': np.asarray(artists, dtype=object),
+                'matrix': np.asarray(matrix, dtype=self.dtype if self.storage == 'float32' else self.storage),
+                'scales': None,
+                'valid': np.ones(len(ids), dtype=bool),
+                'prefilter': None,
+            }
+        else:
+            data = self._build(ids, titles, artists, matrix, np.shape(matrix)[1])
+
+        self._replace(data)
+
+    def load(self, fingerprints):
+        """بارگذاری کامل ایندکس از لیست دیکشنری‌های خروجی get_fingerprints
+
+        Args:
+            fingerprints: لیست دیکشنری‌های شامل id، title، artist و fingerprint
+        """
+        ids = [item['id'] for item in fingerprints]
+        titles = [item['title'] for item in fingerprints]
+        artists = [item['artist'] for item in fingerprints]
+
+        if fingerprints and self.projection is not None:
+            # کاهش ابعاد تکه‌تکه تا ماتریس کامل هیچ‌وقت در حافظه ساخته نشود
+            parts = [
+                self._prepare(np.stack([item['fingerprint'] for item in fingerprints[start:start + 65536]]))
+                for start in range(0, len(fingerprints), 65536)
+            ]
+            data = self._build(ids, titles, artists, None, 0)
+            data['matrix'] = np.concatenate([part[0] for part in parts])
+            data['scales'] = np.concatenate([part[1] for part in parts]) if self.storage == 'int8' else None
+            data['valid'] = np.concatenate([part[2] for part in parts])
+            if self.prefilter_columns is not None:
+                data['prefilter'] = np.concatenate([part[3] for part in parts])
+        elif fingerprints:
+            matrix = np.empty((len(fingerprints), len(fingerprints[0]['fingerprint'])), dtype=self.dtype)
+            for row, item in enumerate(fingerprints):
+                matrix[row] = item['fingerprint']
+            data = self._build(ids, titles, artists, matrix, matrix.shape[1])
+        else:
+            data = self._build([], [], [], None, 0)
+
+        self._replace(data)
+
+    def reload(self):
+        """بارگذاری مجدد کل ایندکس از دیتابیس"""
+        from database import get_fingerprints, library_version
+
+        # نسخه پیش از خواندن آهنگ‌ها ثبت می‌شود؛ تغییرات همزمان در sync بعدی دوباره اعمال می‌شوند
+        version = library_version()
+        self.load(get_fingerprints())
+        self.library_version = version
+        return len(self)
+
+    def load_matrix(self, path, mmap=True):
+        """بارگذاری ایندکس از فایل جانبی .npy
+
+        ماتریس ذخیره شده از قبل نرمال‌شده است، بنابراین با mmap بدون هیچ کپی
+        یا محاسبه‌ای مستقیماً برای جستجو استفاده می‌شود. فایل باید با همان گروه‌های
+        ویژگی، تبدیل کاهش ابعاد، نوع ذخیره‌سازی و ستون‌های پیش‌فیلتر ایندکس ساخته شده باشد.
+
+        Args:
+            path: مسیر فایل .npy
+            mmap: نگاشت حافظه‌ای ماتریس به جای خواندن کامل آن
+        """
+        from fingerprint_store import load_matrix
+        from feature_groups import current_layout, format_layout
+
+        stored = load_matrix(path, mmap=mmap)
+        stored.pop('feature_version')
+        if stored.pop('feature_layout') != format_layout(current_layout()):
+            raise ValueError(f"فایل جانبی '{path}' با گروه‌های ویژگی فعلی ساخته نشده است")
+        projection = stored.pop('projection')
+        storage = stored.pop('storage')
+        prefilter_columns = stored.pop('prefilter_columns')
+        library_version = stored.pop('library_version')
+        expected = self.projection.signature if self.projection is not None else None
+        expected_columns = self.prefilter_columns.tolist() if self.prefilter_columns is not None else None
+        if projection != expected or storage != self.storage or prefilter_columns != expected_columns:
+            raise ValueError(f"فایل جانبی '{path}' با تبدیل کاهش ابعاد، نوع ذخیره‌سازی یا ستون‌های پیش‌فیلتر "
+                             f"فعلی ایندکس ساخته نشده است")
+        if storage == 'float32' and stored['matrix'].dtype != self.dtype:
+            stored['matrix'] = stored['matrix'].astype(self.dtype)
+
+        self._replace(stored)
+        # فایل‌های جانبی قدیمی نسخه ندارند و در اولین sync کل ایندکس بارگذاری می‌شود
+        self.library_version = library_version
+        return len(self)
+
+    def save_matrix(self, path, feature_version=0):
+        """ذخیره ماتریس نرمال‌شده ایندکس در فایل جانبی .npy
+
+        Args:
+            path: مسیر فایل .npy
+            feature_version: نسخه مجموعه ویژگی‌ها
+        """
+        from fingerprint_store import save_matrix
+        from feature_groups import current_layout, format_layout
+
+        data = self._data
+        save_matrix(path, data['ids'], data['titles'], data['artists'], data['matrix'], data['valid'],
+                    feature_version, scales=data['scales'],
+                    projection=self.projection.signature if self.projection is not None else None,
+                    prefilter=data['prefilter'], prefilter_columns=self.prefilter_columns,
+                    library_version=self.library_version, feature_layout=format_layout(current_layout()))
+
+    def add(self, song_id, title, artist, fingerprint):
+        """افزودن یک آهنگ به ایندکس (آهنگ با شناسه تکراری جایگزین می‌شود)
+
+        Args:
+            song_id: شناسه آهنگ در دیتابیس
+            title: عنوان آهنگ
+            artist: نام خواننده
+            fingerprint: بردار اثر انگشت آهنگ
+        """
+        row, scales, valid, prefilter = self._prepare(np.array(fingerprint, dtype=self.dtype).reshape(1, -1))
+
+        with self._lock:
+            data = self._data
+            keep = data['ids'] != song_id
+            if len(data['ids']) and data['matrix'].shape[1] != row.shape[1]:
+                raise ValueError(
+                    f"ابعاد اثر انگشت ({row.shape[1]}) با ایندکس ({data['matrix'].shape[1]}) یکسان نیست"
+                )
+            new_data = {
+                'ids': np.append(data['ids'][keep], song_id),
+                'titles': np.append(data['titles'][keep], np.array([title], dtype=object)),
+                'artists': np.append(data['artists'][keep], np.array([artist], dtype=object)),
+            }
+            new_data['matrix'] = np.concatenate([data['matrix'][keep].reshape(-1, row.shape[1]), row])
+            new_data['scales'] = np.concatenate([data['scales'][keep], scales]) if scales is not None else None
+            new_data['valid'] = np.concatenate([data['valid'][keep], valid])
+            new_data['prefilter'] = np.concatenate([data['prefilter'][keep], prefilter]) \
+                if prefilter is not None else None
+            self._data = new_data
+            self.version += 1
+            self._mark_changed([song_id])
+
+    def remove(self, song_id):
+        """حذف یک آهنگ از ایندکس
+
+        Args:
+            song_id: شناسه آهنگ
+
+        Returns:
+            True اگر آهنگ در ایندکس وجود داشت
+        """
+        with self._lock:
+            data = self._data
+            keep = data['ids'] != song_id
+            if keep.all():
+                return False
+            self._data = {key: value[keep] if value is not None else None for key, value in data.items()}
+            self.version += 1
+            return True
+
+    def update(self, fingerprints, removed_ids=()):
+        """اعمال دسته‌ای تغییرات کتابخانه با یک جایگزینی نسخه داده‌ها
+
+        آهنگ‌های `removed_ids` و نسخه قبلی آهنگ‌های `fingerprints` حذف و آهنگ‌های جدید
+        به انتهای ایندکس اضافه می‌شوند. آماده‌سازی سطرهای جدید بیرون از قفل انجام
+        می‌شود و جستجوهای در حال اجرا تا پایان با نسخه قبلی کار می‌کنند، بنابراین
+        تا جایگزینی هر دو نسخه همزمان در حافظه هستند.
+
+        Args:
+            fingerprints: لیست دیکشنری‌های شامل id، title، artist و fingerprint (خروجی get_fingerprints)
+            removed_ids: شناسه آهنگ‌هایی که باید حذف شوند (شناسه‌های ناموجود نادیده گرفته می‌شوند)
+
+        Returns:
+            دیکشنری آمار: added (آهنگ‌های جدید)، updated (آهنگ‌های جایگزین شده)، removed،
+            bytes (حجم نسخه جدید) و peak_bytes (حجم هر دو نسخه هنگام جایگزینی)
+        """
+        new_ids = np.array([item['id'] for item in fingerprints], dtype=np.int64)
+        new_data = None
+        if fingerprints:
+            matrix = np.stack([np.asarray(item['fingerprint'], dtype=self.dtype) for item in fingerprints])
+            new_data = self._build(new_ids, [item['title'] for item in fingerprints],
+                                   [item['artist'] for item in fingerprints], matrix, matrix.shape[1])
+
+        with self._lock:
+            data = self._data
+            if new_data is not None and len(data['ids']) and data['matrix'].shape[1] != new_data['matrix'].shape[1]:
+                raise ValueError(
+                    f"ابعاد اثر انگشت ({new_data['matrix'].shape[1]}) با ایندکس ({data['matrix'].shape[1]}) یکسان نیست"
+                )
+            dropped = np.isin(data['ids'], np.union1d(np.asarray(list(removed_ids), dtype=np.int64), new_ids))
+            keep = ~dropped
+            if new_data is None:
+                merged = {key: value[keep] if value is not None else None for key, value in data.items()}
+            elif not keep.any():
+                # ایندکس خالی (ابعاد ماتریس خالی ممکن است با سطرهای جدید یکسان نباشد)
+                merged = new_data
+            else:
+                merged = {
+                    key: np.concatenate([data[key][keep], new_data[key]]) if new_data[key] is not None else None
+                    for key in data
+                }
+            old_bytes = _data_nbytes(data)
+            self._data = merged
+            self.version += 1
+            self._mark_changed(new_ids)
+
+        replaced = int(np.isin(new_ids, data['ids']).sum())
+        return {
+            'added': len(new_ids) - replaced,
+            'updated': replaced,
+            'removed': int(dropped.sum()) - replaced,
+            'bytes': _data_nbytes(merged),
+            'peak_bytes': old_bytes + _data_nbytes(merged),
+        }
+
+    def sync(self):
+        """همگام‌سازی ایندکس با دیتابیس با خواندن فقط آهنگ‌های تغییر یافته از لاگ تغییرات
+
+        اگر نسخه ایندکس نامعلوم باشد یا تغییرات پس از آن کامل در لاگ نباشد (لاگ هرس
+        شده یا کتابخانه پاک شده)، کل ایندکس دوباره بارگذاری می‌شود. در هر دو حالت
+        داده‌های جدید یکجا جایگزین می‌شوند و جستجوها متوقف نمی‌شوند.
+
+        Returns:
+            None اگر تغییری نباشد، وگرنه دیکشنری آمار update به همراه version،
+            full (بارگذاری کامل) و seconds (زمان خواندن دیتابیس و جایگزینی)
+        """
+        from database import get_changes, get_fingerprints
+
+        start = time.perf_counter()
+        if self.library_version is None:
+            version, song_ids = None, None
+        else:
+            version, song_ids = get_changes(self.library_version)
+            if version == self.library_version:
+                return None
+
+        if song_ids is None:
+            old_bytes = self.nbytes
+            old_count = len(self)
+            self.reload()
+            stats = {'added': len(self), 'updated': 0, 'removed': old_count, 'bytes': self.nbytes,
+                     'peak_bytes': old_bytes + self.nbytes, 'full': True}
+        else:
+            stats = self.update(get_fingerprints(song_ids), removed_ids=song_ids)
+            stats['full'] = False
+            self.library_version = version
+        stats['version'] = self.library_version
+        stats['seconds'] = time.perf_counter() - start
+        return stats
+
+    def attach_ann(self, ann, changed_ids=()):
+        """اتصال یک ایندکس تقریبی (IVFIndex) برای جستجو با nprobe
+
+        آهنگ‌هایی که پس از ساخت ایندکس تقریبی اضافه یا تغییر داده شده‌اند همیشه به
+        صورت دقیق بررسی می‌شوند، بنابراین هیچ آهنگی از جستجو جا نمی‌ماند.
+
+        Args:
+            ann: ایندکس تقریبی
+            changed_ids: شناسه آهنگ‌هایی که پس از ساخت ایندکس تقریبی تغییر کرده‌اند
+                (ann_index.changes_since_build)؛ None یعنی نامعلوم و جستجوی دقیق
+        """
+        with self._lock:
+            self.ann = ann
+            self.ann_stale = changed_ids is None
+            self._ann_changed = np.unique(np.asarray(list(changed_ids or ()), dtype=np.int64))
+            self.version += 1
+
+    def _rows_for_ids(self, data, ids):
+        """سطرهای ماتریس برای لیستی از شناسه‌ها (شناسه‌های ناموجود نادیده گرفته می‌شوند؛ مرتب صعودی)"""
+        lookup = self._id_lookup
+        if lookup is None or lookup[0] is not data:
+            # نگاشت شناسه به سطر (یک بار برای هر نسخه داده)
+            id_order = np.argsort(data['ids'], kind='stable')
+            lookup = (data, id_order, data['ids'][id_order])
+            self._id_lookup = lookup
+        _, id_order, sorted_ids = lookup
+
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(sorted_ids) == 0 or len(ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        found = sorted_ids[positions] == ids
+        return np.unique(id_order[positions[found]])
+
+    def _ann_rows(self, data, query, nprobe):
+        """سطرهای کاندید ایندکس تقریبی برای یک کوئری (مرتب صعودی)"""
+        ann = self.ann
+        changed = self._ann_changed
+        lookup = self._ann_lookup
+        if lookup is None or lookup[0] is not data or lookup[1] is not ann or lookup[2] is not changed:
+            # سطرهایی که در ایندکس تقریبی نیستند یا پس از ساخت آن تغییر کرده‌اند (یک بار برای هر نسخه داده)
+            extra_rows = np.nonzero(~np.isin(data['ids'], ann.ids) | np.isin(data['ids'], changed))[0]
+            lookup = (data, ann, changed, extra_rows)
+            self._ann_lookup = lookup
+        extra_rows = lookup[3]
+        return np.union1d(self._rows_for_ids(data, ann.candidates(query, nprobe)), extra_rows)
+
+    def shortlist(self, query_part, size, threshold=-np.inf):
+        """مرحله اول تطبیق دو مرحله‌ای: انتخاب کاندیدها با ستون‌های پیش‌فیلتر
+
+        Args:
+            query_part: ستون‌های پیش‌فیلتر اثر انگشت دمو (به ترتیب `set_prefilter`)
+            size: حداکثر تعداد کاندیدها
+            threshold: حداقل شباهت پیش‌فیلتر برای ماندن در فهرست کوتاه
+
+        Returns:
+            تاپل (شناسه‌ها، شباهت‌های پیش‌فیلتر) به ترتیب نزولی شباهت
+        """
+        data = self._data
+        if data['prefilter'] is None:
+            raise ValueError("ستون‌های پیش‌فیلتر ایندکس تنظیم نشده‌اند (set_prefilter)")
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0)
+        if len(data['ids']) == 0 or size <= 0:
+            return empty
+
+        query, valid_query = normalize_rows(np.array(query_part, dtype=self.dtype).reshape(1, -1))
+        if not valid_query[0]:
+            return empty
+        scores = combined_similarity(scan_dots(data['prefilter'], query[0]))
+        scores[~data['valid']] = -np.inf
+
+        rows = np.argpartition(-scores, size - 1)[:size] if size < len(scores) else np.arange(len(scores))
+        rows = rows[scores[rows] >= threshold]
+        rows = rows[np.argsort(-scores[rows], kind='stable')]
+        return data['ids'][rows].astype(np.int64), scores[rows].astype(np.float64)
+
+    def search(self, query, threshold=SIMILARITY_THRESHOLD, top_k=None, nprobe=None, candidates=None):
+        """جستجوی آهنگ‌های مشابه با یک اثر انگشت
+
+        Args:
+            query: اثر انگشت صوتی دمو
+            threshold: آستانه شباهت (نتایج با شباهت کمتر حذف می‌شوند)
+            top_k: حداکثر تعداد نتایج (None یعنی همه نتایج بالای آستانه)
+            nprobe: تعداد لیست‌های ایندکس تقریبی که بررسی می‌شوند (None یا 0 یعنی جستجوی دقیق)؛
+                مقدار بیشتر دقت بالاتر و جستجوی کندتر به همراه دارد
+            candidates: شناسه آهنگ‌هایی که امتیازدهی می‌شوند (مثلاً فهرست کوتاه `shortlist`)؛
+                None یعنی کل کتابخانه
+
+        Returns:
+            لیست آهنگ‌های پیدا شده به ترتیب نزولی شباهت، با همان قالب compare_fingerprints
+        """
+        data = self._data
+        if len(data['ids']) == 0:
+            return []
+
+        queries, valid_queries = self._prepare_queries(np.reshape(query, (1, -1)))
+        if not valid_queries[0]:
+            return []
+        query = queries[0]
+
+        if candidates is not None or (nprobe and self.ann is not None and not self.ann_stale):
+            # امتیازدهی دقیق فقط برای کاندیدهای داده شده یا فهرست کوتاه ایندکس تقریبی
+            rows = self._rows_for_ids(data, candidates) if candidates is not None \
+                else self._ann_rows(data, query, nprobe)
+            scales = data['scales'][rows] if data['scales'] is not None else None
+            scores = combined_similarity(scan_dots(data['matrix'][rows], query, scales))
+            scores[~data['valid'][rows]] = -np.inf
+        else:
+            # یک ضرب ماتریس-بردار برای کل کتابخانه
+            rows = None
+            scores = combined_similarity(scan_dots(data['matrix'], query, data['scales']))
+            scores[~data['valid']] = -np.inf
+
+        # انتخاب K نتیجه برتر بدون مرتب‌سازی کل آرایه
+        if top_k is not None and top_k < len(scores):
+            if top_k <= 0:
+                return []
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+            candidates.sort()
+        else:
+            candidates = np.arange(len(scores))
+
+        candidates = candidates[scores[candidates] >= threshold]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        selected = candidates if rows is None else rows[candidates]
+
+        return [
+            {
+                'id': int(data['ids'][i]),
+                'title': data['titles'][i],
+                'artist': data['artists'][i],
+                'similarity': float(scores[j]),
+            }
+            for i, j in zip(selected, candidates)
+        ]
+
+    def search_batch(self, queries, top_k=10, chunk_size=256):
+        """جستجوی همزمان چند اثر انگشت با ضرب ماتریس-ماتریس (جستجوی دقیق، بدون آستانه)
+
+        Args:
+            queries: ماتریس اثر انگشت‌های دمو (هر سطر یک کوئری)
+            top_k: تعداد نتایج برتر هر کوئری
+            chunk_size: تعداد کوئری‌ها در هر ضرب ماتریس (برای محدود ماندن حافظه)
+
+        Returns:
+            تاپل (شناسه‌ها، شباهت‌ها) هر کدام با ابعاد (تعداد کوئری × top_k) به ترتیب
+            نزولی شباهت؛ جاهای خالی شناسه -1 و شباهت -inf دارند
+        """
+        data = self._data
+        rows, similarities = self._batch_rows(data, queries, top_k, chunk_size)
+        ids = np.where(rows >= 0, data['ids'][np.maximum(rows, 0)], -1) if rows.size else rows
+        return ids, similarities
+
+    def search_many(self, queries, threshold=SIMILARITY_THRESHOLD, top_k=10, chunk_size=256):
+        """جستجوی همزمان چند اثر انگشت با همان قالب نتایج search (برای درخواست‌های دسته‌ای)
+
+        Args:
+            queries: ماتریس اثر انگشت‌های دمو (هر سطر یک کوئری)
+            threshold: آستانه شباهت
+            top_k: حداکثر تعداد نتایج هر کوئری (None یعنی همه نتایج بالای آستانه)
+            chunk_size: تعداد کوئری‌ها در هر ضرب ماتریس
+
+        Returns:
+            لیست نتایج هر کوئری به ترتیب نزولی شباهت
+        """
+        data = self._data
+        if top_k is None:
+            top_k = len(data['ids'])
+        rows, similarities = self._batch_rows(data, queries, top_k, chunk_size)
+        return [
+            [
+                {
+                    'id': int(data['ids'][i]),
+                    'title': data['titles'][i],
+                    'artist': data['artists'][i],
+                    'similarity': float(similarity),
+                }
+                for i, similarity in zip(query_rows, query_similarities) if i >= 0 and similarity >= threshold
+            ]
+            for query_rows, query_similarities in zip(rows, similarities)
+        ]
+
+    def _batch_rows(self, data, queries, top_k, chunk_size):
+        """سطرها و شباهت‌های top_k هر کوئری (سطر -1 و شباهت -inf برای جاهای خالی)"""
+        n_queries = len(queries)
+        top_k = min(top_k, len(data['ids']))
+        top_rows = np.full((n_queries, max(top_k, 0)), -1, dtype=np.int64)
+        similarities = np.full((n_queries, max(top_k, 0)), -np.inf)
+        if top_k <= 0 or n_queries == 0:
+            return top_rows, similarities
+
+        queries, valid_queries = self._prepare_queries(queries)
+
+        for start in range(0, n_queries, chunk_size):
+            end = min(start + chunk_size, n_queries)
+            # یک ضرب ماتریس برای همه کوئری‌های این بخش (آهنگ‌ها × کوئری‌ها)
+            scores = combined_similarity(scan_dots(data['matrix'], queries[start:end].T, data['scales']))
+            scores[~data['valid']] = -np.inf
+            scores[:, ~valid_queries[start:end]] = -np.inf
+
+            rows = np.argpartition(-scores, top_k - 1, axis=0)[:top_k] if top_k < len(scores) \
+                else np.broadcast_to(np.arange(len(scores))[:, np.newaxis], scores.shape)
+            top_scores = np.take_along_axis(scores, rows, axis=0)
+            order = np.argsort(-top_scores, axis=0, kind='stable')
+            rows = np.take_along_axis(rows, order, axis=0)
+            top_scores = np.take_along_axis(top_scores, order, axis=0)
+
+            found = np.isfinite(top_scores)
+            top_rows[start:end] = np.where(found, rows, -1).T
+            similarities[start:end] = top_scores.T
+        return top_rows, similarities
@@ -0,0 +1,252 @@
+"""
+قالب باینری نسخه‌دار برای ذخیره اثر انگشت‌ها و فایل ماتریس جانبی (.npy)
+
+هر اثر انگشت به صورت بایت‌های خام little-endian با یک سرآیند کوچک ذخیره می‌شود:
+
+    magic (4 بایت) | نسخه قالب (1) | نوع داده (1) | نسخه ویژگی‌ها (2) | ابعاد (4) | داده‌ها
+
+بارگذاری این قالب فقط یک np.frombuffer است و برخلاف pickle هیچ کدی اجرا نمی‌کند.
+
+فایل‌های جانبی ماتریس نسل‌دار هستند: هر ذخیره فایل‌های داده را با شماره نسل جدید
+(مثلاً fingerprints.g3.npy) می‌نویسد و در پایان متادیتا (fingerprints.meta.json) را که
+شماره نسل را نگه می‌دارد به صورت اتمی جایگزین می‌کند. فایل‌های نسلی که پردازه دیگری
+با mmap باز کرده هیچ‌وقت بازنویسی نمی‌شوند و خواننده همیشه مجموعه فایل‌های یک نسل را
+می‌خواند.
+"""
+
+import glob
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b'FPRT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBHI')
+
+# کد نوع داده‌های پشتیبانی شده در سرآیند
+DTYPE_CODES = {
+    'float32': 1,
+    'float16': 2,
+}
+CODE_DTYPES = {code: np.dtype(name).newbyteorder('<') for name, code in DTYPE_CODES.items()}
+
+
+def is_encoded(blob):
+    """آیا بایت‌ها با قالب جدید ذخیره شده‌اند؟ (در غیر این صورت pickle قدیمی است)"""
+    return blob is not None and bytes(blob[:len(MAGIC)]) == MAGIC
+
+
+def encode_fingerprint(fingerprint, dtype='float32', feature_version=0):
+    """تبدیل اثر انگشت به بایت‌های قالب باینری
+
+    Args:
+        fingerprint: بردار اثر انگشت
+        dtype: نوع داده ذخیره‌سازی ('float32' یا 'float16')
+        feature_version: نسخه مجموعه ویژگی‌هایی که بردار با آن ساخته شده
+
+    Returns:
+        بایت‌های سرآیند و داده‌ها
+    """
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"نوع داده '{dtype}' پشتیبانی نمی‌شود")
+    vector = np.asarray(fingerprint).ravel().astype(np.dtype(dtype).newbyteorder('<'))
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, DTYPE_CODES[dtype], feature_version, len(vector))
+    return header + vector.tobytes()
+
+
+def decode_header(blob):
+    """خواندن سرآیند اثر انگشت
+
+    Returns:
+        دیکشنری شامل format_version، dtype، feature_version و dimension
+    """
+    magic, format_version, dtype_code, feature_version, dimension = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("قالب اثر انگشت شناخته شده نیست")
+    if format_version != FORMAT_VERSION or dtype_code not in CODE_DTYPES:
+        raise ValueError(f"نسخه قالب ({format_version}) یا نوع داده ({dtype_code}) پشتیبانی نمی‌شود")
+    return {
+        'format_version': format_version,
+        'dtype': CODE_DTYPES[dtype_code],
+        'feature_version': feature_version,
+        'dimension': dimension,
+    }
+
+
+def decode_fingerprint(blob):
+    """تبدیل بایت‌های قالب باینری به بردار float32
+
+    Args:
+        blob: بایت‌های ذخیره شده در دیتابیس
+
+    Returns:
+        بردار اثر انگشت (float32)
+    """
+    header = decode_header(blob)
+    vector = np.frombuffer(blob, dtype=header['dtype'], count=header['dimension'], offset=HEADER.size)
+    return vector.astype(np.float32)
+
+
+def _sidecar_paths(path, generation=None):
+    """مسیر فایل‌های ماتریس، شناسه‌ها، ضرایب مقیاس، پیش‌فیلتر و متادیتا برای یک فایل جانبی
+
+    Args:
+        path: مسیر فایل .npy
+        generation: شماره نسل فایل‌های داده (None برای فایل‌های قدیمی بدون نسل)
+    """
+    base = path[:-4] if path.endswith('.npy') else path
+    data = base if generation is None else f'{base}.g{generation}'
+    return data + '.npy', data + '.ids.npy', data + '.scales.npy', data + '.prefilter.npy', base + '.meta.json'
+
+
+def _read_meta(meta_path):
+    """خواندن متادیتای فایل جانبی یا None اگر وجود نداشته باشد"""
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, write):
+    """نوشتن فایل در مسیر موقت همان پوشه و جایگزینی اتمی آن با os.replace
+
+    Args:
+        path: مسیر نهایی فایل
+        write: تابعی که شیء فایل باینری باز را می‌نویسد
+    """
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _remove_old_generations(path, keep):
+    """حذف فایل‌های داده نسل‌های قدیمی‌تر از keep و فایل‌های قدیمی بدون نسل
+
+    فایل حذف شده تا زمانی که پردازه‌ای آن را با mmap باز نگه داشته معتبر می‌ماند.
+    """
+    base = path[:-4] if path.endswith('.npy') else path
+    old = list(_sidecar_paths(path)[:4])
+    for name in glob.glob(glob.escape(base) + '.g*.npy'):
+        generation = name[len(base) + 2:].split('.', 1)[0]
+        if generation.isdigit() and int(generation) < keep:
+            old.append(name)
+    for name in old:
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def matrix_exists(path):
+    """آیا فایل جانبی ماتریس (نسل‌دار یا قدیمی) در این مسیر ذخیره شده است؟"""
+    return os.path.exists(_sidecar_paths(path)[4])
+
+
+def save_matrix(path, ids, titles, artists, matrix, valid, feature_version=0, scales=None, projection=None,
+                prefilter=None, prefilter_columns=None, library_version=None, feature_layout=None):
+    """ذخیره ماتریس نرمال‌شده اثر انگشت‌ها در فایل جانبی .npy
+
+    Args:
+        path: مسیر فایل .npy
+        ids: آرایه شناسه آهنگ‌ها
+        titles: عنوان آهنگ‌ها
+        artists: نام خواننده‌ها
+        matrix: ماتریس نرمال‌شده (float32، float16 یا int8 با همان نوع داده ذخیره می‌شود)
+        valid: آرایه بولی سطرهای معتبر
+        feature_version: نسخه مجموعه ویژگی‌ها
+        scales: ضریب مقیاس هر سطر برای ماتریس int8
+        projection: امضای تبدیل کاهش ابعادی که ماتریس با آن ساخته شده (None یعنی بردار کامل)
+        prefilter: ماتریس نرمال‌شده ستون‌های پیش‌فیلتر (تطبیق دو مرحله‌ای)
+        prefilter_columns: شماره ستون‌های پیش‌فیلتر در بردار کامل
+        library_version: نسخه لاگ تغییرات دیتابیس که ماتریس با آن ساخته شده
+        feature_layout: چیدمان گروه‌های ویژگی بردارها (متن format_layout)
+    """
+    meta_path = _sidecar_paths(path)[4]
+    previous = _read_meta(meta_path) or {}
+    generation = previous.get('generation', 0) + 1
+    matrix_path, ids_path, scales_path, prefilter_path, _ = _sidecar_paths(path, generation)
+
+    # فایل‌های داده نسل جدید پیش از متادیتا نوشته می‌شوند؛ تا جایگزینی متادیتا خواننده‌ها نسل قبل را می‌بینند
+    matrix = np.ascontiguousarray(matrix)
+    _write_atomic(matrix_path, lambda f: np.save(f, matrix))
+    ids_valid = np.stack([np.asarray(ids, dtype=np.int64), np.asarray(valid, dtype=np.int64)])
+    _write_atomic(ids_path, lambda f: np.save(f, ids_valid))
+    if scales is not None:
+        _write_atomic(scales_path, lambda f: np.save(f, np.asarray(scales, dtype=np.float32)))
+    if prefilter is not None:
+        _write_atomic(prefilter_path, lambda f: np.save(f, np.ascontiguousarray(prefilter, dtype=np.float32)))
+    meta = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'generation': generation,
+        'feature_version': feature_version,
+        'storage': matrix.dtype.name,
+        'projection': projection,
+        'prefilter_columns': [int(column) for column in prefilter_columns] if prefilter is not None else None,
+        'library_version': library_version,
+        'feature_layout': feature_layout,
+        'titles': list(titles),
+        'artists': list(artists),
+    }, ensure_ascii=False)
+    _write_atomic(meta_path, lambda f: f.write(meta.encode('utf-8')))
+
+    # نسل قبلی برای خواننده‌ای که متادیتای آن را تازه خوانده نگه داشته می‌شود
+    _remove_old_generations(path, generation - 1)
+
+
+def load_matrix(path, mmap=True):
+    """بارگذاری فایل جانبی ماتریس اثر انگشت‌ها
+
+    Args:
+        path: مسیر فایل .npy
+        mmap: نگاشت حافظه‌ای ماتریس به جای خواندن کامل آن (بدون کپی)
+
+    Returns:
+        دیکشنری شامل ids، titles، artists، matrix، scales، valid، prefilter، feature_version،
+        storage، projection، prefilter_columns، library_version و feature_layout (None برای فایل‌های قدیمی)
+    """
+    meta_path = _sidecar_paths(path)[4]
+    for attempt in range(3):
+        meta = _read_meta(meta_path)
+        if meta is None:
+            raise FileNotFoundError(meta_path)
+        matrix_path, ids_path, scales_path, prefilter_path, _ = _sidecar_paths(path, meta.get('generation'))
+        prefilter_columns = meta.get('prefilter_columns')
+        try:
+            matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+            ids, valid = np.load(ids_path)
+            scales = np.load(scales_path) if meta.get('storage') == 'int8' else None
+            prefilter = np.load(prefilter_path, mmap_mode='r' if mmap else None) if prefilter_columns is not None else None
+            break
+        except FileNotFoundError:
+            # نسل خوانده شده همزمان با چند ذخیره پشت سر هم حذف شد؛ متادیتا دوباره خوانده می‌شود
+            if attempt == 2:
+                raise
+
+    if len(ids) != matrix.shape[0]:
+        raise ValueError("تعداد سطرهای ماتریس با شناسه‌ها یکسان نیست")
+
+    return {
+        'ids': ids,
+        'titles': np.asarray(meta['titles'], dtype=object),
+        'artists': np.asarray(meta['artists'], dtype=object),
+        'matrix': matrix,
+        'scales': scales,
+        'valid': valid.astype(bool),
+        'prefilter': prefilter,
+        'feature_version': meta.get('feature_version', 0),
+        'storage': meta.get('storage', 'float32'),
+        'projection': meta.get('projection'),
+        'prefilter_columns': prefilter_columns,
+        'library_version': meta.get('library_version'),
+        'feature_layout': meta.get('feature_layout'),
+    }
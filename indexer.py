@@ -1,15 +1,29 @@
 import os
+import time
 import argparse
-import glob
+import hashlib
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 from tqdm import tqdm
 import traceback
 
-from config import MUSIC_LIBRARY_PATH
-from database import init_db, add_song, clear_database, get_all_songs
-from audio_fingerprint import generate_fingerprint
+from config import (MUSIC_LIBRARY_PATH, FINGERPRINT_ENGINE, FINGERPRINT_MATRIX_PATH, LANDMARK_SAMPLE_RATE,
+                    ANN_INDEX_PATH, REDUCTION_PATH, REDUCTION_COMPONENTS, WATCH_INTERVAL, WATCH_DEBOUNCE,
+                    WATCH_FULL_SCAN_EVERY, WATCH_MAX_PENDING)
+from database import (init_db, add_songs, clear_database, get_all_songs, get_song_states, update_song_file,
+                      delete_songs, export_fingerprint_matrix, prune_changes, get_fingerprints, get_feature_layouts,
+                      update_fingerprints)
+from audio_fingerprint import load_audio, extract_features
+from feature_groups import REGISTRY, current_layout, missing_groups, merge_groups
+from landmark_fingerprint import extract_landmarks
+from ann_index import build_ann_index
+from reduction import fit_projection
+from library_watcher import AUDIO_EXTENSIONS, LibraryScanner, IngestQueue
 
-def get_audio_files(directory, extensions=['.mp3', '.m4a', '.wav', '.flac', '.ogg']):
-    """دریافت همه فایل‌های صوتی در یک پوشه و زیرپوشه‌های آن
+def get_audio_files(directory, extensions=AUDIO_EXTENSIONS):
+    """دریافت همه فایل‌های صوتی در یک پوشه و زیرپوشه‌های آن (با یک پیمایش درخت برای همه پسوندها)
     
     Args:
         directory: مسیر پوشه
@@ -18,12 +32,8 @@ def get_audio_files(directory, extensions=['.mp3', '.m4a', '.wav', '.flac', '.og
     Returns:
         لیستی از مسیرهای فایل‌های صوتی
     """
-    audio_files = []
-    for ext in extensions:
-        pattern = os.path.join(directory, f"**/*{ext}")
-        audio_files.extend(glob.glob(pattern, recursive=True))
-    
-    return audio_files
+    changed, _ = LibraryScanner(directory, extensions).scan()
+    return list(changed)
 
 def extract_metadata(file_path):
     """استخراج متادیتا از نام فایل
@@ -48,43 +58,94 @@ def extract_metadata(file_path):
     
     return title.strip(), artist.strip()
 
-def index_music_library(directory=MUSIC_LIBRARY_PATH, clear=False):
-    """ایندکس کردن کتابخانه موسیقی
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """محاسبه هش محتوای فایل به صورت تکه‌تکه
     
     Args:
-        directory: مسیر پوشه کتابخانه
-        clear: آیا دیتابیس قبلی پاک شود؟
+        file_path: مسیر فایل
+        chunk_size: اندازه هر تکه خواندن (بایت)
+        
+    Returns:
+        رشته هگزادسیمال هش SHA-1
     """
-    print(f"شروع ایندکس‌گذاری موسیقی از پوشه: {directory}")
-    
-    # مقداردهی اولیه دیتابیس
-    init_db()
-    
-    # پاک کردن دیتابیس قبلی در صورت درخواست
-    if clear:
-        clear_database()
-        print("دیتابیس قبلی پاک شد")
+    hasher = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def get_file_state(file_path):
+    """دریافت اندازه، زمان تغییر و هش محتوای فایل
     
-    # دریافت فایل‌های صوتی
-    audio_files = get_audio_files(directory)
-    print(f"{len(audio_files)} فایل صوتی پیدا شد")
+    Returns:
+        دیکشنری شامل size، mtime و hash
+    """
+    stat = os.stat(file_path)
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'hash': compute_file_hash(file_path)
+    }
+
+def _state_for(file_path, file_states):
+    """وضعیت فایل از file_states یا محاسبه آن در همان نخی که فایل را برای پردازش می‌خواند"""
+    file_state = file_states.get(file_path)
+    if file_state is None:
+        try:
+            file_state = get_file_state(file_path)
+        except OSError:
+            pass
+    return file_state
+
+def _load_for_engine(file_path, engine):
+    """بارگذاری فایل با تنظیمات موتور اثر انگشت (موتور نشانه‌ای کل فایل را می‌خواند)"""
+    if engine == 'landmark':
+        return load_audio(file_path, sr=LANDMARK_SAMPLE_RATE, duration=None)
+    return load_audio(file_path)
+
+def _extract_for_engine(signal, sr, engine):
+    """استخراج اثر انگشت از سیگنال با موتور انتخاب شده"""
+    if engine == 'landmark':
+        return extract_landmarks(signal, sr)
+    return extract_features(signal, sr)
+
+def _song_record(title, artist, file_path, result, engine, file_state):
+    """ساخت تاپل ورودی add_songs از خروجی موتور اثر انگشت"""
+    if engine == 'landmark':
+        return (title, artist, file_path, None, file_state, result)
+    return (title, artist, file_path, result, file_state)
+
+def _index_serial(audio_files, file_states=None, engine=FINGERPRINT_ENGINE, batch_size=50):
+    """ایندکس‌گذاری فایل‌ها یکی پس از دیگری
     
-    # تعداد فایل‌های اضافه شده و خطادار
+    Args:
+        audio_files: لیست مسیر فایل‌های صوتی
+        file_states: دیکشنری اختیاری مسیر فایل به وضعیت آن (خروجی get_file_state)؛ وضعیت
+            فایل‌های دیگر هنگام پردازش محاسبه می‌شود
+        engine: موتور اثر انگشت ("features" یا "landmark")
+        batch_size: تعداد آهنگ‌ها در هر تراکنش دیتابیس
+        
+    Returns:
+        تعداد فایل‌های اضافه شده و تعداد فایل‌های خطادار
+    """
+    file_states = file_states or {}
     added_count = 0
     error_count = 0
+    batch = []
     
-    # پردازش هر فایل
     for file_path in tqdm(audio_files, desc="پردازش فایل‌ها"):
         try:
             # استخراج متادیتا
             title, artist = extract_metadata(file_path)
             
             # تولید اثر انگشت صوتی
-            fingerprint = generate_fingerprint(file_path)
+            file_state = _state_for(file_path, file_states)
+            signal, sr = _load_for_engine(file_path, engine)
+            fingerprint = _extract_for_engine(signal, sr, engine) if signal is not None else None
             
             if fingerprint is not None:
-                # افزودن به دیتابیس
-                add_song(title, artist, file_path, fingerprint)
+                # افزودن به دسته بعدی دیتابیس
+                batch.append(_song_record(title, artist, file_path, fingerprint, engine, file_state))
                 added_count += 1
             else:
                 print(f"خطا در استخراج اثر انگشت برای فایل: {file_path}")
@@ -94,15 +155,490 @@ def index_music_library(directory=MUSIC_LIBRARY_PATH, clear=False):
             print(f"خطا در پردازش فایل {file_path}: {str(e)}")
             traceback.print_exc()
             error_count += 1
+        
+        # نوشتن دسته‌ای نتایج در دیتابیس
+        if len(batch) >= batch_size:
+            add_songs(batch)
+            batch = []
+    
+    if batch:
+        add_songs(batch)
+    
+    return added_count, error_count
+
+def _decode_and_submit(file_path, process_pool, engine, file_state=None):
+    """بارگذاری فایل در نخ رمزگشایی و ارسال سیگنال به استخر پردازه‌ها
+    
+    وضعیت فایل (از جمله هش محتوا) اگر از قبل محاسبه نشده باشد در همین نخ محاسبه می‌شود.
+    
+    Returns:
+        تاپل (وضعیت فایل، future استخراج ویژگی‌ها یا None در صورت خطای بارگذاری)
+    """
+    file_state = _state_for(file_path, {file_path: file_state} if file_state else {})
+    signal, sr = _load_for_engine(file_path, engine)
+    if signal is None:
+        return file_state, None
+    return file_state, process_pool.submit(_extract_for_engine, signal, sr, engine)
+
+def _index_parallel(audio_files, workers, decode_threads=None, batch_size=50, file_states=None,
+                    engine=FINGERPRINT_ENGINE, process_pool=None):
+    """ایندکس‌گذاری موازی فایل‌ها
+    
+    رمزگشایی فایل‌ها در چند نخ انجام می‌شود تا خواندن دیسک با استخراج ویژگی‌ها
+    (در استخر پردازه‌ها) همپوشانی داشته باشد. تعداد فایل‌های در جریان محدود است
+    تا حافظه ثابت بماند و نتایج به ترتیب فایل‌ها توسط یک نویسنده واحد به صورت
+    دسته‌ای در دیتابیس نوشته می‌شوند، بنابراین خروجی با حالت ترتیبی یکسان است.
+    
+    Args:
+        audio_files: لیست مسیر فایل‌های صوتی
+        workers: تعداد پردازه‌های استخراج ویژگی
+        decode_threads: تعداد نخ‌های رمزگشایی (پیش‌فرض: برابر workers)
+        batch_size: تعداد آهنگ‌ها در هر تراکنش دیتابیس
+        file_states: دیکشنری اختیاری مسیر فایل به وضعیت آن (خروجی get_file_state)؛ وضعیت
+            فایل‌های دیگر در نخ‌های رمزگشایی محاسبه می‌شود
+        engine: موتور اثر انگشت ("features" یا "landmark")
+        process_pool: استخر پردازه‌های آماده (برای چند فراخوانی پشت سر هم؛ پیش‌فرض: استخر جدید)
+        
+    Returns:
+        تعداد فایل‌های اضافه شده و تعداد فایل‌های خطادار
+    """
+    file_states = file_states or {}
+    decode_threads = decode_threads or workers
+    max_in_flight = workers * 2 + decode_threads
+    
+    added_count = 0
+    error_count = 0
+    batch = []
+    pending = deque()
+    files = iter(audio_files)
+    
+    with ExitStack() as stack:
+        if process_pool is None:
+            process_pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+        decode_pool = stack.enter_context(ThreadPoolExecutor(max_workers=decode_threads))
+        progress = stack.enter_context(tqdm(total=len(audio_files), desc="پردازش فایل‌ها"))
+        
+        def fill_pipeline():
+            while len(pending) < max_in_flight:
+                file_path = next(files, None)
+                if file_path is None:
+                    return
+                pending.append((file_path, decode_pool.submit(_decode_and_submit, file_path, process_pool, engine,
+                                                              file_states.get(file_path))))
+        
+        fill_pipeline()
+        while pending:
+            file_path, decode_future = pending.popleft()
+            try:
+                title, artist = extract_metadata(file_path)
+                file_state, extract_future = decode_future.result()
+                fingerprint = extract_future.result() if extract_future is not None else None
+                
+                if fingerprint is not None:
+                    batch.append(_song_record(title, artist, file_path, fingerprint, engine, file_state))
+                    added_count += 1
+                else:
+                    print(f"خطا در استخراج اثر انگشت برای فایل: {file_path}")
+                    error_count += 1
+                    
+            except Exception as e:
+                print(f"خطا در پردازش فایل {file_path}: {str(e)}")
+                traceback.print_exc()
+                error_count += 1
+            
+            progress.update(1)
+            fill_pipeline()
+            
+            # نوشتن دسته‌ای نتایج در دیتابیس
+            if len(batch) >= batch_size:
+                add_songs(batch)
+                batch = []
+    
+    if batch:
+        add_songs(batch)
+    
+    return added_count, error_count
+
+def _recompute_groups(file_path, groups):
+    """رمزگشایی و پیش‌پردازش یک بار فایل و استخراج فقط گروه‌های ویژگی مشخص"""
+    signal, sr = load_audio(file_path)
+    if signal is None:
+        return None
+    return extract_features(signal, sr, groups=groups)
+
+def refresh_feature_groups(workers=1, batch_size=50):
+    """محاسبه دوباره فقط گروه‌های ویژگی تغییر یافته یا تازه فعال شده آهنگ‌های موجود
+    
+    نسخه هر گروه ویژگی به پارامترهای آن وابسته است (feature_groups). برای هر آهنگی که
+    یکی از گروه‌های فعال را با نسخه فعلی ندارد، فایل یک بار رمزگشایی می‌شود، فقط همان
+    گروه‌ها استخراج می‌شوند و بقیه ستون‌ها از اثر انگشت ذخیره شده برداشته می‌شوند.
+    
+    Args:
+        workers: تعداد پردازه‌های موازی استخراج ویژگی (1 یعنی حالت ترتیبی)
+        batch_size: تعداد آهنگ‌ها در هر تراکنش دیتابیس
+        
+    Returns:
+        تعداد آهنگ‌های به‌روز شده و تعداد آهنگ‌های خطادار
+    """
+    target = current_layout()
+    stale = []
+    group_counts = {}
+    for state in get_feature_layouts():
+        groups = missing_groups(state['layout'], target)
+        if groups:
+            stale.append((state, groups))
+            for name in groups:
+                group_counts[name] = group_counts.get(name, 0) + 1
+    if not stale:
+        return 0, 0
+    print(f"{len(stale)} آهنگ نیازمند محاسبه دوباره گروه‌های ویژگی: "
+          + "، ".join(f"{name} ({count})" for name, count in group_counts.items()))
+    
+    updated_count = 0
+    error_count = 0
+    with ExitStack() as stack:
+        process_pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers)) if workers > 1 else None
+        progress = stack.enter_context(tqdm(total=len(stale), desc="محاسبه دوباره گروه‌های ویژگی"))
+        for start in range(0, len(stale), batch_size):
+            batch = stale[start:start + batch_size]
+            stored = {item['id']: item for item in get_fingerprints([state['id'] for state, _ in batch], raw=True)}
+            futures = [process_pool.submit(_recompute_groups, state['file_path'], groups)
+                       for state, groups in batch] if process_pool is not None else None
+            
+            updates = []
+            for i, (state, groups) in enumerate(batch):
+                try:
+                    partial = futures[i].result() if futures else _recompute_groups(state['file_path'], groups)
+                    song = stored.get(state['id'])
+                    if partial is None or song is None:
+                        print(f"خطا در محاسبه دوباره گروه‌های ویژگی برای فایل: {state['file_path']}")
+                        error_count += 1
+                    else:
+                        computed = [(group.name, group.version, group.width) for group in REGISTRY if group.name in groups]
+                        fingerprint, layout = merge_groups(song['fingerprint'], song['layout'], partial, computed, target)
+                        updates.append((state['id'], fingerprint, layout))
+                except Exception as e:
+                    print(f"خطا در پردازش فایل {state['file_path']}: {str(e)}")
+                    traceback.print_exc()
+                    error_count += 1
+                progress.update(1)
+            updated_count += update_fingerprints(updates)
+    
+    return updated_count, error_count
+
+def _run_indexing(audio_files, workers, decode_threads, batch_size, file_states=None, skipped_count=0,
+                  engine=FINGERPRINT_ENGINE):
+    """اجرای ایندکس‌گذاری ترتیبی یا موازی و نمایش نتایج
+
+    وضعیت فایل‌هایی که در file_states نیستند (برای ایندکس‌گذاری افزایشی بعدی) در همان
+    نخی محاسبه می‌شود که فایل را برای استخراج اثر انگشت می‌خواند.
+    """
+    # پردازش فایل‌ها
+    if workers > 1:
+        print(f"پردازش موازی با {workers} پردازه")
+        added_count, error_count = _index_parallel(audio_files, workers, decode_threads, batch_size, file_states, engine)
+    else:
+        added_count, error_count = _index_serial(audio_files, file_states, engine, batch_size)
     
     # نمایش نتایج
     print(f"\nایندکس‌گذاری به پایان رسید:")
     print(f"- {added_count} فایل با موفقیت اضافه شد")
     print(f"- {error_count} فایل با خطا مواجه شد")
+    if skipped_count:
+        print(f"- {skipped_count} فایل تکراری بدون پردازش رد شد")
+    
+    # محاسبه دوباره گروه‌های ویژگی که پس از تغییر تنظیمات نسخه‌شان عوض شده است
+    if engine == 'features':
+        refreshed_count, refresh_errors = refresh_feature_groups(workers, batch_size)
+        if refreshed_count or refresh_errors:
+            print(f"- گروه‌های ویژگی {refreshed_count} آهنگ دوباره محاسبه شد ({refresh_errors} خطا)")
     
     # نمایش تعداد کل آهنگ‌ها در دیتابیس
     songs = get_all_songs()
     print(f"تعداد کل آهنگ‌ها در دیتابیس: {len(songs)}")
+    
+    # هرس لاگ تغییرات (ربات‌هایی که عقب‌تر از تغییرات نگه داشته شده باشند کل ایندکس را بارگذاری می‌کنند)
+    pruned = prune_changes()
+    if pruned:
+        print(f"{pruned} تغییر قدیمی از لاگ تغییرات حذف شد")
+    
+    # به‌روزرسانی فایل جانبی ماتریس اثر انگشت‌ها برای بارگذاری سریع ربات
+    if FINGERPRINT_MATRIX_PATH and engine == 'features':
+        export_fingerprint_matrix(FINGERPRINT_MATRIX_PATH)
+
+def index_music_library(directory=MUSIC_LIBRARY_PATH, clear=False, workers=1, decode_threads=None, batch_size=50,
+                        engine=FINGERPRINT_ENGINE):
+    """ایندکس کردن کتابخانه موسیقی
+    
+    Args:
+        directory: مسیر پوشه کتابخانه
+        clear: آیا دیتابیس قبلی پاک شود؟
+        workers: تعداد پردازه‌های موازی استخراج ویژگی (1 یعنی حالت ترتیبی)
+        decode_threads: تعداد نخ‌های رمزگشایی در حالت موازی
+        batch_size: تعداد آهنگ‌ها در هر تراکنش دیتابیس
+        engine: موتور اثر انگشت ("features" یا "landmark")
+    """
+    print(f"شروع ایندکس‌گذاری موسیقی از پوشه: {directory}")
+    
+    # مقداردهی اولیه دیتابیس
+    init_db()
+    
+    # پاک کردن دیتابیس قبلی در صورت درخواست
+    if clear:
+        clear_database()
+        print("دیتابیس قبلی پاک شد")
+    
+    # دریافت فایل‌های صوتی
+    audio_files = get_audio_files(directory)
+    print(f"{len(audio_files)} فایل صوتی پیدا شد")
+    
+    # رد کردن فایل‌هایی که آهنگشان از قبل در دیتابیس است، پیش از استخراج اثر انگشت
+    existing = {(state['title'], state['artist']) for state in get_song_states()}
+    new_files = [path for path in audio_files if extract_metadata(path) not in existing]
+    skipped_count = len(audio_files) - len(new_files)
+    
+    _run_indexing(new_files, workers, decode_threads, batch_size, skipped_count=skipped_count, engine=engine)
+
+def _classify_files(audio_files, states, missing):
+    """دسته‌بندی فایل‌ها در برابر رکوردهای دیتابیس برای ایندکس‌گذاری افزایشی
+    
+    فایل‌هایی که اندازه و زمان تغییرشان با دیتابیس یکسان است رد می‌شوند، فایل‌های
+    جابه‌جا شده از روی هش محتوا شناسایی و فقط مسیرشان به‌روز می‌شود (و از `missing`
+    حذف می‌شوند) و فایل‌هایی که آهنگشان با مسیر دیگری در دیتابیس هست رد می‌شوند.
+    هش فایل جدیدی که هم‌اندازه هیچ فایل حذف شده‌ای نیست اینجا محاسبه نمی‌شود و در
+    مرحله پردازش، همراه با خواندن فایل، محاسبه می‌شود.
+    
+    Args:
+        audio_files: مسیر فایل‌های صوتی برای بررسی
+        states: رکوردهای دیتابیس (خروجی get_song_states) شامل رکورد مسیرهای audio_files
+        missing: دیکشنری شناسه به رکورد آهنگ‌هایی که فایلشان دیگر وجود ندارد
+        
+    Returns:
+        تاپل (فایل‌های جدید یا تغییر یافته برای پردازش، دیکشنری مسیر به وضعیت فایل‌هایی
+        که وضعیتشان محاسبه شده، دیکشنری شمارش unchanged، renamed و skipped)
+    """
+    by_path = {state['file_path']: state for state in states}
+    # چند فایل حذف شده ممکن است محتوای یکسان داشته باشند
+    missing_by_hash = {}
+    for state in missing.values():
+        if state['hash']:
+            missing_by_hash.setdefault(state['hash'], []).append(state)
+    missing_sizes = {state['size'] for candidates in missing_by_hash.values() for state in candidates}
+    existing_meta = {(state['title'], state['artist']) for state in states if state['id'] not in missing}
+    
+    to_process = []
+    file_states = {}
+    counts = {'unchanged': 0, 'renamed': 0, 'skipped': 0}
+    
+    for file_path in tqdm(audio_files, desc="بررسی تغییرات"):
+        try:
+            stat = os.stat(file_path)
+            row = by_path.get(file_path)
+            if row and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+                counts['unchanged'] += 1
+                continue
+            
+            # فایل جدیدی که نمی‌تواند جابه‌جا شده باشد؛ هش هنگام پردازش محاسبه می‌شود
+            if not row and stat.st_size not in missing_sizes and None not in missing_sizes:
+                if extract_metadata(file_path) in existing_meta:
+                    counts['skipped'] += 1
+                else:
+                    to_process.append(file_path)
+                continue
+            
+            file_state = get_file_state(file_path)
+        except OSError as e:
+            print(f"خطا در خواندن فایل {file_path}: {str(e)}")
+            continue
+        
+        if row:
+            # رکورد قدیمی بدون هش یا فایلی که فقط زمان تغییرش عوض شده
+            if row['hash'] is None or row['hash'] == file_state['hash']:
+                update_song_file(row['id'], file_state=file_state)
+                counts['unchanged'] += 1
+                continue
+            # محتوای فایل تغییر کرده و رکورد قبلی هنگام درج جایگزین می‌شود
+            file_state['replaces'] = row['id']
+        else:
+            # فایل جابه‌جا یا تغییر نام داده شده (از بین فایل‌های هم‌محتوا، ترجیحاً همان آهنگ)
+            candidates = missing_by_hash.get(file_state['hash'])
+            if candidates:
+                title, artist = extract_metadata(file_path)
+                moved = next((state for state in candidates if (state['title'], state['artist']) == (title, artist)),
+                             candidates[0])
+                candidates.remove(moved)
+                if not candidates:
+                    del missing_by_hash[file_state['hash']]
+                update_song_file(moved['id'], file_path=file_path, title=title, artist=artist, file_state=file_state)
+                del missing[moved['id']]
+                counts['renamed'] += 1
+                continue
+            if extract_metadata(file_path) in existing_meta:
+                counts['skipped'] += 1
+                continue
+        
+        to_process.append(file_path)
+        file_states[file_path] = file_state
+    
+    return to_process, file_states, counts
+
+def sync_music_library(directory=MUSIC_LIBRARY_PATH, workers=1, decode_threads=None, batch_size=50,
+                       engine=FINGERPRINT_ENGINE, audio_files=None):
+    """ایندکس‌گذاری افزایشی: فقط فایل‌های جدید یا تغییر یافته پردازش می‌شوند
+    
+    فایل‌هایی که اندازه و زمان تغییرشان با دیتابیس یکسان است رد می‌شوند، فایل‌های
+    جابه‌جا شده از روی هش محتوا شناسایی و فقط مسیرشان به‌روز می‌شود و رکورد
+    فایل‌های حذف شده پاک می‌شود. چون هر آهنگ همراه با وضعیت فایلش ذخیره می‌شود،
+    اجرای دوباره پس از توقف ناگهانی از همان جایی که متوقف شده ادامه می‌یابد.
+    
+    Args:
+        directory: مسیر پوشه کتابخانه
+        workers: تعداد پردازه‌های موازی استخراج ویژگی
+        decode_threads: تعداد نخ‌های رمزگشایی در حالت موازی
+        batch_size: تعداد آهنگ‌ها در هر تراکنش دیتابیس
+        engine: موتور اثر انگشت ("features" یا "landmark")
+        audio_files: فهرست آماده فایل‌های صوتی کتابخانه (پیش‌فرض: پیمایش directory)
+    """
+    print(f"شروع ایندکس‌گذاری افزایشی از پوشه: {directory}")
+    init_db()
+    
+    states = get_song_states()
+    missing = {state['id']: state for state in states if not os.path.exists(state['file_path'])}
+    
+    if audio_files is None:
+        audio_files = get_audio_files(directory)
+    print(f"{len(audio_files)} فایل صوتی پیدا شد")
+    
+    to_process, file_states, counts = _classify_files(audio_files, states, missing)
+    
+    # حذف رکورد فایل‌هایی که دیگر وجود ندارند
+    removed_count = delete_songs(missing.keys())
+    
+    print(f"- {counts['unchanged']} فایل بدون تغییر")
+    print(f"- {counts['renamed']} فایل جابه‌جا شده")
+    print(f"- {removed_count} آهنگ حذف شده از دیتابیس")
+    print(f"- {len(to_process)} فایل جدید یا تغییر یافته برای پردازش")
+    
+    _run_indexing(to_process, workers, decode_threads, batch_size, file_states, counts['skipped'], engine)
+
+def _ingest_batch(ready, deleted, workers, decode_threads, batch_size, engine, process_pool):
+    """ایندکس‌گذاری یک دسته از تغییرات حالت --watch
+    
+    Args:
+        ready: لیست (مسیر، زمان تشخیص) فایل‌های جدید یا تغییر یافته
+        deleted: لیست مسیر فایل‌های حذف شده
+        
+    Returns:
+        تاپل (تعداد اضافه شده، تعداد خطادار، تعداد حذف شده، دیکشنری شمارش _classify_files)
+    """
+    audio_files = [path for path, _ in ready]
+    # فقط رکوردهای مسیرها و عنوان‌های همین دسته خوانده می‌شوند، نه کل جدول
+    titles = [extract_metadata(path)[0] for path in audio_files]
+    states = get_song_states(file_paths=audio_files + deleted, titles=titles)
+    deleted_paths = set(deleted)
+    missing = {state['id']: state for state in states
+               if state['file_path'] in deleted_paths and not os.path.exists(state['file_path'])}
+    
+    to_process, file_states, counts = _classify_files(audio_files, states, missing)
+    removed_count = delete_songs(missing.keys())
+    
+    added_count = error_count = 0
+    if to_process and workers > 1:
+        added_count, error_count = _index_parallel(to_process, workers, decode_threads, batch_size, file_states,
+                                                   engine, process_pool)
+    elif to_process:
+        added_count, error_count = _index_serial(to_process, file_states, engine, batch_size)
+    return added_count, error_count, removed_count, counts
+
+def watch_music_library(directory=MUSIC_LIBRARY_PATH, workers=1, decode_threads=None, batch_size=50,
+                        engine=FINGERPRINT_ENGINE, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE,
+                        max_pending=WATCH_MAX_PENDING, full_scan_every=WATCH_FULL_SCAN_EVERY):
+    """حالت پایش: ایندکس‌گذاری پیوسته فایل‌های جدید، تغییر یافته یا حذف شده تا توقف با Ctrl+C
+    
+    پس از یک ایندکس‌گذاری افزایشی اولیه، کتابخانه هر `interval` ثانیه با LibraryScanner
+    (بدون پیمایش دوباره پوشه‌های تغییر نکرده) بررسی می‌شود. هر تغییر پس از `debounce`
+    ثانیه آرام بودن در دسته‌هایی حداکثر `batch_size` فایلی پردازش و ثبت می‌شود؛
+    ربات‌ها آهنگ‌های جدید را از لاگ تغییرات دیتابیس دریافت می‌کنند. اگر تعداد
+    تغییرات در انتظار به `max_pending` برسد، پیمایش تا کم شدن صف متوقف می‌شود
+    (فایل‌های دیده نشده روی دیسک می‌مانند و در پیمایش بعدی پیدا می‌شوند). برای هر
+    دسته تأخیر ثبت (از تشخیص فایل تا ثبت در دیتابیس؛ حداکثر `interval` ثانیه پس از
+    رسیدن فایل) و تعداد تغییرات در انتظار گزارش می‌شود.
+    
+    Args:
+        directory: مسیر پوشه کتابخانه
+        workers: تعداد پردازه‌های موازی استخراج ویژگی
+        decode_threads: تعداد نخ‌های رمزگشایی در حالت موازی
+        batch_size: تعداد فایل‌های هر دسته و هر تراکنش دیتابیس
+        engine: موتور اثر انگشت ("features" یا "landmark")
+        interval: فاصله پیمایش‌ها (ثانیه)
+        debounce: مدت آرام بودن لازم برای هر تغییر (ثانیه)
+        max_pending: حداکثر تغییرات در انتظار پیش از توقف پیمایش
+        full_scan_every: هر چند پیمایش وضعیت همه فایل‌ها بررسی شود
+    """
+    scanner = LibraryScanner(directory, full_scan_every=full_scan_every)
+    queue = IngestQueue(debounce)
+    
+    # پیمایش اولیه همان فهرست ایندکس‌گذاری افزایشی است و تغییرات بعد از آن را مبنا قرار می‌دهد
+    changed, _ = scanner.scan()
+    sync_music_library(directory, workers, decode_threads, batch_size, engine, audio_files=list(changed))
+    print(f"\nپایش پوشه {directory} (هر {interval} ثانیه، آرام شدن {debounce} ثانیه، "
+          f"حداکثر {max_pending} تغییر در انتظار)؛ برای توقف Ctrl+C")
+    
+    totals = {'added': 0, 'errors': 0, 'removed': 0, 'batches': 0, 'paused_scans': 0}
+    lags = []
+    with ExitStack() as stack:
+        process_pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers)) if workers > 1 else None
+        try:
+            while True:
+                if len(queue) < max_pending:
+                    changed, deleted = scanner.scan()
+                    queue.update(changed, deleted)
+                else:
+                    # فشار برگشتی: تا پردازش تغییرات در انتظار، تغییرات جدید روی دیسک می‌مانند
+                    totals['paused_scans'] += 1
+                
+                ready, deleted = queue.take(batch_size)
+                if not ready and not deleted:
+                    # تغییرات در انتظار زودتر از پیمایش بعدی آماده می‌شوند
+                    time.sleep(min(interval, debounce) if len(queue) else interval)
+                    continue
+                
+                added, errors, removed, counts = _ingest_batch(ready, deleted, workers, decode_threads,
+                                                               batch_size, engine, process_pool)
+                prune_changes()
+                committed = time.time()
+                # تأخیر ثبت: از تشخیص فایل در پیمایش تا ثبت در دیتابیس (زمان تغییر فایل با
+                # کپی‌هایی که آن را حفظ می‌کنند، مثل rsync -t، زمان رسیدن فایل نیست)
+                batch_lags = [committed - detected for _, detected in ready]
+                lags.extend(batch_lags)
+                totals['added'] += added
+                totals['errors'] += errors
+                totals['removed'] += removed
+                totals['batches'] += 1
+                
+                parts = [f"{added} اضافه، {counts['renamed']} جابه‌جا، {removed} حذف، {errors} خطا"]
+                if batch_lags:
+                    parts.append(f"تأخیر ثبت p50 {np.median(batch_lags):.1f}s، بیشینه {max(batch_lags):.1f}s")
+                oldest = queue.oldest()
+                parts.append(f"{len(queue)} تغییر در انتظار"
+                             + (f" (قدیمی‌ترین {committed - oldest:.0f}s)" if oldest is not None else ""))
+                scan = scanner.last_scan
+                parts.append(f"پیمایش آخر {scan['seconds'] * 1000:.0f}ms "
+                             f"({scan['listed']} از {scan['directories']} پوشه خوانده شد)")
+                print(f"[{time.strftime('%H:%M:%S')}] دسته {totals['batches']}: " + "؛ ".join(parts))
+        except KeyboardInterrupt:
+            print("\nپایش متوقف شد")
+    
+    print(f"- {totals['batches']} دسته، {totals['added']} فایل اضافه شد، {totals['removed']} آهنگ حذف شد، "
+          f"{totals['errors']} خطا")
+    if lags:
+        print(f"- تأخیر ثبت: p50 {np.median(lags):.1f}s، p95 {np.percentile(lags, 95):.1f}s، بیشینه {max(lags):.1f}s")
+    if totals['paused_scans']:
+        print(f"- {totals['paused_scans']} پیمایش به دلیل پر بودن صف به تعویق افتاد")
+    
+    # فایل جانبی برای راه‌اندازی سریع بعدی ربات (ربات‌های در حال اجرا از لاگ تغییرات به‌روز می‌شوند)
+    if FINGERPRINT_MATRIX_PATH and engine == 'features':
+        export_fingerprint_matrix(FINGERPRINT_MATRIX_PATH)
 
 if __name__ == "__main__":
     # تنظیم پارسر آرگومان‌ها
@@ -111,8 +647,51 @@ if __name__ == "__main__":
                         help='مسیر پوشه کتابخانه موسیقی')
     parser.add_argument('--clear', action='store_true', 
                         help='پاک کردن دیتابیس قبلی')
+    parser.add_argument('--update', action='store_true',
+                        help='ایندکس‌گذاری افزایشی: فقط فایل‌های جدید یا تغییر یافته')
+    parser.add_argument('--watch', action='store_true',
+                        help='حالت پایش: ایندکس‌گذاری پیوسته فایل‌های جدید، تغییر یافته یا حذف شده تا توقف با Ctrl+C')
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL,
+                        help='فاصله پیمایش‌های حالت پایش (ثانیه)')
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE,
+                        help='مدت آرام بودن لازم برای هر فایل پیش از ایندکس‌گذاری در حالت پایش (ثانیه)')
+    parser.add_argument('--engine', choices=['features', 'landmark'], default=FINGERPRINT_ENGINE,
+                        help='موتور اثر انگشت (برای تغییر موتور، دیتابیس را با --clear از نو بسازید)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='تعداد پردازه‌های موازی برای استخراج ویژگی‌ها')
+    parser.add_argument('--decode-threads', type=int, default=None,
+                        help='تعداد نخ‌های رمزگشایی فایل‌ها (پیش‌فرض: برابر workers)')
+    parser.add_argument('--batch-size', type=int, default=50,
+                        help='تعداد آهنگ‌ها در هر تراکنش دیتابیس')
+    parser.add_argument('--fit-reduction', action='store_true',
+                        help='آموزش تبدیل کاهش ابعاد (استانداردسازی + PCA) روی کتابخانه پس از ایندکس‌گذاری')
+    parser.add_argument('--components', type=int, default=REDUCTION_COMPONENTS,
+                        help='تعداد مؤلفه‌های اصلی تبدیل کاهش ابعاد')
+    parser.add_argument('--build-ann', action='store_true',
+                        help='ساخت ایندکس تقریبی (IVF) پس از ایندکس‌گذاری برای جستجوی سریع در کتابخانه‌های بزرگ')
     
     args = parser.parse_args()
     
+    if args.update and args.clear:
+        parser.error('گزینه‌های --update و --clear را نمی‌توان با هم استفاده کرد')
+    if args.watch and args.clear:
+        parser.error('گزینه‌های --watch و --clear را نمی‌توان با هم استفاده کرد')
+    
     # شروع ایندکس‌گذاری
-    index_music_library(args.dir, args.clear) 
\ No newline at end of file
+    if args.watch:
+        watch_music_library(args.dir, args.workers, args.decode_threads, args.batch_size, args.engine,
+                            args.interval, args.debounce)
+    elif args.update:
+        sync_music_library(args.dir, args.workers, args.decode_threads, args.batch_size, args.engine)
+    else:
+        index_music_library(args.dir, args.clear, args.workers, args.decode_threads, args.batch_size, args.engine)
+    
+    # تبدیل جدید فضای بردارها را تغییر می‌دهد، بنابراین فایل جانبی ماتریس و
+    # ایندکس تقریبی پس از آن ساخته می‌شوند
+    if args.fit_reduction and args.engine == 'features':
+        fit_projection(REDUCTION_PATH or None, args.components)
+        if FINGERPRINT_MATRIX_PATH:
+            export_fingerprint_matrix(FINGERPRINT_MATRIX_PATH)
+    
+    if args.build_ann:
+        build_ann_index(ANN_INDEX_PATH or None)
@@ -0,0 +1,213 @@
+"""
+موتور اثر انگشت نشانه‌ای (landmark): هش زوج قله‌های طیفی با زمان وقوعشان
+
+برخلاف بردار ویژگی سراسری، هر آهنگ به هزاران هش کوچک تبدیل می‌شود که در یک
+ایندکس معکوس (هش ← آهنگ، زمان) ذخیره می‌شوند. یک کلیپ کوتاه از هر جای آهنگ
+با رأی‌گیری روی اختلاف زمان هش‌های مشترک پیدا می‌شود و هزینه جستجو به تعداد
+هش‌های کلیپ بستگی دارد، نه به اندازه کتابخانه.
+"""
+
+import numpy as np
+import librosa
+from scipy.ndimage import maximum_filter
+
+from config import (DURATION, LANDMARK_SAMPLE_RATE, LANDMARK_N_FFT, LANDMARK_HOP_LENGTH,
+                    LANDMARK_PEAK_NEIGHBORHOOD, LANDMARK_MIN_DB, LANDMARK_FAN_OUT,
+                    LANDMARK_MAX_DT, LANDMARK_MIN_VOTES, LANDMARK_PEAKS_PER_SECOND)
+from audio_fingerprint import load_audio
+
+# تعداد بیت‌های هر بخش هش: باند قله اول، باند قله دوم و فاصله زمانی
+FREQ_BITS = 10
+DT_BITS = 6
+
+
+def find_peaks(signal, n_fft=LANDMARK_N_FFT, hop_length=LANDMARK_HOP_LENGTH,
+               neighborhood=LANDMARK_PEAK_NEIGHBORHOOD, min_db=LANDMARK_MIN_DB,
+               peaks_per_second=LANDMARK_PEAKS_PER_SECOND):
+    """یافتن قله‌های محلی طیف‌نگار
+
+    برای مقاومت در برابر نویز، در هر بازه یک‌ثانیه‌ای فقط قوی‌ترین قله‌ها نگه داشته می‌شوند.
+
+    Args:
+        signal: آرایه یک‌بعدی سیگنال صوتی
+        n_fft: اندازه FFT
+        hop_length: طول پرش
+        neighborhood: اندازه همسایگی بیشینه محلی
+        min_db: حداقل دامنه قله نسبت به بیشینه طیف
+        peaks_per_second: حداکثر تعداد قله‌ها در هر ثانیه
+
+    Returns:
+        آرایه‌های شماره فریم و شماره باند فرکانسی قله‌ها، مرتب بر اساس زمان
+    """
+    spectrum = np.abs(librosa.stft(signal, n_fft=n_fft, hop_length=hop_length))
+    spectrum = spectrum[:1 << FREQ_BITS]
+    spectrum_db = librosa.amplitude_to_db(spectrum, ref=np.max)
+
+    local_max = maximum_filter(spectrum_db, size=neighborhood, mode='constant', cval=-np.inf) == spectrum_db
+    peaks = local_max & (spectrum_db > min_db)
+
+    freqs, times = np.nonzero(peaks)
+    amplitudes = spectrum_db[freqs, times]
+
+    # نگه داشتن قوی‌ترین قله‌های هر بازه یک‌ثانیه‌ای
+    block = np.maximum(1, int(round(LANDMARK_SAMPLE_RATE / hop_length)))
+    blocks = times // block
+    order = np.lexsort((-amplitudes, blocks))
+    block_start = np.searchsorted(blocks[order], blocks[order], side='left')
+    keep = order[np.arange(len(order)) - block_start < peaks_per_second]
+
+    freqs, times = freqs[keep], times[keep]
+    order = np.lexsort((freqs, times))
+    return times[order], freqs[order]
+
+
+def hash_peaks(times, freqs, fan_out=LANDMARK_FAN_OUT, max_dt=LANDMARK_MAX_DT):
+    """ساخت هش از زوج قله‌ها
+
+    هر قله با `fan_out` قله بعدی خود جفت می‌شود، به شرط آنکه فاصله زمانی
+    آنها بین 1 و max_dt فریم باشد.
+
+    Args:
+        times: شماره فریم قله‌ها (مرتب صعودی)
+        freqs: شماره باند فرکانسی قله‌ها
+        fan_out: تعداد جفت‌های هر قله
+        max_dt: حداکثر فاصله زمانی جفت‌ها (حداکثر 2^DT_BITS - 1)
+
+    Returns:
+        آرایه هش‌ها (uint32) و آرایه زمان قله اول هر هش (int32)
+    """
+    max_dt = min(max_dt, (1 << DT_BITS) - 1)
+    hashes = []
+    offsets = []
+
+    for k in range(1, fan_out + 1):
+        if k >= len(times):
+            break
+        anchor_t, target_t = times[:-k], times[k:]
+        anchor_f, target_f = freqs[:-k], freqs[k:]
+        dt = target_t - anchor_t
+        valid = (dt >= 1) & (dt <= max_dt)
+
+        hashes.append(
+            (anchor_f[valid].astype(np.uint32) << (FREQ_BITS + DT_BITS))
+            | (target_f[valid].astype(np.uint32) << DT_BITS)
+            | dt[valid].astype(np.uint32)
+        )
+        offsets.append(anchor_t[valid].astype(np.int32))
+
+    if not hashes:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int32)
+    return np.concatenate(hashes), np.concatenate(offsets)
+
+
+def extract_landmarks(signal, sr=LANDMARK_SAMPLE_RATE):
+    """استخراج هش‌های نشانه‌ای از یک سیگنال
+
+    Args:
+        signal: آرایه یک‌بعدی سیگنال صوتی با نرخ LANDMARK_SAMPLE_RATE
+        sr: نرخ نمونه‌برداری سیگنال
+
+    Returns:
+        تاپل (hashes, offsets) یا None اگر سیگنال خالی باشد
+    """
+    if signal is None:
+        return None
+    if sr != LANDMARK_SAMPLE_RATE:
+        signal = librosa.resample(signal, orig_sr=sr, target_sr=LANDMARK_SAMPLE_RATE)
+
+    times, freqs = find_peaks(signal)
+    return hash_peaks(times, freqs)
+
+
+def generate_landmarks(file_path, duration=None):
+    """تولید هش‌های نشانه‌ای برای یک فایل
+
+    Args:
+        file_path: مسیر فایل صوتی
+        duration: مدت زمان مورد نظر (None یعنی کل فایل، برای ایندکس‌گذاری)
+
+    Returns:
+        تاپل (hashes, offsets) یا None در صورت خطا
+    """
+    signal, sr = load_audio(file_path, sr=LANDMARK_SAMPLE_RATE, duration=duration)
+    return extract_landmarks(signal, sr)
+
+
+def generate_query_landmarks(file_path):
+    """تولید هش‌های نشانه‌ای برای کلیپ ارسالی کاربر (حداکثر DURATION ثانیه)"""
+    return generate_landmarks(file_path, duration=DURATION)
+
+
+def match_landmarks(landmarks, min_votes=LANDMARK_MIN_VOTES, top_k=None):
+    """یافتن آهنگ‌های مطابق با رأی‌گیری روی هیستوگرام اختلاف زمان
+
+    برای هر هش مشترک، اختلاف زمان آن در آهنگ و در کلیپ محاسبه می‌شود؛ اگر کلیپ
+    واقعاً بخشی از آهنگ باشد، تعداد زیادی از هش‌ها یک اختلاف زمان یکسان دارند.
+
+    Args:
+        landmarks: تاپل (hashes, offsets) کلیپ
+        min_votes: حداقل تعداد رأی هم‌راستا برای پذیرش تطابق
+        top_k: حداکثر تعداد نتایج
+
+    Returns:
+        لیست آهنگ‌های پیدا شده به ترتیب نزولی رأی، با همان قالب compare_fingerprints؛
+        مقدار similarity نسبت رأی‌های هم‌راستا به تعداد هش‌های کلیپ است
+    """
+    from database import get_landmark_matches, get_songs_by_ids
+
+    if landmarks is None:
+        return []
+    query_hashes, query_offsets = landmarks
+    if len(query_hashes) == 0:
+        return []
+
+    matches = get_landmark_matches(query_hashes)
+    if not matches:
+        return []
+    match_hashes, song_ids, song_offsets = (np.asarray(column, dtype=np.int64) for column in zip(*matches))
+
+    # پیوند هر تطابق پایگاه داده با همه رخدادهای همان هش در کلیپ
+    order = np.argsort(query_hashes, kind='stable')
+    sorted_hashes = query_hashes[order].astype(np.int64)
+    left = np.searchsorted(sorted_hashes, match_hashes, side='left')
+    right = np.searchsorted(sorted_hashes, match_hashes, side='right')
+    counts = right - left
+    starts = np.cumsum(counts) - counts
+    match_index = np.repeat(np.arange(len(match_hashes)), counts)
+    query_index = order[np.arange(counts.sum()) - np.repeat(starts - left, counts)]
+    if len(match_index) == 0:
+        return []
+
+    deltas = song_offsets[match_index] - query_offsets[query_index].astype(np.int64)
+    pair_song_ids = song_ids[match_index]
+
+    # هیستوگرام (آهنگ، اختلاف زمان) و انتخاب بیشترین رأی برای هر آهنگ
+    keys, votes = np.unique(np.stack([pair_song_ids, deltas], axis=1), axis=0, return_counts=True)
+    order = np.lexsort((-votes, keys[:, 0]))
+    _, first = np.unique(keys[order, 0], return_index=True)
+    best = order[first]
+    best = best[votes[best] >= min_votes]
+    best = best[np.argsort(-votes[best], kind='stable')]
+
+    ranked = [(keys[i, 0], votes[i], keys[i, 1]) for i in best]
+    if top_k is not None:
+        ranked = ranked[:top_k]
+
+    songs = get_songs_by_ids(int(song_id) for song_id, _, _ in ranked)
+    frame_seconds = LANDMARK_HOP_LENGTH / LANDMARK_SAMPLE_RATE
+
+    results = []
+    for song_id, count, delta in ranked:
+        song = songs.get(int(song_id))
+        if song is None:
+            continue
+        results.append({
+            'id': song.id,
+            'title': song.title,
+            'artist': song.artist,
+            'similarity': float(count) / len(query_hashes),
+            'votes': int(count),
+            'offset': float(delta) * frame_seconds
+        })
+
+    return results
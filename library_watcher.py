@@ -0,0 +1,205 @@
+"""
+پایش پوشه کتابخانه موسیقی برای حالت --watch ایندکس‌گذار
+
+`LibraryScanner` درخت کتابخانه را با os.scandir پیمایش می‌کند و فهرست فایل‌های هر
+پوشه را همراه با زمان تغییر پوشه نگه می‌دارد؛ در دورهای بعد فقط پوشه‌هایی که زمان
+تغییرشان عوض شده دوباره خوانده می‌شوند. `IngestQueue` تغییرات را تا آرام شدن هر
+فایل (پایان کپی یا نوشتن آن) نگه می‌دارد و آن‌ها را در دسته‌هایی برای ایندکس‌گذاری
+تحویل می‌دهد.
+"""
+
+import os
+import time
+
+# پسوندهای فایل‌های صوتی کتابخانه
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.wav', '.flac', '.ogg')
+
+
+def _file_state(path):
+    """اندازه و زمان تغییر فایل یا None اگر فایل وجود نداشته باشد"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class LibraryScanner:
+    """پیمایش افزایشی درخت کتابخانه با کش زمان تغییر پوشه‌ها
+
+    افزودن، حذف یا تغییر نام فایل‌ها زمان تغییر پوشه والد را عوض می‌کند، بنابراین
+    پوشه‌هایی که زمان تغییرشان ثابت مانده بدون خواندن دوباره فهرستشان رد می‌شوند و
+    هر دور فقط یک stat برای هر پوشه لازم است. بازنویسی درجای یک فایل زمان تغییر
+    پوشه را عوض نمی‌کند، به همین دلیل هر `full_scan_every` دور وضعیت همه فایل‌های
+    شناخته شده هم بررسی می‌شود. مانند glob، فایل‌ها و پوشه‌های پنهان نادیده گرفته
+    می‌شوند و پسوندها به حروف کوچک و بزرگ حساس هستند.
+    """
+
+    def __init__(self, directory, extensions=AUDIO_EXTENSIONS, full_scan_every=12, settle=2.0):
+        """
+        Args:
+            directory: پوشه ریشه کتابخانه
+            extensions: پسوندهای فایل‌های صوتی
+            full_scan_every: هر چند دور وضعیت همه فایل‌ها بررسی شود (1 یعنی هر دور)
+            settle: پوشه‌هایی که در این چند ثانیه اخیر تغییر کرده‌اند کش نمی‌شوند
+                (تغییر دیگری در همان تیک زمان تغییر پوشه قابل تشخیص نیست)
+        """
+        self.directory = directory
+        self.extensions = tuple(extensions)
+        self.full_scan_every = max(full_scan_every, 1)
+        self.settle = settle
+        self.files = {}
+        self.scans = 0
+        self.last_scan = {}
+        self._dirs = {}
+
+    def scan(self):
+        """یک دور پیمایش کتابخانه
+
+        Returns:
+            تاپل (دیکشنری فایل‌های جدید یا تغییر یافته به (اندازه، زمان تغییر)، مجموعه فایل‌های حذف شده)
+        """
+        start = time.perf_counter()
+        verify = self.scans % self.full_scan_every == 0
+        self.scans += 1
+        now_ns = time.time_ns()
+
+        current = {}
+        dirs = {}
+        visited = set()
+        listed = 0
+        stack = [self.directory]
+        while stack:
+            path = stack.pop()
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # جلوگیری از حلقه پیوندهای نمادین
+            if (stat.st_dev, stat.st_ino) in visited:
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+
+            cached = self._dirs.get(path)
+            if cached is not None and cached[0] == stat.st_mtime_ns:
+                _, files, subdirs = cached
+                for file_path in files:
+                    state = self.files.get(file_path)
+                    if verify or state is None:
+                        state = _file_state(file_path)
+                    if state is not None:
+                        current[file_path] = state
+            else:
+                listed += 1
+                files, subdirs = [], []
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            if entry.name.startswith('.'):
+                                continue
+                            try:
+                                if entry.is_dir():
+                                    subdirs.append(entry.path)
+                                elif entry.name.endswith(self.extensions) and entry.is_file():
+                                    entry_stat = entry.stat()
+                                    files.append(entry.path)
+                                    current[entry.path] = (entry_stat.st_size, entry_stat.st_mtime)
+                            except OSError:
+                                continue
+                except OSError:
+                    continue
+
+            if now_ns - stat.st_mtime_ns > self.settle * 1e9:
+                dirs[path] = (stat.st_mtime_ns, files, subdirs)
+            stack.extend(reversed(subdirs))
+
+        changed = {path: state for path, state in current.items() if self.files.get(path) != state}
+        deleted = set(self.files) - set(current)
+        self.files = current
+        self._dirs = dirs
+        self.last_scan = {
+            'seconds': time.perf_counter() - start,
+            'directories': len(visited),
+            'listed': listed,
+            'files': len(current),
+            'full': verify,
+        }
+        return changed, deleted
+
+
+class IngestQueue:
+    """صف تغییرات در انتظار ایندکس‌گذاری با پنجره آرام شدن (debounce)
+
+    هر فایل جدید یا تغییر یافته فقط وقتی آماده است که `window` ثانیه تغییری در
+    اندازه و زمان تغییرش دیده نشود (مثلاً کپی آن تمام شده باشد). حذف‌ها هم همین
+    مدت نگه داشته می‌شوند تا جابه‌جایی یک فایل (حذف و افزودن همزمان) در یک دسته
+    تشخیص داده شود و اثر انگشت آن دوباره محاسبه نشود.
+    """
+
+    def __init__(self, window=3.0, clock=time.time):
+        """
+        Args:
+            window: مدت آرام بودن لازم برای هر تغییر (ثانیه)
+            clock: تابع زمان (ثانیه)
+        """
+        self.window = window
+        self.clock = clock
+        self._files = {}
+        self._deleted = {}
+
+    def __len__(self):
+        return len(self._files) + len(self._deleted)
+
+    def update(self, changed, deleted):
+        """ثبت خروجی یک دور LibraryScanner.scan"""
+        now = self.clock()
+        for path, state in changed.items():
+            entry = self._files.get(path)
+            self._files[path] = {'state': state, 'changed': now, 'detected': entry['detected'] if entry else now}
+            self._deleted.pop(path, None)
+        for path in deleted:
+            self._files.pop(path, None)
+            self._deleted.setdefault(path, now)
+
+    def oldest(self):
+        """زمان تشخیص قدیمی‌ترین تغییر در انتظار یا None"""
+        times = [entry['detected'] for entry in self._files.values()] + list(self._deleted.values())
+        return min(times) if times else None
+
+    def take(self, limit):
+        """برداشتن تغییرات آماده
+
+        وضعیت هر فایل پیش از تحویل دوباره بررسی می‌شود؛ فایلی که هنوز در حال نوشتن
+        است به صف برمی‌گردد.
+
+        Args:
+            limit: حداکثر تعداد فایل‌های جدید یا تغییر یافته
+
+        Returns:
+            تاپل (لیست (مسیر، زمان تشخیص) فایل‌های آماده به ترتیب تشخیص، لیست مسیر فایل‌های حذف شده)
+        """
+        now = self.clock()
+        deadline = now - self.window
+        ready = []
+        for path, entry in sorted(self._files.items(), key=lambda item: item[1]['detected']):
+            if len(ready) >= limit:
+                break
+            if entry['changed'] > deadline:
+                continue
+            state = _file_state(path)
+            if state is None:
+                # فایل پیش از آماده شدن حذف شد
+                del self._files[path]
+                self._deleted.setdefault(path, now)
+            elif state != entry['state']:
+                entry['state'] = state
+                entry['changed'] = now
+            else:
+                ready.append((path, entry['detected']))
+        for path, _ in ready:
+            del self._files[path]
+
+        deleted = [path for path, detected in self._deleted.items() if detected <= deadline]
+        for path in deleted:
+            del self._deleted[path]
+        return ready, deleted
@@ -0,0 +1,670 @@
+"""
+سرویس تطبیق مستقل: یک پردازه ایندکس اثر انگشت‌ها را در حافظه نگه می‌دارد و به چند ربات پاسخ می‌دهد
+
+هر پردازه ربات در حالت عادی یک نسخه کامل از ماتریس اثر انگشت‌ها را در حافظه دارد.
+با این سرویس ایندکس فقط یک بار بارگذاری می‌شود و ربات‌ها (و test_audio.py) از طریق
+سوکت یونیکس یا TCP محلی با کلاینت سبک MatcherClient جستجو می‌کنند.
+
+پروتکل: هر پیام یک قاب با پیشوند 8 بایتی (طول سرآیند JSON و طول داده باینری، هر دو
+big-endian)، سپس سرآیند JSON و داده باینری است. داده باینری ماتریس float32 کوئری‌ها
+(به ترتیب سطری و با ابعاد `shape` در سرآیند) است، بنابراین هر درخواست می‌تواند یک دسته
+کوئری داشته باشد. عملیات‌ها:
+    - health: وضعیت سرویس و ایندکس
+    - search: جستجوی یک یا چند کوئری (threshold، top_k، nprobe و candidates اختیاری)
+    - shortlist: مرحله اول تطبیق دو مرحله‌ای (size و threshold)
+
+درخواست‌های جستجوی دقیق کلاینت‌های همزمان در یک پنجره زمانی کوتاه جمع و با یک ضرب
+ماتریس-ماتریس پاسخ داده می‌شوند. ایندکس هر INDEX_SYNC_SECONDS ثانیه با لاگ تغییرات
+دیتابیس همگام می‌شود (فقط آهنگ‌های افزوده یا حذف شده). معیارهای Prometheus و وضعیت سرویس (/health) از
+سرور HTTP معیارها ارائه می‌شوند.
+"""
+
+import os
+import json
+import stat
+import time
+import socket
+import struct
+import asyncio
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+from config import (MATCHER_ADDRESS, MATCHER_BATCH_WINDOW_MS, MATCHER_MAX_BATCH, MATCHER_TIMEOUT,
+                    MATCHER_METRICS_PORT, METRICS_HOST, SIMILARITY_THRESHOLD, FINGERPRINT_MATRIX_PATH,
+                    ANN_NPROBE, ANN_INDEX_PATH, INDEX_SYNC_SECONDS)
+from metrics import Registry, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# پیشوند هر قاب: طول سرآیند JSON و طول داده باینری
+FRAME_PREFIX = struct.Struct('>II')
+
+# حداکثر حجم یک قاب (برای رد کردن پیام‌های خراب یا بیش از حد بزرگ)
+MAX_FRAME_BYTES = 256 * 1024 * 1024
+
+# مرزهای هیستوگرام اندازه دسته‌ها (تعداد کوئری)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MatcherError(Exception):
+    """خطای گزارش شده توسط سرویس تطبیق (مثلاً ابعاد نادرست کوئری)"""
+
+
+def parse_address(address):
+    """تبدیل نشانی سرویس به نوع و مقصد سوکت
+
+    Args:
+        address: «unix:/path/matcher.sock»، مسیر فایل سوکت، «host:port» یا «tcp://host:port»
+
+    Returns:
+        تاپل ('unix', مسیر) یا ('tcp', (host, port))
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    if address.startswith('tcp://'):
+        address = address[len('tcp://'):]
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return 'tcp', (host or '127.0.0.1', int(port))
+    if '/' in address:
+        return 'unix', address
+    raise ValueError(f"نشانی سرویس تطبیق '{address}' معتبر نیست (unix:/path یا host:port)")
+
+
+def encode_frame(header, payload=b''):
+    """ساخت یک قاب از سرآیند JSON و داده باینری"""
+    body = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    return FRAME_PREFIX.pack(len(body), len(payload)) + body + payload
+
+
+def _check_sizes(header_size, payload_size):
+    """رد کردن قاب‌های بیش از حد بزرگ"""
+    if header_size + payload_size > MAX_FRAME_BYTES:
+        raise ValueError(f"حجم پیام ({header_size + payload_size} بایت) بیش از حد مجاز است")
+
+
+async def read_frame(reader):
+    """خواندن یک قاب از جریان asyncio
+
+    Returns:
+        تاپل (سرآیند، داده باینری)
+    """
+    header_size, payload_size = FRAME_PREFIX.unpack(await reader.readexactly(FRAME_PREFIX.size))
+    _check_sizes(header_size, payload_size)
+    header = json.loads(await reader.readexactly(header_size))
+    payload = await reader.readexactly(payload_size) if payload_size else b''
+    return header, payload
+
+
+def _recv_exactly(sock, size):
+    """خواندن دقیق `size` بایت از سوکت"""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("اتصال سرویس تطبیق بسته شد")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_frame(sock):
+    """خواندن یک قاب از سوکت مسدودکننده"""
+    header_size, payload_size = FRAME_PREFIX.unpack(_recv_exactly(sock, FRAME_PREFIX.size))
+    _check_sizes(header_size, payload_size)
+    header = json.loads(_recv_exactly(sock, header_size))
+    payload = _recv_exactly(sock, payload_size) if payload_size else b''
+    return header, payload
+
+
+def _queries(header, payload):
+    """ماتریس کوئری‌های یک درخواست"""
+    shape = header.get('shape')
+    if not shape or len(shape) != 2:
+        raise ValueError("درخواست شامل ماتریس کوئری‌ها نیست")
+    return np.frombuffer(payload, dtype=np.float32).reshape(shape)
+
+
+class MatcherService:
+    """پاسخ‌گویی به درخواست‌های جستجو روی یک FingerprintIndex مشترک"""
+
+    def __init__(self, index, batch_window=MATCHER_BATCH_WINDOW_MS / 1000, max_batch=MATCHER_MAX_BATCH):
+        """
+        Args:
+            index: FingerprintIndex بارگذاری شده
+            batch_window: حداکثر زمان انتظار برای جمع شدن درخواست‌ها در یک دسته (ثانیه)
+            max_batch: تعداد کوئری‌هایی که دسته را بدون انتظار بیشتر اجرا می‌کند
+        """
+        self.index = index
+        self.batch_window = batch_window
+        self.max_batch = max(max_batch, 1)
+        self.started = time.time()
+        self.clients = 0
+        self._pending = []
+        self._pending_count = 0
+        self._flush_handle = None
+        self.swap_peak_bytes = 0
+        self.sync_task = None
+
+        self.metrics = Registry()
+        self.requests = self.metrics.counter('matcher_requests_total', 'تعداد درخواست‌ها به تفکیک عملیات')
+        self.errors = self.metrics.counter('matcher_errors_total', 'تعداد درخواست‌های ناموفق به تفکیک عملیات')
+        self.queries = self.metrics.counter('matcher_queries_total', 'تعداد کوئری‌های جستجو شده')
+        self.request_seconds = self.metrics.histogram('matcher_request_seconds', 'زمان پاسخ هر درخواست (ثانیه)')
+        self.batch_size = self.metrics.histogram('matcher_batch_queries', 'تعداد کوئری‌های هر دسته اجرا شده',
+                                                 BATCH_BUCKETS)
+        self.metrics.gauge('matcher_index_songs', 'تعداد آهنگ‌های ایندکس', lambda: len(self.index))
+        self.metrics.gauge('matcher_index_bytes', 'حجم ایندکس در حافظه (بایت)', lambda: self.index.nbytes)
+        self.metrics.gauge('matcher_clients', 'تعداد کلاینت‌های متصل', lambda: self.clients)
+        self.metrics.gauge('matcher_pending_queries', 'تعداد کوئری‌های منتظر دسته بعدی', lambda: self._pending_count)
+        self.sync_seconds = self.metrics.histogram('matcher_index_sync_seconds',
+                                                   'زمان همگام‌سازی ایندکس با لاگ تغییرات دیتابیس (ثانیه)')
+        self.metrics.gauge('matcher_index_library_version', 'نسخه لاگ تغییرات دیتابیس که ایندکس با آن همگام است',
+                           lambda: self.index.library_version or 0)
+        self.metrics.gauge('matcher_index_swap_peak_bytes', 'حجم هر دو نسخه ایندکس هنگام آخرین جایگزینی (بایت)',
+                           lambda: self.swap_peak_bytes)
+
+    def health(self):
+        """وضعیت سرویس و ایندکس
+
+        `generation` با هر تغییر ایندکس یا راه‌اندازی مجدد سرویس تغییر می‌کند و کلاینت‌ها
+        از آن برای دور ریختن نتایج کش شده استفاده می‌کنند.
+        """
+        index = self.index
+        projection = index.projection
+        columns = index.prefilter_columns
+        signature = projection.signature if projection is not None else 'full'
+        return {
+            'status': 'ok',
+            'songs': len(index),
+            'dimension': index.dimension,
+            'input_dimension': projection.input_dimension if projection is not None else index.dimension,
+            'storage': index.storage,
+            'projection': projection.signature if projection is not None else None,
+            'prefilter_columns': columns.tolist() if columns is not None else None,
+            'ann': index.ann is not None,
+            'version': index.version,
+            'library_version': index.library_version,
+            'bytes': index.nbytes,
+            'clients': self.clients,
+            'uptime': time.time() - self.started,
+            'generation': f"{os.getpid()}:{self.started:.0f}:{index.version}:{signature}:{index.storage}",
+        }
+
+    async def handle_client(self, reader, writer):
+        """پاسخ به درخواست‌های یک کلاینت تا زمان بسته شدن اتصال"""
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    header, payload = await read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                start = time.perf_counter()
+                op = header.get('op')
+                op_label = op if op in ('health', 'search', 'shortlist') else 'unknown'
+                self.requests.inc(op=op_label)
+                try:
+                    response = await self._dispatch(op, header, payload)
+                    response['ok'] = True
+                except Exception as e:
+                    # خطای یک درخواست نباید اتصال یا سرویس را متوقف کند
+                    self.errors.inc(op=op_label)
+                    logger.warning(f"خطا در پردازش درخواست {op_label}: {str(e)}")
+                    response = {'ok': False, 'error': str(e)}
+                writer.write(encode_frame(response))
+                await writer.drain()
+                self.request_seconds.observe(time.perf_counter() - start, op=op_label)
+        except (ValueError, ConnectionError) as e:
+            logger.warning(f"اتصال کلاینت به دلیل پیام نامعتبر بسته شد: {str(e)}")
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def _dispatch(self, op, header, payload):
+        """اجرای یک درخواست"""
+        loop = asyncio.get_running_loop()
+        if op == 'health':
+            return self.health()
+
+        if op == 'search':
+            queries = _queries(header, payload)
+            self.queries.inc(len(queries))
+            return {'results': await self._search(queries, header)}
+
+        if op == 'shortlist':
+            queries = _queries(header, payload)
+            size = int(header['size'])
+            threshold = header.get('threshold')
+            threshold = -np.inf if threshold is None else threshold
+            shortlists = await loop.run_in_executor(
+                None, lambda: [self.index.shortlist(query, size, threshold) for query in queries]
+            )
+            return {
+                'ids': [ids.tolist() for ids, _ in shortlists],
+                'similarities': [similarities.tolist() for _, similarities in shortlists],
+            }
+
+        raise ValueError(f"عملیات ناشناخته: {op}")
+
+    async def _search(self, queries, header):
+        """جستجوی کوئری‌های یک درخواست (جستجوهای دقیق در دسته مشترک)"""
+        threshold = header.get('threshold', SIMILARITY_THRESHOLD)
+        top_k = header.get('top_k')
+        nprobe = header.get('nprobe')
+        candidates = header.get('candidates')
+        loop = asyncio.get_running_loop()
+
+        # کوئری با ابعاد نادرست نباید دسته مشترک کلاینت‌های دیگر را خراب کند
+        if len(self.index) == 0:
+            return [[] for _ in queries]
+        projection = self.index.projection
+        dimension = projection.input_dimension if projection is not None else self.index.dimension
+        if queries.shape[1] != dimension:
+            raise ValueError(f"ابعاد کوئری ({queries.shape[1]}) با ابعاد ایندکس ({dimension}) یکسان نیست")
+
+        if nprobe or candidates is not None:
+            # جستجوی تقریبی و امتیازدهی فهرست کوتاه برای هر کوئری جداگانه انجام می‌شود
+            if candidates is not None and len(candidates) != len(queries):
+                raise ValueError("تعداد فهرست‌های کاندید با تعداد کوئری‌ها برابر نیست")
+            return await loop.run_in_executor(None, lambda: [
+                self.index.search(query, threshold=threshold, top_k=top_k, nprobe=nprobe,
+                                  candidates=candidates[i] if candidates is not None else None)
+                for i, query in enumerate(queries)
+            ])
+
+        future = loop.create_future()
+        self._pending.append((queries, threshold, top_k, future))
+        self._pending_count += len(queries)
+        if self._pending_count >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    async def sync_index(self, interval):
+        """بررسی دوره‌ای لاگ تغییرات دیتابیس و اعمال تغییرات روی ایندکس در یک نخ جداگانه
+
+        جستجوهای در حال اجرا تا جایگزینی با نسخه قبلی ایندکس ادامه می‌دهند و تغییر
+        `version` ایندکس نسل سرویس را تغییر می‌دهد تا کش نتایج ربات‌ها دور ریخته شود.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stats = await loop.run_in_executor(None, self.index.sync)
+            except Exception as e:
+                self.errors.inc(op='index_sync')
+                logger.error(f"خطا در به‌روزرسانی ایندکس: {str(e)}")
+                continue
+            if stats is None:
+                continue
+            self.sync_seconds.observe(stats['seconds'])
+            self.swap_peak_bytes = stats['peak_bytes']
+            logger.info(f"ایندکس با نسخه {stats['version']} کتابخانه همگام شد "
+                        f"({'بارگذاری کامل' if stats['full'] else 'تغییرات'}: {stats['added']} افزوده، "
+                        f"{stats['updated']} جایگزین، {stats['removed']} حذف) در {stats['seconds'] * 1000:.0f}ms؛ "
+                        f"حافظه هنگام جایگزینی {stats['peak_bytes'] / 2**20:.1f} MiB")
+            if stats['full'] and self.index.ann is not None and self.index.ann_stale:
+                logger.warning("ایندکس تقریبی با کتابخانه فعلی همخوانی ندارد؛ جستجو تا اجرای indexer.py --build-ann دقیق انجام می‌شود")
+
+    def _flush(self):
+        """اجرای دسته درخواست‌های منتظر"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending, self._pending_count = self._pending, [], 0
+        if pending:
+            asyncio.ensure_future(self._run_batch(pending))
+
+    async def _run_batch(self, pending):
+        """جستجوی همه کوئری‌های یک دسته با یک ضرب ماتریس-ماتریس و تقسیم نتایج بین درخواست‌ها"""
+        queries = np.concatenate([item[0] for item in pending])
+        songs = len(self.index)
+        top_ks = [songs if top_k is None else top_k for _, _, top_k, _ in pending]
+        threshold = min(item[1] for item in pending)
+        self.batch_size.observe(len(queries))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, self.index.search_many, queries, threshold, max(top_ks)
+            )
+        except Exception as e:
+            for *_, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        start = 0
+        for (batch, request_threshold, _, future), top_k in zip(pending, top_ks):
+            part = [
+                [result for result in query_results if result['similarity'] >= request_threshold][:top_k]
+                for query_results in results[start:start + len(batch)]
+            ]
+            start += len(batch)
+            if not future.done():
+                future.set_result(part)
+
+
+def load_index():
+    """بارگذاری ایندکس با همان تنظیمات ربات (کاهش ابعاد، پیش‌فیلتر، فایل جانبی و ایندکس تقریبی)
+
+    Returns:
+        FingerprintIndex بارگذاری شده
+    """
+    from fingerprint_index import FingerprintIndex
+    from fingerprint_store import matrix_exists
+    from ann_index import IVFIndex, default_ann_path, changes_since_build
+    from reduction import configure_index
+    from cascade import configure_cascade
+    from database import init_db
+
+    init_db()
+    index = FingerprintIndex()
+    configure_index(index)
+    configure_cascade(index)
+    loaded = False
+    if FINGERPRINT_MATRIX_PATH and matrix_exists(FINGERPRINT_MATRIX_PATH):
+        try:
+            index.load_matrix(FINGERPRINT_MATRIX_PATH)
+            loaded = True
+        except ValueError as e:
+            logger.warning(f"{str(e)}؛ ایندکس از دیتابیس ساخته می‌شود")
+    if not loaded:
+        index.reload()
+
+    ann_path = ANN_INDEX_PATH or default_ann_path()
+    if ANN_NPROBE > 0 and os.path.exists(ann_path):
+        ann = IVFIndex.load(ann_path)
+        index.attach_ann(ann, changed_ids=changes_since_build(ann))
+        if index.ann_stale:
+            logger.warning("ایندکس تقریبی با کتابخانه فعلی همخوانی ندارد؛ جستجو تا اجرای indexer.py --build-ann دقیق انجام می‌شود")
+    return index
+
+
+async def serve(index, address=MATCHER_ADDRESS, metrics_port=MATCHER_METRICS_PORT, ready=None,
+                sync_interval=INDEX_SYNC_SECONDS):
+    """اجرای سرویس تطبیق تا زمان توقف پردازه
+
+    Args:
+        index: FingerprintIndex بارگذاری شده
+        address: نشانی شنود سرویس
+        metrics_port: درگاه HTTP معیارها و /health (0 یعنی غیرفعال)
+        ready: threading.Event اختیاری که پس از آماده شدن سرویس تنظیم می‌شود
+        sync_interval: فاصله همگام‌سازی ایندکس با لاگ تغییرات دیتابیس (ثانیه؛ 0 یعنی غیرفعال)
+    """
+    service = MatcherService(index)
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        # فایل سوکت باقی‌مانده از اجرای قبلی حذف می‌شود (فقط اگر واقعاً سوکت باشد)
+        if os.path.exists(target) and stat.S_ISSOCK(os.stat(target).st_mode):
+            os.unlink(target)
+        server = await asyncio.start_unix_server(service.handle_client, path=target)
+    else:
+        server = await asyncio.start_server(service.handle_client, *target)
+
+    if metrics_port > 0:
+        start_http_server(service.metrics, metrics_port, METRICS_HOST, health=service.health)
+        logger.info(f"معیارها و وضعیت سرویس روی http://{METRICS_HOST}:{metrics_port}/metrics و /health")
+    logger.info(f"سرویس تطبیق با {len(index)} آهنگ روی {address} آماده است")
+    if ready is not None:
+        ready.set()
+    if sync_interval > 0:
+        # ارجاع وظیفه نگه داشته می‌شود تا پیش از پایان سرویس جمع‌آوری نشود
+        service.sync_task = asyncio.create_task(service.sync_index(sync_interval))
+    async with server:
+        await server.serve_forever()
+
+
+class MatcherClient:
+    """کلاینت سبک سرویس تطبیق با همان رابط جستجوی FingerprintIndex
+
+    هر نخ اتصال جداگانه‌ای دارد، بنابراین جستجوهای همزمان (مثلاً از run_in_executor
+    ربات) به صورت موازی به سرویس می‌رسند و در دسته‌های مشترک اجرا می‌شوند. اتصال
+    قطع شده (مثلاً پس از راه‌اندازی مجدد سرویس) یک بار دوباره برقرار می‌شود.
+
+    با `background_health` خواندن len و ویژگی‌های ایندکس هیچ‌وقت منتظر سرویس نمی‌ماند
+    (مناسب حلقه asyncio ربات): آخرین وضعیت دریافت شده برگردانده می‌شود و وضعیت کهنه
+    در یک نخ پس‌زمینه تازه می‌شود.
+    """
+
+    def __init__(self, address=MATCHER_ADDRESS, timeout=MATCHER_TIMEOUT, health_ttl=1.0, background_health=False):
+        """
+        Args:
+            address: نشانی سرویس
+            timeout: محدودیت زمانی هر درخواست (ثانیه)
+            health_ttl: مدت نگهداری وضعیت سرویس برای len و ویژگی‌های ایندکس (ثانیه)
+            background_health: تازه کردن وضعیت سرویس در نخ پس‌زمینه به جای درخواست همگام
+        """
+        self.address = address
+        self.timeout = timeout
+        self.health_ttl = health_ttl
+        self.background_health = background_health
+        self._target = parse_address(address)
+        self._local = threading.local()
+        self._health_lock = threading.Lock()
+        self._health = None
+        self._health_time = 0.0
+        self._health_error = None
+        self._health_refreshing = False
+
+    def _connect(self):
+        """برقراری یک اتصال جدید"""
+        kind, target = self._target
+        sock = socket.socket(socket.AF_UNIX if kind == 'unix' else socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        if kind == 'tcp':
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _request(self, header, queries=None):
+        """ارسال یک درخواست و دریافت پاسخ آن"""
+        payload = b''
+        if queries is not None:
+            queries = np.ascontiguousarray(queries, dtype=np.float32)
+            header = dict(header, shape=list(queries.shape))
+            payload = queries.tobytes()
+        frame = encode_frame(header, payload)
+
+        for attempt in range(2):
+            sock = getattr(self._local, 'sock', None)
+            reused = sock is not None
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                sock.sendall(frame)
+                response, _ = _recv_frame(sock)
+                break
+            except socket.timeout:
+                self.close()
+                raise
+            except OSError:
+                self.close()
+                # فقط اتصال قدیمی که در این فاصله بسته شده دوباره امتحان می‌شود
+                if not reused or attempt:
+                    raise
+        if not response.get('ok'):
+            raise MatcherError(response.get('error', 'خطای ناشناخته سرویس تطبیق'))
+        return response
+
+    def close(self):
+        """بستن اتصال نخ فعلی"""
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def health(self, max_age=0.0):
+        """وضعیت سرویس (با نگهداری حداکثر `max_age` ثانیه)"""
+        with self._health_lock:
+            if self._health is not None and time.monotonic() - self._health_time <= max_age:
+                return self._health
+        health = self._request({'op': 'health'})
+        with self._health_lock:
+            self._health = health
+            self._health_time = time.monotonic()
+            self._health_error = None
+        return health
+
+    def _refresh_health(self):
+        """دریافت وضعیت سرویس در نخ پس‌زمینه"""
+        try:
+            self.health()
+        except (OSError, MatcherError) as e:
+            with self._health_lock:
+                self._health_error = str(e) or type(e).__name__
+        finally:
+            with self._health_lock:
+                self._health_refreshing = False
+
+    def cached_health(self):
+        """آخرین وضعیت سرویس بدون انتظار برای آن
+
+        اگر وضعیت از health_ttl کهنه‌تر باشد، دریافت دوباره آن در نخ پس‌زمینه شروع می‌شود.
+
+        Raises:
+            MatcherError: اگر هنوز هیچ وضعیتی از سرویس دریافت نشده باشد
+        """
+        with self._health_lock:
+            health = self._health
+            stale = health is None or time.monotonic() - self._health_time > self.health_ttl
+            start = stale and not self._health_refreshing
+            if start:
+                self._health_refreshing = True
+            error = self._health_error
+        if start:
+            threading.Thread(target=self._refresh_health, name='matcher-health', daemon=True).start()
+        if health is None:
+            raise MatcherError(error or "وضعیت سرویس تطبیق هنوز دریافت نشده است")
+        return health
+
+    def _state(self):
+        """وضعیت سرویس برای len و ویژگی‌های ایندکس"""
+        if self.background_health:
+            return self.cached_health()
+        return self.health(self.health_ttl)
+
+    def __len__(self):
+        return self._state()['songs']
+
+    @property
+    def dimension(self):
+        """ابعاد بردارهای ایندکس سرویس"""
+        return self._state()['dimension']
+
+    @property
+    def nbytes(self):
+        """حجم ایندکس در حافظه سرویس (بایت)"""
+        return self._state()['bytes']
+
+    @property
+    def prefilter_columns(self):
+        """ستون‌های پیش‌فیلتر ایندکس سرویس یا None"""
+        return self._state()['prefilter_columns']
+
+    @property
+    def generation(self):
+        """نسل ایندکس سرویس؛ با تغییر ایندکس یا راه‌اندازی مجدد سرویس تغییر می‌کند"""
+        return self._state()['generation']
+
+    def search(self, query, threshold=SIMILARITY_THRESHOLD, top_k=None, nprobe=None, candidates=None):
+        """جستجوی یک اثر انگشت (مانند FingerprintIndex.search)"""
+        header = {'op': 'search', 'threshold': threshold, 'top_k': top_k, 'nprobe': nprobe}
+        if candidates is not None:
+            header['candidates'] = [[int(song_id) for song_id in candidates]]
+        return self._request(header, np.reshape(query, (1, -1)))['results'][0]
+
+    def search_many(self, queries, threshold=SIMILARITY_THRESHOLD, top_k=10):
+        """جستجوی چند اثر انگشت در یک درخواست (مانند FingerprintIndex.search_many)"""
+        if len(queries) == 0:
+            return []
+        header = {'op': 'search', 'threshold': threshold, 'top_k': top_k}
+        return self._request(header, np.asarray(queries))['results']
+
+    def shortlist(self, query_part, size, threshold=-np.inf):
+        """مرحله اول تطبیق دو مرحله‌ای (مانند FingerprintIndex.shortlist)"""
+        header = {'op': 'shortlist', 'size': int(size),
+                  'threshold': None if threshold == -np.inf else float(threshold)}
+        response = self._request(header, np.reshape(query_part, (1, -1)))
+        return np.asarray(response['ids'][0], dtype=np.int64), np.asarray(response['similarities'][0])
+
+
+def benchmark(address=MATCHER_ADDRESS, clients=8, requests=50, top_k=5):
+    """آزمون بار محلی: چند کلاینت همزمان کوئری‌های تصادفی می‌فرستند
+
+    Returns:
+        دیکشنری تعداد درخواست‌ها، توان عملیاتی و صدک‌های زمان پاسخ (میلی‌ثانیه)
+    """
+    client = MatcherClient(address)
+    health = client.health()
+    dimension = health['input_dimension']
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(clients, requests, dimension)).astype(np.float32)
+    latencies = [[] for _ in range(clients)]
+
+    def run(worker):
+        for query in queries[worker]:
+            start = time.perf_counter()
+            client.search(query, threshold=-1.0, top_k=top_k)
+            latencies[worker].append(time.perf_counter() - start)
+        client.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(worker,)) for worker in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.asarray(values) for values in latencies]) * 1000
+    report = {
+        'songs': health['songs'],
+        'clients': clients,
+        'requests': len(all_latencies),
+        'throughput': len(all_latencies) / elapsed,
+        'p50_ms': float(np.percentile(all_latencies, 50)),
+        'p95_ms': float(np.percentile(all_latencies, 95)),
+    }
+    print(f"{report['requests']} جستجو از {clients} کلاینت همزمان روی {report['songs']} آهنگ: "
+          f"{report['throughput']:.0f} درخواست در ثانیه، p50={report['p50_ms']:.2f}ms، p95={report['p95_ms']:.2f}ms")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='سرویس تطبیق مستقل با ایندکس مشترک اثر انگشت‌ها')
+    parser.add_argument('--address', type=str, default=MATCHER_ADDRESS or 'unix:matcher.sock',
+                        help='نشانی شنود (unix:/path/matcher.sock یا host:port)')
+    parser.add_argument('--metrics-port', type=int, default=MATCHER_METRICS_PORT,
+                        help='درگاه HTTP معیارها و /health (0 یعنی غیرفعال)')
+    parser.add_argument('--health', action='store_true', help='نمایش وضعیت سرویس در حال اجرا')
+    parser.add_argument('--benchmark', type=int, default=0, metavar='CLIENTS',
+                        help='آزمون بار سرویس در حال اجرا با تعداد کلاینت همزمان مشخص')
+    parser.add_argument('--requests', type=int, default=50, help='تعداد درخواست‌های هر کلاینت در آزمون بار')
+    args = parser.parse_args()
+
+    if args.health or args.benchmark:
+        if args.health:
+            status = MatcherClient(args.address).health()
+            status['prefilter_columns'] = len(status['prefilter_columns'] or [])
+            print(json.dumps(status, indent=2, ensure_ascii=False))
+        if args.benchmark:
+            benchmark(args.address, args.benchmark, args.requests)
+    else:
+        logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+        start = time.perf_counter()
+        matcher_index = load_index()
+        logger.info(f"ایندکس با {len(matcher_index)} آهنگ در {time.perf_counter() - start:.2f} ثانیه بارگذاری شد "
+                    f"({matcher_index.dimension} بعد، {matcher_index.storage}، "
+                    f"{matcher_index.nbytes / 2**20:.1f} MiB)")
+        try:
+            asyncio.run(serve(matcher_index, args.address, args.metrics_port))
+        except KeyboardInterrupt:
+            logger.info("سرویس تطبیق متوقف شد")
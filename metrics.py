@@ -0,0 +1,221 @@
+"""
+شمارنده‌ها، گیج‌ها و هیستوگرام‌های سبک برای اندازه‌گیری مراحل پردازش ربات
+
+به‌روزرسانی هر معیار فقط چند عمل جمع و یک جستجوی دودویی است و قفلی ندارد؛
+خروجی با قالب متنی Prometheus از یک سرور HTTP محلی در یک نخ جداگانه ارائه می‌شود.
+"""
+
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# مرزهای پیش‌فرض هیستوگرام زمان (ثانیه)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _label_key(labels):
+    """کلید مرتب برچسب‌ها برای نگهداری مقادیر هر ترکیب برچسب"""
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    """قالب متنی برچسب‌ها در Prometheus"""
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+class Counter:
+    """شمارنده افزایشی"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        """افزایش شمارنده برای یک ترکیب برچسب"""
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """مقدار فعلی شمارنده"""
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        """نمونه‌های خروجی (نام، برچسب‌ها، مقدار)"""
+        return [(self.name, key, value) for key, value in list(self._values.items())]
+
+
+class Gauge:
+    """مقداری که با تابع `source` در زمان خواندن محاسبه می‌شود
+
+    با metric_type='counter' برای شمارنده‌هایی استفاده می‌شود که در جای دیگری
+    نگهداری می‌شوند (مثلاً تعداد موفقیت‌های کش).
+    """
+
+    def __init__(self, name, documentation, source, metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.source = source
+        self.type = metric_type
+
+    def value(self):
+        """مقدار فعلی گیج"""
+        return self.source()
+
+    def samples(self):
+        """نمونه‌های خروجی (نام، برچسب‌ها، مقدار)"""
+        return [(self.name, (), self.source())]
+
+
+class Histogram:
+    """هیستوگرام با مرزهای ثابت (مثلاً برای زمان هر مرحله)"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        """ثبت یک مقدار"""
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """اندازه‌گیری زمان اجرای یک بلوک کد"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self):
+        """خلاصه هر سری: تعداد، میانگین و صدک‌های تقریبی 50 و 95
+
+        Returns:
+            دیکشنری برچسب‌ها ← دیکشنری count، mean، p50 و p95
+        """
+        result = {}
+        for key, (counts, total, count) in list(self._series.items()):
+            if count:
+                result[key] = {
+                    'count': count,
+                    'mean': total / count,
+                    'p50': self._quantile(counts, count, 0.5),
+                    'p95': self._quantile(counts, count, 0.95),
+                }
+        return result
+
+    def _quantile(self, counts, count, q):
+        """تخمین صدک با درون‌یابی خطی در داخل بازه هیستوگرام"""
+        rank = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def samples(self):
+        """نمونه‌های خروجی (نام، برچسب‌ها، مقدار) با بازه‌های تجمعی"""
+        samples = []
+        for key, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', key + (('le', repr(float(bound))),), cumulative))
+            samples.append((f'{self.name}_bucket', key + (('le', '+Inf'),), count))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, count))
+        return samples
+
+
+class Registry:
+    """مجموعه معیارهای یک برنامه"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        """ایجاد و ثبت یک شمارنده"""
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name, documentation, source, metric_type='gauge'):
+        """ایجاد و ثبت یک گیج"""
+        return self._register(Gauge(name, documentation, source, metric_type))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        """ایجاد و ثبت یک هیستوگرام"""
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render(self):
+        """خروجی همه معیارها با قالب متنی Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, key, value in metric.samples():
+                lines.append(f'{name}{_format_labels(key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def start_http_server(registry, port, host='127.0.0.1', health=None):
+    """راه‌اندازی سرور HTTP معیارها در یک نخ پس‌زمینه
+
+    Args:
+        registry: مجموعه معیارها
+        port: شماره درگاه
+        host: نشانی شنود (پیش‌فرض فقط دسترسی محلی)
+        health: تابع اختیاری که دیکشنری وضعیت سرویس را برمی‌گرداند و در مسیر /health
+            با قالب JSON ارائه می‌شود
+
+    Returns:
+        نمونه سرور (برای توقف با shutdown)
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/health' and health is not None:
+                body = json.dumps(health(), ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json; charset=utf-8'
+            elif path in ('/', '/metrics'):
+                body = registry.render().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # جلوگیری از چاپ هر درخواست در خروجی ربات
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
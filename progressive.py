@@ -0,0 +1,99 @@
+"""
+تحلیل تدریجی کوئری: پاسخ زودهنگام از پنجره کوتاه ابتدای فایل
+
+فایل کوئری فقط یک بار (تا DURATION ثانیه) رمزگشایی می‌شود. سپس اثر انگشت پنجره‌های
+بلندتر ابتدای همان سیگنال به ترتیب (PROGRESSIVE_WINDOWS و در پایان کل سیگنال)
+استخراج و جستجو می‌شود و به محض اینکه نتیجه اول از آستانه شباهت بالاتر باشد و با
+فاصله کافی از نتیجه دوم جلو باشد، همان نتیجه گزارش می‌شود.
+
+از هر مرحله فقط سیگنال رمزگشایی شده (و کلید PCM آن) دوباره استفاده می‌شود. فیلتر
+کاهش نویز preprocess_signal هر فریم را با میانه شبیه‌ترین فریم‌های کل پنجره جایگزین
+می‌کند، پس ویژگی‌های یک پنجره کوتاه‌تر بخشی از ویژگی‌های پنجره بلندتر نیستند؛ در
+عوض هزینه این فیلتر تقریباً با مجذور طول پنجره رشد می‌کند و پنجره‌های کوتاه ارزان هستند.
+"""
+
+import time
+
+from config import PROGRESSIVE_WINDOWS, PROGRESSIVE_MARGIN, SIMILARITY_THRESHOLD
+
+
+def window_schedule(duration, windows=PROGRESSIVE_WINDOWS):
+    """طول پنجره‌های هر مرحله برای سیگنالی با طول مشخص
+
+    Args:
+        duration: طول سیگنال رمزگشایی شده (ثانیه)
+        windows: طول پنجره‌های پیش از کل سیگنال (ثانیه)
+
+    Returns:
+        لیست صعودی طول پنجره‌ها (ثانیه) که آخرین آنها کل سیگنال است
+    """
+    return sorted({seconds for seconds in windows if 0 < seconds < duration}) + [duration]
+
+
+def window_label(seconds, windows=PROGRESSIVE_WINDOWS):
+    """برچسب یک پنجره برای معیارها: طول پنجره یا full برای کل سیگنال"""
+    return f'{seconds:g}s' if seconds in windows else 'full'
+
+
+def confident(results, margin=PROGRESSIVE_MARGIN, threshold=SIMILARITY_THRESHOLD):
+    """آیا نتیجه اول برای پاسخ زودهنگام به اندازه کافی مطمئن است؟
+
+    Args:
+        results: نتایج مرتب شده جستجو بدون آستانه (دست کم دو نتیجه اول)
+        margin: حداقل فاصله شباهت نتیجه اول از نتیجه دوم
+        threshold: آستانه شباهت گزارش نتیجه
+
+    Returns:
+        True اگر شباهت نتیجه اول از آستانه کمتر نباشد و دست کم margin از نتیجه دوم بیشتر باشد
+    """
+    if not results:
+        return False
+    top = results[0]['similarity']
+    if top < threshold:
+        return False
+    return len(results) < 2 or top - results[1]['similarity'] >= margin
+
+
+def decode_query(file_path, known_keys=frozenset(), suffix=None):
+    """مرحله اول در استخر پردازه‌ها: رمزگشایی فایل و محاسبه کلید PCM
+
+    Args:
+        file_path: مسیر فایل صوتی یا بایت‌های آن
+        known_keys: مجموعه کلیدهای PCM موجود در کش
+        suffix: پسوند فایل ورودی بایتی
+
+    Returns:
+        تاپل (کلید PCM، (سیگنال، نرخ نمونه‌برداری)، زمان مراحل)؛ اگر کلید در کش باشد
+        سیگنال None است و در صورت خطای رمزگشایی کلید هم None است. زمان مراحل
+        دیکشنری decode (ثانیه) است.
+    """
+    from audio_fingerprint import load_audio
+    from result_cache import pcm_key
+
+    start = time.perf_counter()
+    signal, sr = load_audio(file_path, suffix=suffix)
+    timings = {'decode': time.perf_counter() - start}
+    if signal is None:
+        return None, None, timings
+
+    key = pcm_key(signal)
+    if key in known_keys:
+        return key, None, timings
+    return key, (signal, sr), timings
+
+
+def window_query(signal, sr):
+    """استخراج اثر انگشت یک پنجره ابتدای سیگنال در استخر پردازه‌ها
+
+    Args:
+        signal: نمونه‌های پنجره (بخش ابتدای سیگنال رمزگشایی شده)
+        sr: نرخ نمونه‌برداری
+
+    Returns:
+        تاپل (بردار کامل اثر انگشت، زمان مراحل شامل extract)
+    """
+    from audio_fingerprint import extract_features
+
+    start = time.perf_counter()
+    fingerprint = extract_features(signal, sr)
+    return fingerprint, {'extract': time.perf_counter() - start}
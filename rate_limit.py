@@ -0,0 +1,74 @@
+"""
+محدودیت نرخ ارسال فایل برای هر کاربر با الگوریتم سطل توکن (token bucket)
+
+هر کاربر یک سطل با ظرفیت `burst` توکن دارد که با نرخ `rate` توکن در ثانیه پر
+می‌شود و هر فایل یک توکن مصرف می‌کند؛ بنابراین چند فایل پشت سر هم پذیرفته
+می‌شوند ولی ارسال پیوسته بیش از نرخ مجاز رد می‌شود.
+"""
+
+import time
+
+
+class TokenBucket:
+    """سطل توکن یک کاربر"""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """محدودکننده نرخ با یک سطل توکن برای هر کلید (مثلاً شناسه کاربر)"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        """
+        Args:
+            rate: نرخ پر شدن سطل (توکن در ثانیه؛ صفر یعنی بدون محدودیت)
+            burst: ظرفیت سطل (حداکثر تعداد فایل‌های پشت سر هم)
+            clock: تابع زمان (ثانیه)
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.clock = clock
+        self._buckets = {}
+
+    @property
+    def enabled(self):
+        """آیا محدودیت نرخ فعال است؟"""
+        return self.rate > 0
+
+    def acquire(self, key):
+        """مصرف یک توکن برای کلید
+
+        Args:
+            key: کلید سطل (شناسه کاربر)
+
+        Returns:
+            صفر اگر درخواست پذیرفته شد، در غیر این صورت زمان انتظار تا توکن بعدی (ثانیه)
+        """
+        if not self.enabled:
+            return 0.0
+
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+    def _prune(self, now):
+        """حذف سطل‌هایی که دوباره پر شده‌اند (معادل کاربری که سطلی ندارد)"""
+        if len(self._buckets) < 1024:
+            return
+        full_after = self.burst / self.rate
+        for key in [key for key, bucket in self._buckets.items() if now - bucket.updated >= full_after]:
+            del self._buckets[key]
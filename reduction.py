@@ -0,0 +1,263 @@
+"""
+کاهش ابعاد اثر انگشت‌ها با استانداردسازی و PCA
+
+بردار ویژگی‌ها حدود 1444 بعد دارد که بیشتر آن میانگین و انحراف معیار 256 باند mel
+و آمار 384 سطر tempogram است و ابعاد آن همبستگی زیادی با هم دارند. این تبدیل روی
+کتابخانه آموزش داده می‌شود: هر بعد با میانگین و انحراف معیار کتابخانه استاندارد و
+سپس روی چند مؤلفه اصلی تصویر می‌شود. تبدیل در فایلی کنار دیتابیس ذخیره و به صورت
+یکسان روی سطرهای ایندکس و کوئری‌ها اعمال می‌شود؛ بردارهای کاهش یافته می‌توانند با
+float16 یا int8 (با ضریب مقیاس هر سطر) در حافظه نگهداری شوند.
+"""
+
+import os
+import time
+import hashlib
+import argparse
+import numpy as np
+
+from config import DATABASE_PATH, REDUCTION_ENABLED, REDUCTION_COMPONENTS, REDUCTION_PATH, INDEX_STORAGE
+
+
+def default_projection_path():
+    """مسیر پیش‌فرض فایل تبدیل کاهش ابعاد: کنار فایل دیتابیس SQLite"""
+    prefix = 'sqlite:///'
+    if DATABASE_PATH.startswith(prefix):
+        return os.path.splitext(DATABASE_PATH[len(prefix):])[0] + '.pca.npz'
+    return 'fingerprints.pca.npz'
+
+
+class Projection:
+    """تبدیل استانداردسازی و تصویر روی مؤلفه‌های اصلی"""
+
+    def __init__(self, mean, scale, components, explained_variance_ratio):
+        self.mean = mean
+        self.scale = scale
+        self.components = components
+        self.explained_variance_ratio = explained_variance_ratio
+
+    @property
+    def input_dimension(self):
+        """ابعاد بردار اثر انگشت کامل"""
+        return len(self.mean)
+
+    @property
+    def dimension(self):
+        """ابعاد بردار کاهش یافته"""
+        return len(self.components)
+
+    @property
+    def signature(self):
+        """امضای کوتاه تبدیل برای تشخیص فایل‌های جانبی ساخته شده با تبدیل دیگر"""
+        digest = hashlib.sha1()
+        for array in (self.mean, self.scale, self.components):
+            digest.update(np.ascontiguousarray(array, dtype=np.float32).tobytes())
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def fit(cls, matrix, n_components=128, train_size=50000, seed=0):
+        """آموزش تبدیل روی اثر انگشت‌های کتابخانه
+
+        Args:
+            matrix: ماتریس اثر انگشت‌های کامل (هر سطر یک آهنگ)
+            n_components: تعداد مؤلفه‌های اصلی
+            train_size: حداکثر تعداد سطرهای نمونه برای آموزش
+            seed: بذر تولید اعداد تصادفی
+
+        Returns:
+            نمونه Projection
+        """
+        n_rows = len(matrix)
+        if n_rows == 0:
+            raise ValueError("ماتریس خالی است")
+        rows = np.arange(n_rows)
+        if n_rows > train_size:
+            rows = np.sort(np.random.default_rng(seed).choice(n_rows, size=train_size, replace=False))
+        sample = np.asarray(matrix[rows], dtype=np.float64)
+
+        mean = sample.mean(axis=0)
+        scale = sample.std(axis=0)
+        # ابعاد ثابت پس از حذف میانگین صفر می‌شوند و در تبدیل اثری ندارند
+        scale[scale < 1e-8] = 1.0
+        standardized = (sample - mean) / scale
+        n_components = max(1, min(n_components, *standardized.shape))
+
+        if len(standardized) < standardized.shape[1]:
+            _, singular_values, vt = np.linalg.svd(standardized, full_matrices=False)
+            variances = singular_values ** 2
+            components = vt[:n_components]
+        else:
+            # ماتریس کوواریانس (ابعاد × ابعاد) برای نمونه‌های زیاد ارزان‌تر از SVD کامل است
+            variances, vectors = np.linalg.eigh(standardized.T @ standardized)
+            order = np.argsort(variances)[::-1]
+            variances = np.maximum(variances[order], 0)
+            components = vectors[:, order[:n_components]].T
+
+        total = variances.sum()
+        ratio = variances[:n_components] / total if total > 0 else np.zeros(n_components)
+        return cls(mean.astype(np.float32), scale.astype(np.float32), components.astype(np.float32),
+                   ratio.astype(np.float32))
+
+    def transform(self, vectors):
+        """اعمال تبدیل روی یک بردار یا ماتریس اثر انگشت
+
+        Args:
+            vectors: بردار یا ماتریس اثر انگشت‌های کامل
+
+        Returns:
+            بردار یا ماتریس کاهش یافته (float32)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[-1] != self.input_dimension:
+            raise ValueError(
+                f"ابعاد اثر انگشت ({vectors.shape[-1]}) با تبدیل کاهش ابعاد ({self.input_dimension}) یکسان نیست"
+            )
+        return ((vectors - self.mean) / self.scale) @ self.components.T
+
+    def save(self, path):
+        """ذخیره تبدیل در فایل .npz"""
+        np.savez(path, mean=self.mean, scale=self.scale, components=self.components,
+                 explained_variance_ratio=self.explained_variance_ratio)
+
+    @classmethod
+    def load(cls, path):
+        """بارگذاری تبدیل از فایل .npz"""
+        with np.load(path) as data:
+            return cls(data['mean'], data['scale'], data['components'], data['explained_variance_ratio'])
+
+
+def configure_index(index, enabled=REDUCTION_ENABLED, path=REDUCTION_PATH, storage=INDEX_STORAGE):
+    """اعمال تنظیمات کاهش ابعاد و نوع ذخیره‌سازی روی ایندکس (پیش از بارگذاری آن)
+
+    Args:
+        index: نمونه FingerprintIndex
+        enabled: استفاده از بردارهای کاهش یافته
+        path: مسیر فایل تبدیل (پیش‌فرض: default_projection_path)
+        storage: نوع داده ماتریس ایندکس
+
+    Returns:
+        تبدیل بارگذاری شده یا None اگر کاهش ابعاد غیرفعال باشد، فایل تبدیل وجود نداشته
+        باشد یا تبدیل با گروه‌های ویژگی دیگری آموزش داده شده باشد
+    """
+    from feature_groups import current_layout, layout_width
+
+    projection = None
+    path = path or default_projection_path()
+    if enabled and os.path.exists(path):
+        projection = Projection.load(path)
+        if projection.input_dimension != layout_width(current_layout()):
+            print(f"تبدیل '{path}' برای بردارهای {projection.input_dimension} بعدی آموزش داده شده و با گروه‌های "
+                  f"ویژگی فعلی سازگار نیست؛ آن را با indexer.py --fit-reduction دوباره آموزش دهید")
+            projection = None
+    index.set_reduction(projection, storage)
+    return projection
+
+
+def fit_projection(path=None, n_components=REDUCTION_COMPONENTS):
+    """آموزش تبدیل روی اثر انگشت‌های دیتابیس و ذخیره آن کنار دیتابیس
+
+    پس از آموزش تبدیل جدید، فایل جانبی ماتریس و ایندکس تقریبی باید دوباره ساخته شوند.
+
+    Args:
+        path: مسیر فایل خروجی (پیش‌فرض: default_projection_path)
+        n_components: تعداد مؤلفه‌های اصلی
+
+    Returns:
+        مسیر فایل ذخیره شده یا None اگر دیتابیس خالی باشد
+    """
+    from database import get_fingerprints
+
+    fingerprints = get_fingerprints()
+    if not fingerprints:
+        print("هیچ اثر انگشتی برای آموزش تبدیل کاهش ابعاد وجود ندارد")
+        return None
+
+    path = path or default_projection_path()
+    start = time.perf_counter()
+    projection = Projection.fit(np.stack([item['fingerprint'] for item in fingerprints]), n_components)
+    projection.save(path)
+    print(f"تبدیل کاهش ابعاد {projection.input_dimension} ← {projection.dimension} "
+          f"({projection.explained_variance_ratio.sum():.1%} واریانس) روی {len(fingerprints)} آهنگ در "
+          f"{time.perf_counter() - start:.1f} ثانیه آموزش داده و در '{path}' ذخیره شد")
+    return path
+
+
+def _correlated_library(n_songs, dimension, rank, rng):
+    """ساخت کتابخانه مصنوعی با ابعاد همبسته (ترکیب خطی چند عامل پنهان به همراه نویز کم)"""
+    mixing = rng.normal(size=(rank, dimension)).astype(np.float32)
+    matrix = np.empty((n_songs, dimension), dtype=np.float32)
+    for start in range(0, n_songs, 65536):
+        end = min(start + 65536, n_songs)
+        matrix[start:end] = rng.normal(size=(end - start, rank)).astype(np.float32) @ mixing
+        matrix[start:end] += rng.normal(scale=0.5, size=(end - start, dimension))
+    return matrix
+
+
+def reduction_report(n_songs=100000, dimension=1444, n_components=128, n_queries=200, top_k=10,
+                     rank=64, seed=0):
+    """گزارش حافظه، زمان جستجو و تطابق رتبه‌بندی با بردار کامل روی کتابخانه مصنوعی
+
+    Returns:
+        لیست دیکشنری‌های نتیجه برای بردار کامل و هر نوع ذخیره‌سازی بردار کاهش یافته
+    """
+    from fingerprint_index import FingerprintIndex, STORAGE_TYPES
+
+    rng = np.random.default_rng(seed)
+    print(f"ساخت کتابخانه مصنوعی با {n_songs} آهنگ و {dimension} بعد...")
+    matrix = _correlated_library(n_songs, dimension, rank, rng)
+    ids = np.arange(1, n_songs + 1)
+    picks = rng.choice(n_songs, size=n_queries, replace=False)
+    queries = matrix[picks] + rng.normal(scale=0.5, size=(n_queries, dimension)).astype(np.float32)
+
+    start = time.perf_counter()
+    projection = Projection.fit(matrix, n_components)
+    print(f"آموزش تبدیل ({projection.dimension} مؤلفه، "
+          f"{projection.explained_variance_ratio.sum():.1%} واریانس): {time.perf_counter() - start:.1f} ثانیه")
+
+    def run(index):
+        results = []
+        start = time.perf_counter()
+        for query in queries:
+            results.append([r['id'] for r in index.search(query, threshold=-np.inf, top_k=top_k)])
+        return results, (time.perf_counter() - start) / n_queries * 1000
+
+    report = []
+    exact = None
+    print(f"\n{'variant':>12} {'dim':>5} {'MiB':>8} {'ms/query':>9} {'top1':>6} {'recall@' + str(top_k):>10}")
+    for variant, variant_projection, storage in [('full', None, 'float32')] + \
+            [(f'pca-{storage}', projection, storage) for storage in STORAGE_TYPES]:
+        index = FingerprintIndex()
+        index.set_reduction(variant_projection, storage)
+        index.load_arrays(ids, [''] * n_songs, [''] * n_songs, matrix.copy())
+        results, ms = run(index)
+        if exact is None:
+            exact = results
+        top1 = np.mean([r[:1] == e[:1] for r, e in zip(results, exact)])
+        recall = np.mean([len(set(r) & set(e)) / len(e) for r, e in zip(results, exact)])
+        report.append({
+            'variant': variant,
+            'dimension': index.dimension,
+            'bytes': index.nbytes,
+            'latency_ms': ms,
+            'top1_agreement': float(top1),
+            'recall': float(recall),
+        })
+        print(f"{variant:>12} {index.dimension:>5} {index.nbytes / 2**20:>8.1f} {ms:>9.2f} {top1:>6.3f} {recall:>10.3f}")
+        del index
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='کاهش ابعاد (استانداردسازی + PCA) اثر انگشت‌ها')
+    parser.add_argument('--fit', action='store_true', help='آموزش تبدیل روی اثر انگشت‌های دیتابیس')
+    parser.add_argument('--components', type=int, default=REDUCTION_COMPONENTS, help='تعداد مؤلفه‌های اصلی')
+    parser.add_argument('--output', type=str, default=None, help='مسیر فایل تبدیل')
+    parser.add_argument('--report', action='store_true',
+                        help='گزارش حافظه، زمان جستجو و تطابق رتبه‌بندی روی کتابخانه مصنوعی')
+    parser.add_argument('--songs', type=int, default=100000, help='تعداد آهنگ‌های کتابخانه مصنوعی')
+    parser.add_argument('--queries', type=int, default=200, help='تعداد کوئری‌های گزارش')
+    args = parser.parse_args()
+
+    if args.fit:
+        fit_projection(args.output or REDUCTION_PATH or None, args.components)
+    if args.report:
+        reduction_report(args.songs, n_components=args.components, n_queries=args.queries)
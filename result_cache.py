@@ -0,0 +1,227 @@
+"""
+کش نتایج جستجو برای فایل‌های تکراری (مثلاً یک کلیپ ریمیکس که بارها فوروارد می‌شود)
+
+کلید اصلی شناسه یکتای فایل در تلگرام (file_unique_id) است و اگر همان صدا با
+شناسه دیگری ارسال شود، هش داده‌های PCM رمزگشایی شده به عنوان کلید دوم استفاده
+می‌شود. با تغییر کتابخانه (نسل ایندکس) همه نتایج کش شده دور ریخته می‌شوند.
+"""
+
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+def pcm_key(signal):
+    """کلید کش بر اساس هش داده‌های PCM رمزگشایی شده"""
+    return 'pcm:' + hashlib.sha1(np.ascontiguousarray(signal, dtype=np.float32).tobytes()).hexdigest()
+
+
+def fingerprint_query(file_path, engine='features', known_keys=frozenset(), suffix=None):
+    """رمزگشایی فایل کاربر، محاسبه کلید PCM و استخراج اثر انگشت در صورت نبودن در کش
+
+    این تابع در استخر پردازه‌ها اجرا می‌شود؛ اگر کلید PCM در `known_keys` باشد،
+    استخراج اثر انگشت (پرهزینه‌ترین مرحله) انجام نمی‌شود.
+
+    Args:
+        file_path: مسیر فایل صوتی یا بایت‌های آن (فایل دریافتی در حافظه)
+        engine: موتور اثر انگشت ('features' یا 'landmark')
+        known_keys: مجموعه کلیدهای PCM موجود در کش
+        suffix: پسوند فایل ورودی بایتی (برای فرمت‌هایی که به فایل موقت نیاز دارند)
+
+    Returns:
+        تاپل (کلید PCM، اثر انگشت، زمان مراحل)؛ اثر انگشت در صورت وجود کلید در کش
+        None است و در صورت خطای رمزگشایی کلید و اثر انگشت هر دو None هستند.
+        زمان مراحل دیکشنری decode و extract (ثانیه) است.
+    """
+    from config import DURATION, LANDMARK_SAMPLE_RATE
+    from audio_fingerprint import load_audio, extract_features
+
+    timings = {}
+    start = time.perf_counter()
+    if engine == 'landmark':
+        signal, sr = load_audio(file_path, sr=LANDMARK_SAMPLE_RATE, duration=DURATION, suffix=suffix)
+    else:
+        signal, sr = load_audio(file_path, suffix=suffix)
+    timings['decode'] = time.perf_counter() - start
+    if signal is None:
+        return None, None, timings
+
+    key = pcm_key(signal)
+    if key in known_keys:
+        return key, None, timings
+
+    start = time.perf_counter()
+    if engine == 'landmark':
+        from landmark_fingerprint import extract_landmarks
+        fingerprint = extract_landmarks(signal, sr)
+    else:
+        fingerprint = extract_features(signal, sr)
+    timings['extract'] = time.perf_counter() - start
+    return key, fingerprint, timings
+
+
+def warm_up(engine='features', seconds=0.25):
+    """بارگذاری کتابخانه‌ها و اجرای یک استخراج آزمایشی در پردازه کاری
+
+    اولین استخراج در هر پردازه هزینه import کتابخانه‌ها و کامپایل JIT توابع
+    numba را می‌پردازد؛ این تابع پیش از دریافت اولین فایل کاربر همین هزینه را
+    روی یک سیگنال کوتاه مصنوعی می‌پردازد.
+
+    Args:
+        engine: موتور اثر انگشت ('features' یا 'landmark')
+        seconds: طول سیگنال آزمایشی (ثانیه)
+
+    Returns:
+        زمان صرف شده (ثانیه)
+    """
+    import warnings
+    start = time.perf_counter()
+    from config import SAMPLE_RATE, LANDMARK_SAMPLE_RATE
+
+    sr = LANDMARK_SAMPLE_RATE if engine == 'landmark' else SAMPLE_RATE
+    signal = 0.1 * np.random.default_rng(0).standard_normal(int(seconds * sr)).astype(np.float32)
+    with warnings.catch_warnings():
+        # هشدارهای طول کوتاه سیگنال برای این اجرای آزمایشی اهمیتی ندارند
+        warnings.simplefilter('ignore')
+        if engine == 'landmark':
+            from landmark_fingerprint import extract_landmarks
+            extract_landmarks(signal, sr)
+        else:
+            from audio_fingerprint import extract_features
+            extract_features(signal, sr)
+    return time.perf_counter() - start
+
+
+class ResultCache:
+    """کش LRU با زمان انقضا برای نتایج جستجو
+
+    هر نتیجه حداکثر `ttl` ثانیه معتبر است و با پر شدن کش، قدیمی‌ترین نتیجه
+    استفاده نشده حذف می‌شود. `generation` نسخه کتابخانه‌ای است که نتایج با آن
+    محاسبه شده‌اند؛ با تغییر آن کش خالی می‌شود.
+    """
+
+    def __init__(self, max_size=1000, ttl=3600, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        """آیا کش فعال است؟ (اندازه صفر یعنی غیرفعال)"""
+        return self.max_size > 0
+
+    def set_generation(self, generation):
+        """ثبت نسل فعلی کتابخانه و خالی کردن کش در صورت تغییر آن
+
+        Returns:
+            True اگر کش به دلیل تغییر نسل خالی شد
+        """
+        if generation == self.generation:
+            return False
+        changed = self.generation is not None or bool(self._entries)
+        self.generation = generation
+        self._entries.clear()
+        return changed
+
+    def keys(self):
+        """مجموعه کلیدهای معتبر فعلی"""
+        self._expire()
+        return frozenset(self._entries)
+
+    def _expire(self):
+        """حذف نتایج منقضی شده"""
+        deadline = time.time() - self.ttl
+        for key in [key for key, (stored_at, _) in self._entries.items() if stored_at < deadline]:
+            del self._entries[key]
+
+    def get(self, key):
+        """دریافت نتیجه کش شده
+
+        Args:
+            key: کلید (شناسه یکتای فایل یا کلید PCM)
+
+        Returns:
+            لیست نتایج یا None اگر نتیجه‌ای در کش نباشد
+        """
+        entry = self._entries.get(key) if key is not None else None
+        if entry is not None and entry[0] >= time.time() - self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, results):
+        """ذخیره نتیجه جستجو
+
+        Args:
+            key: کلید (شناسه یکتای فایل یا کلید PCM)
+            results: لیست نتایج جستجو
+        """
+        if not self.enabled or key is None:
+            return
+        self._entries[key] = (time.time(), results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """آمار کش: تعداد موفق، ناموفق، اندازه و نرخ موفقیت"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def save(self):
+        """ذخیره کش در فایل (در صورت تنظیم مسیر)"""
+        if not self.path or not self.enabled:
+            return
+        self._expire()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'generation': self.generation,
+                'entries': [[key, stored_at, results] for key, (stored_at, results) in self._entries.items()],
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def load(self):
+        """بارگذاری کش از فایل (در صورت وجود)
+
+        Returns:
+            تعداد نتایج بارگذاری شده
+        """
+        if not self.path or not self.enabled or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"خطا در بارگذاری کش نتایج از '{self.path}': {str(e)}")
+            return 0
+
+        self.generation = stored.get('generation')
+        self._entries.clear()
+        for key, stored_at, results in stored.get('entries', []):
+            self._entries[key] = (stored_at, results)
+        self._expire()
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return len(self._entries)
@@ -6,10 +6,16 @@ import os
 import sys
 import argparse
 from database import init_db, get_fingerprints, get_song_by_id
-from audio_fingerprint import generate_fingerprint, compare_fingerprints
+import time
+import numpy as np
+import librosa
+from audio_fingerprint import generate_fingerprint, compare_fingerprints, load_audio, extract_features
+from landmark_fingerprint import generate_query_landmarks, match_landmarks
+from config import FINGERPRINT_ENGINE, MATCHER_ADDRESS, SAMPLE_RATE, HOP_LENGTH, N_FFT, N_MELS
+from feature_groups import GROUP_NAMES
 
-def test_audio_recognition(test_file):
-    """تست تشخیص فایل صوتی"""
+def test_audio_recognition(test_file, engine=FINGERPRINT_ENGINE, matcher=MATCHER_ADDRESS):
+    """تست تشخیص فایل صوتی (با سرویس تطبیق در صورت تنظیم نشانی آن)"""
     print(f"در حال تست فایل: {test_file}")
     
     # بررسی وجود فایل
@@ -20,6 +26,17 @@ def test_audio_recognition(test_file):
     # مقداردهی اولیه دیتابیس
     init_db()
     
+    if engine == 'landmark':
+        print("در حال استخراج هش‌های نشانه‌ای...")
+        landmarks = generate_query_landmarks(test_file)
+        if landmarks is None:
+            print("خطا در پردازش فایل صوتی.")
+            return
+        print(f"تعداد {len(landmarks[0])} هش استخراج شد؛ در حال جستجو در ایندکس معکوس...")
+        results = match_landmarks(landmarks)
+        print_results(results)
+        return
+    
     # استخراج اثر انگشت صوتی
     print("در حال استخراج ویژگی‌های صوتی...")
     test_fingerprint = generate_fingerprint(test_file)
@@ -27,6 +44,15 @@ def test_audio_recognition(test_file):
     if test_fingerprint is None:
         print("خطا در پردازش فایل صوتی.")
         return
+    
+    if matcher:
+        from matcher_service import MatcherClient
+        print(f"در حال جستجو با سرویس تطبیق {matcher}...")
+        client = MatcherClient(matcher)
+        print(f"تعداد {len(client)} آهنگ در ایندکس سرویس یافت شد.")
+        results = client.search(test_fingerprint, threshold=0.70)
+        print_results(results)
+        return
         
     # دریافت اثر انگشت‌های دیتابیس
     print("در حال دریافت اثر انگشت‌های دیتابیس...")
@@ -41,7 +67,10 @@ def test_audio_recognition(test_file):
     # مقایسه اثر انگشت‌های صوتی
     print("در حال مقایسه اثر انگشت‌ها...")
     results = compare_fingerprints(test_fingerprint, db_fingerprints, threshold=0.70)
-    
+    print_results(results)
+
+def print_results(results):
+    """نمایش نتایج تشخیص"""
     if not results:
         print("هیچ آهنگ مشابهی یافت نشد.")
         return
@@ -59,9 +88,207 @@ def test_audio_recognition(test_file):
         print(f"   مسیر فایل: {song.file_path}")
         print("")
 
+def extract_features_reference(signal, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS):
+    """پیاده‌سازی مرجع استخراج ویژگی‌ها که هر ویژگی را جداگانه از سیگنال محاسبه می‌کند
+    
+    این نسخه فقط برای بررسی هم‌ارزی عددی extract_features (خط لوله STFT مشترک)
+    نگه داشته شده است.
+    
+    Args:
+        signal: آرایه یک‌بعدی سیگنال صوتی
+        sr: نرخ نمونه‌برداری
+        n_fft: اندازه FFT
+        hop_length: طول پرش
+        n_mels: تعداد فیلترهای mel
+        
+    Returns:
+        ویژگی‌های استخراج شده به شکل یک بردار
+    """
+    if signal is None:
+        return None
+    
+    # پیش‌پردازش: نرمال‌سازی سیگنال
+    signal = librosa.util.normalize(signal)
+    
+    # کاهش نویز با فیلتر مدین
+    signal = librosa.decompose.nn_filter(signal, aggregate=np.median, metric='cosine')
+    
+    # استخراج MFCC (Mel-Frequency Cepstral Coefficients) - افزایش تعداد ضرایب
+    mfccs = librosa.feature.mfcc(y=signal, sr=sr, n_mfcc=20, n_fft=n_fft, hop_length=hop_length)
+    # افزودن مشتق اول و دوم MFCC برای اطلاعات بیشتر
+    mfccs_delta = librosa.feature.delta(mfccs)
+    mfccs_delta2 = librosa.feature.delta(mfccs, order=2)
+    
+    # استخراج کروماگرام (Chromagram) با کیفیت بالاتر
+    chroma = librosa.feature.chroma_cqt(y=signal, sr=sr, hop_length=hop_length)
+    
+    # استخراج spectral contrast
+    contrast = librosa.feature.spectral_contrast(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    
+    # استخراج Mel spectrogram با وضوح بالاتر
+    mel_spec = librosa.feature.melspectrogram(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels)
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    
+    # ویژگی‌های جدید: Zero Crossing Rate برای تشخیص بهتر ریتم
+    zcr = librosa.feature.zero_crossing_rate(signal)
+    
+    # ویژگی‌های جدید: Spectral Rolloff برای تشخیص بهتر طیف فرکانسی
+    rolloff = librosa.feature.spectral_rolloff(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    
+    # ویژگی‌های جدید: Spectral Bandwidth برای تشخیص غنای طیفی
+    bandwidth = librosa.feature.spectral_bandwidth(y=signal, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    
+    # ویژگی‌های جدید: Tempogram برای تشخیص بهتر ریتم
+    tempo = librosa.feature.tempogram(y=signal, sr=sr, hop_length=hop_length)
+    
+    # استفاده از میانگین و انحراف معیار به جای فقط میانگین
+    mfccs_mean = np.mean(mfccs, axis=1)
+    mfccs_std = np.std(mfccs, axis=1)
+    mfccs_delta_mean = np.mean(mfccs_delta, axis=1)
+    mfccs_delta_std = np.std(mfccs_delta, axis=1)
+    mfccs_delta2_mean = np.mean(mfccs_delta2, axis=1)
+    mfccs_delta2_std = np.std(mfccs_delta2, axis=1)
+    
+    chroma_mean = np.mean(chroma, axis=1)
+    chroma_std = np.std(chroma, axis=1)
+    
+    contrast_mean = np.mean(contrast, axis=1)
+    contrast_std = np.std(contrast, axis=1)
+    
+    mel_mean = np.mean(mel_spec_db, axis=1)
+    mel_std = np.std(mel_spec_db, axis=1)
+    
+    zcr_mean = np.mean(zcr, axis=1)
+    zcr_std = np.std(zcr, axis=1)
+    
+    rolloff_mean = np.mean(rolloff, axis=1)
+    rolloff_std = np.std(rolloff, axis=1)
+    
+    bandwidth_mean = np.mean(bandwidth, axis=1)
+    bandwidth_std = np.std(bandwidth, axis=1)
+    
+    tempo_mean = np.mean(tempo, axis=1)
+    tempo_std = np.std(tempo, axis=1)
+    
+    # ادغام همه ویژگی‌ها
+    features = np.concatenate([
+        mfccs_mean, mfccs_std, 
+        mfccs_delta_mean, mfccs_delta_std,
+        mfccs_delta2_mean, mfccs_delta2_std,
+        chroma_mean, chroma_std,
+        contrast_mean, contrast_std,
+        mel_mean, mel_std,
+        zcr_mean, zcr_std,
+        rolloff_mean, rolloff_std,
+        bandwidth_mean, bandwidth_std,
+        tempo_mean, tempo_std
+    ])
+    
+    return features
+
+def synthetic_signal(sr=SAMPLE_RATE, seconds=0.5, seed=0):
+    """سیگنال مصنوعی قطعی برای بررسی خودکار خط لوله ویژگی‌ها بدون فایل صوتی
+    
+    ترکیب یک چرپ، چند هارمونیک، ضربه‌های منظم و نویز است تا همه گروه‌های ویژگی
+    (از جمله chroma و tempogram) مقدار غیر صفر داشته باشند.
+    
+    Returns:
+        آرایه float32 سیگنال
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sr * seconds)) / sr
+    signal = 0.4 * librosa.chirp(fmin=110, fmax=1760, sr=sr, length=len(t))
+    for harmonic in (1, 2, 3):
+        signal += 0.2 / harmonic * np.sin(2 * np.pi * 220 * harmonic * t)
+    signal[::max(1, int(sr * 0.125))] += 1.0
+    signal += 0.05 * rng.standard_normal(len(t))
+    return signal.astype(np.float32)
+
+def check_feature_pipeline(test_file=None, rtol=1e-5, atol=1e-6, seconds=0.5):
+    """بررسی هم‌ارزی عددی extract_features با پیاده‌سازی مرجع و نمایش زمان هر مرحله
+    
+    Args:
+        test_file: مسیر فایل صوتی؛ None یعنی سیگنال مصنوعی (synthetic_signal) برای بررسی خودکار
+        rtol: خطای نسبی مجاز
+        atol: خطای مطلق مجاز
+        seconds: طول سیگنال مصنوعی (ثانیه)
+    
+    Returns:
+        True اگر خروجی دو پیاده‌سازی در محدوده خطای مجاز یکسان باشد
+    """
+    if test_file is None:
+        print(f"در حال بررسی خط لوله ویژگی‌ها با سیگنال مصنوعی {seconds:g} ثانیه‌ای")
+        signal, sr = synthetic_signal(SAMPLE_RATE, seconds), SAMPLE_RATE
+    else:
+        print(f"در حال بررسی خط لوله ویژگی‌ها برای فایل: {test_file}")
+        signal, sr = load_audio(test_file)
+    if signal is None:
+        print("خطا در پردازش فایل صوتی.")
+        return False
+    
+    start = time.perf_counter()
+    reference = extract_features_reference(signal, sr)
+    reference_time = time.perf_counter() - start
+    
+    timings = {}
+    start = time.perf_counter()
+    features = extract_features(signal, sr, timings=timings, groups=GROUP_NAMES)
+    pipeline_time = time.perf_counter() - start
+    
+    max_diff = float(np.max(np.abs(features - reference)))
+    passed = features.shape == reference.shape and np.allclose(features, reference, rtol=rtol, atol=atol)
+    
+    print(f"\nزمان پیاده‌سازی مرجع: {reference_time:.3f} ثانیه")
+    print(f"زمان خط لوله مشترک: {pipeline_time:.3f} ثانیه")
+    print("\nزمان هر مرحله:")
+    for stage, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        print(f"   {stage:<10} {seconds:8.3f} ثانیه ({seconds / pipeline_time * 100:5.1f}%)")
+    print(f"\nبیشترین اختلاف مطلق: {max_diff:.3e}")
+    print("نتیجه: یکسان ✅" if passed else "نتیجه: ناسازگار ❌")
+    return passed
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="تست تشخیص آهنگ")
-    parser.add_argument("file", help="مسیر فایل صوتی برای تست")
+    parser.add_argument("file", nargs="?", default=None,
+                        help="مسیر فایل صوتی برای تست (در حالت --batch پوشه کلیپ‌ها یا فایل CSV؛ "
+                             "در حالت --check-features اختیاری و پیش‌فرض سیگنال مصنوعی)")
+    parser.add_argument("--engine", choices=["features", "landmark"], default=FINGERPRINT_ENGINE,
+                        help="موتور اثر انگشت")
+    parser.add_argument("--check-features", action="store_true",
+                        help="بررسی هم‌ارزی عددی خط لوله ویژگی‌ها با پیاده‌سازی مرجع و نمایش زمان هر مرحله")
+    parser.add_argument("--seconds", type=float, default=0.5,
+                        help="طول سیگنال مصنوعی --check-features بدون فایل (ثانیه)")
+    parser.add_argument("--batch", action="store_true",
+                        help="ارزیابی دسته‌ای کلیپ‌های برچسب‌دار (دقت top-1/top-K، دقت و بازیابی هر آستانه و زمان هر کلیپ)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="تعداد پردازه‌های استخراج ویژگی در حالت دسته‌ای")
+    parser.add_argument("--top-k", type=int, default=5, help="تعداد نتایج برتر برای دقت top-K")
+    parser.add_argument("--reduction", action="store_true",
+                        help="مقایسه رتبه‌بندی بردار کامل با بردارهای کاهش یافته (PCA با float32، float16 و int8) در حالت دسته‌ای")
+    parser.add_argument("--cascade", type=int, nargs="+", default=None, metavar="N",
+                        help="گزارش فراخوانی و زمان هر مرحله تطبیق دو مرحله‌ای برای اندازه‌های فهرست کوتاه N در حالت دسته‌ای")
+    parser.add_argument("--progressive", type=float, nargs="+", default=None, metavar="MARGIN",
+                        help="گزارش دقت و طول پنجره لازم تحلیل تدریجی (PROGRESSIVE_WINDOWS) برای حداقل فاصله‌های اطمینان MARGIN در حالت دسته‌ای")
+    parser.add_argument("--matcher", type=str, default=MATCHER_ADDRESS,
+                        help="نشانی سرویس تطبیق (unix:/path یا host:port) به جای مقایسه مستقیم با دیتابیس")
+    parser.add_argument("--csv", type=str, default=None, help="مسیر فایل CSV نتیجه هر کلیپ")
+    parser.add_argument("--json", type=str, default=None, help="مسیر فایل JSON گزارش کامل")
     
     args = parser.parse_args()
-    test_audio_recognition(args.file) 
\ No newline at end of file
+    if args.check_features:
+        sys.exit(0 if check_feature_pipeline(args.file, seconds=args.seconds) else 1)
+    if args.file is None:
+        parser.error("مسیر فایل صوتی لازم است")
+    if args.batch:
+        from evaluate import evaluate, print_report, write_csv, write_json
+        report = evaluate(args.file, args.engine, args.workers, args.top_k, reduction=args.reduction,
+                          cascade=args.cascade, progressive=args.progressive)
+        print_report(report)
+        if args.csv:
+            write_csv(report, args.csv)
+            print(f"نتیجه کلیپ‌ها در '{args.csv}' ذخیره شد")
+        if args.json:
+            write_json(report, args.json)
+            print(f"گزارش در '{args.json}' ذخیره شد")
+        sys.exit(0)
+    test_audio_recognition(args.file, args.engine, args.matcher) 
\ No newline at end of file
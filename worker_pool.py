@@ -0,0 +1,299 @@
+"""
+استخر پردازه‌ای محدود برای اجرای کارهای سنگین پردازش صوت بیرون از حلقه asyncio ربات
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """صف کارها پر است و کار جدیدی پذیرفته نمی‌شود"""
+
+
+class OwnerLimitError(QueueFullError):
+    """صاحب کار (کاربر) به حداکثر تعداد کارهای همزمان خود رسیده است"""
+
+
+class JobCancelledError(Exception):
+    """کار پیش از پایان توسط کاربر لغو شد"""
+
+
+class JobTimeoutError(Exception):
+    """زمان اجرای کار از حد مجاز بیشتر شد"""
+
+
+class _Job:
+    """یک کار در صف استخر"""
+
+    __slots__ = ('id', 'owner', 'func', 'args', 'future', 'exec_future', 'timer')
+
+    def __init__(self, job_id, owner, func, args, future):
+        self.id = job_id
+        self.owner = owner
+        self.func = func
+        self.args = args
+        self.future = future
+        self.exec_future = None
+        self.timer = None
+
+
+class WorkerPool:
+    """استخر پردازه‌ای با صف محدود، لغو کار و محدودیت زمانی
+
+    حداکثر `workers` کار همزمان در پردازه‌های جداگانه اجرا می‌شوند و حداکثر
+    `max_queue` کار منتظر می‌مانند؛ کارهای بیشتر با QueueFullError رد می‌شوند.
+    کاری که زمانش تمام شده یا لغو شده تا پایان واقعی اجرایش در پردازه، جای خود
+    را در استخر نگه می‌دارد تا تعداد پردازش‌های همزمان هیچ‌وقت از حد بیشتر نشود.
+
+    کارهای منتظر هر صاحب کار در صف جداگانه‌ای قرار می‌گیرند و به نوبت (round-robin)
+    بین صاحبان کار اجرا می‌شوند، بنابراین کاربری که تعداد زیادی فایل فرستاده
+    کاربران دیگر را پشت سر خود معطل نمی‌کند. هر صاحب کار حداکثر `max_per_owner`
+    کار منتظر یا در حال اجرا دارد.
+    """
+
+    def __init__(self, workers=2, max_queue=20, timeout=None, max_per_owner=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_per_owner = max_per_owner
+        self._executor = None
+        self._queues = OrderedDict()
+        self._waiting_count = 0
+        self._running = set()
+        self._changed = asyncio.Event()
+        self._ids = itertools.count(1)
+
+    @property
+    def queue_depth(self):
+        """تعداد کارهای منتظر در صف"""
+        return self._waiting_count
+
+    def _owner_jobs(self, owner):
+        """تعداد کارهای منتظر و در حال اجرای یک صاحب کار"""
+        queue = self._queues.get(owner)
+        waiting = len(queue) if queue else 0
+        return waiting + sum(1 for job in self._running if job.owner == owner and not job.future.done())
+
+    def _enqueue(self, job):
+        """افزودن کار به انتهای صف صاحب آن"""
+        self._queues.setdefault(job.owner, deque()).append(job)
+        self._waiting_count += 1
+
+    def _remove(self, job):
+        """حذف یک کار منتظر از صف
+
+        Returns:
+            True اگر کار در صف بود
+        """
+        queue = self._queues.get(job.owner)
+        if not queue or job not in queue:
+            return False
+        queue.remove(job)
+        if not queue:
+            del self._queues[job.owner]
+        self._waiting_count -= 1
+        return True
+
+    def _pop_next(self):
+        """برداشتن کار بعدی به نوبت: اولین کار صاحب کار ابتدای چرخه، سپس انتقال او به انتهای چرخه"""
+        owner, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(owner)
+        else:
+            del self._queues[owner]
+        self._waiting_count -= 1
+        return job
+
+    @property
+    def running(self):
+        """تعداد کارهای در حال اجرا"""
+        return len(self._running)
+
+    def start(self):
+        """ایجاد پردازه‌های استخر"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def warm_up(self, func, *args):
+        """اجرای یک کار آماده‌سازی در هر پردازه استخر پیش از دریافت کارهای کاربران
+
+        پردازه‌های spawn فقط هنگام نیاز ساخته می‌شوند؛ ارسال همزمان `workers` کار
+        همه آن‌ها را می‌سازد و هزینه import و کامپایل اولیه را از مسیر اولین
+        درخواست کاربر حذف می‌کند.
+
+        Returns:
+            لیست نتایج تابع در هر پردازه
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.start()
+        return await asyncio.gather(*(loop.run_in_executor(executor, func, *args) for _ in range(self.workers)))
+
+    def shutdown(self):
+        """لغو کارهای منتظر و بستن پردازه‌های استخر"""
+        while self._queues:
+            job = self._pop_next()
+            if not job.future.done():
+                job.future.set_exception(JobCancelledError())
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def position(self, job):
+        """جایگاه کار در صف با توجه به نوبت‌دهی بین صاحبان کار (0 یعنی در حال اجرا یا پایان یافته)"""
+        queue = self._queues.get(job.owner)
+        if not queue or job not in queue:
+            return 0
+        index = queue.index(job)
+        position = 1 + index
+        before = True
+        # در هر دور یک کار از هر صاحب کار به ترتیب چرخه اجرا می‌شود
+        for owner, other in self._queues.items():
+            if owner == job.owner:
+                before = False
+                continue
+            position += min(len(other), index + 1 if before else index)
+        return position
+
+    def _notify(self):
+        """بیدار کردن همه منتظران برای بررسی جایگاهشان در صف"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _dispatch(self):
+        """ارسال کارهای منتظر به پردازه‌های آزاد"""
+        loop = asyncio.get_running_loop()
+
+        while self._queues and len(self._running) < self.workers:
+            executor = self.start()
+            job = self._pop_next()
+            self._running.add(job)
+            # future خود executor (نه پوشش asyncio آن) تا لغو پوشش، جای کار را پیش از پایان
+            # واقعی اجرایش در پردازه آزاد نکند
+            job.exec_future = executor.submit(job.func, *job.args)
+            job.exec_future.add_done_callback(lambda future, job=job: self._finished(loop, job, future))
+            if self.timeout:
+                job.timer = loop.call_later(self.timeout, self._expire, job)
+
+        self._notify()
+
+    def _finished(self, loop, job, exec_future):
+        """انتقال پایان اجرای کار از نخ مدیریت executor به حلقه asyncio"""
+        try:
+            loop.call_soon_threadsafe(self._finish, job, exec_future)
+        except RuntimeError:
+            # حلقه پیش از پایان کار بسته شده است
+            pass
+
+    def _finish(self, job, exec_future):
+        """آزاد کردن جای کار پس از پایان واقعی اجرای آن در پردازه"""
+        self._running.discard(job)
+        if job.timer is not None:
+            job.timer.cancel()
+
+        if not job.future.done():
+            if exec_future.cancelled():
+                job.future.set_exception(JobCancelledError())
+            elif exec_future.exception() is not None:
+                job.future.set_exception(exec_future.exception())
+            else:
+                job.future.set_result(exec_future.result())
+
+        self._dispatch()
+
+    def _expire(self, job):
+        """پایان دادن به انتظار برای کاری که زمانش تمام شده"""
+        if not job.future.done():
+            job.future.set_exception(JobTimeoutError())
+
+    def cancel(self, owner):
+        """لغو همه کارهای یک کاربر
+
+        Args:
+            owner: شناسه صاحب کار (معمولاً شناسه کاربر تلگرام)
+
+        Returns:
+            تعداد کارهای لغو شده
+        """
+        cancelled = 0
+
+        for job in list(self._queues.get(owner, ())):
+            self._remove(job)
+            job.future.set_exception(JobCancelledError())
+            cancelled += 1
+
+        for job in self._running:
+            if job.owner == owner and not job.future.done():
+                # کاری که هنوز به پردازه نرسیده لغو می‌شود؛ کار در حال اجرا تا پایانش
+                # جای خود را نگه می‌دارد و _finish آن را آزاد می‌کند
+                job.exec_future.cancel()
+                job.future.set_exception(JobCancelledError())
+                cancelled += 1
+
+        if cancelled:
+            self._notify()
+        return cancelled
+
+    async def submit(self, func, *args, owner=None, on_position=None):
+        """اجرای یک تابع در استخر پردازه‌ها
+
+        Args:
+            func: تابع قابل pickle برای اجرا در پردازه جداگانه
+            *args: آرگومان‌های تابع
+            owner: شناسه صاحب کار برای لغو
+            on_position: تابع async اختیاری که با تغییر جایگاه کار در صف صدا زده می‌شود
+
+        Returns:
+            خروجی تابع
+
+        Raises:
+            QueueFullError: اگر صف پر باشد
+            OwnerLimitError: اگر صاحب کار به حداکثر کارهای همزمان خود رسیده باشد
+            JobCancelledError: اگر کار لغو شود
+            JobTimeoutError: اگر اجرای کار بیش از حد مجاز طول بکشد
+        """
+        if self._waiting_count >= self.max_queue:
+            raise QueueFullError(self._waiting_count)
+        if self.max_per_owner and owner is not None and self._owner_jobs(owner) >= self.max_per_owner:
+            raise OwnerLimitError(self.max_per_owner)
+
+        loop = asyncio.get_running_loop()
+        job = _Job(next(self._ids), owner, func, args, loop.create_future())
+        self._enqueue(job)
+        self._dispatch()
+
+        last_position = 0
+        try:
+            while not job.future.done():
+                position = self.position(job)
+                if position and position != last_position and on_position is not None:
+                    last_position = position
+                    try:
+                        await on_position(position)
+                    except Exception as e:
+                        # خطای اعلام جایگاه (مثلاً ویرایش پیام) نباید کار را در صف رها کند
+                        logger.warning(f"خطا در اعلام جایگاه کار در صف: {e}")
+                    continue
+
+                changed = asyncio.ensure_future(self._changed.wait())
+                try:
+                    await asyncio.wait({job.future, changed}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    changed.cancel()
+        except BaseException:
+            # درخواست‌دهنده دیگر منتظر نیست؛ کار منتظر از صف خارج می‌شود
+            if self._remove(job):
+                self._notify()
+            raise
+
+        return job.future.result()